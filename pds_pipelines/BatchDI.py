@@ -1,13 +1,13 @@
 #!/usr/bin/env python
 
 import datetime
-import json
 import logging
 import argparse
 import pytz
 from pds_pipelines.FindDI_Ready import archive_expired
 from pds_pipelines.RedisQueue import RedisQueue
 from pds_pipelines.db import db_connect
+from pds_pipelines.ConfigCache import load_pds_info
 from pds_pipelines.config import pds_info, pds_db, pds_log
 
 
@@ -40,7 +40,7 @@ def main():
     logFileHandle.setFormatter(formatter)
     logger.addHandler(logFileHandle)
 
-    PDS_info = json.load(open(pds_info, 'r'))
+    PDS_info = load_pds_info(pds_info)
     reddis_queue = RedisQueue('DI_ReadyQueue')
 
     logger.info("DI Queue: %s", reddis_queue.id_name)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+import os
+import json
+import hashlib
+
+from pds_pipelines.CubeCache import step_signature
+
+
+def cube_fingerprint(path):
+    """
+    Parameters
+    ----------
+    path : str
+        File name, possibly with ISIS cube attributes (e.g. 'a.cub+1')
+
+    Returns
+    -------
+    list
+        [size, mtime] of the file, or None if there is no such file
+    """
+    try:
+        st = os.stat(str(path).split('+')[0])
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime]
+
+
+def recipe_fingerprint(inputfile, recipe):
+    """
+    Parameters
+    ----------
+    inputfile : str
+    recipe : list
+        Recipe.getRecipe() list of {process: parameters}, or the JSON step
+        strings queued for POW and MAP2 jobs
+
+    Returns
+    -------
+    str
+        Digest of the input file and the steps run on it
+    """
+    steps = []
+    for step in recipe:
+        if isinstance(step, dict):
+            steps.append(step_signature(step))
+        else:
+            if isinstance(step, bytes):
+                step = step.decode('utf-8')
+            steps.append(step)
+    data = json.dumps([inputfile, cube_fingerprint(inputfile), steps])
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class Checkpoint(object):
+    """
+    Record of how many recipe steps have been run on an image's intermediate
+    cube, so an attempt that was killed or raised part way through a long
+    recipe can be picked up from the last step that finished.
+
+    After each step the number of steps done and the size and modification
+    time of the intermediate cube are written next to it.  A later attempt
+    resumes only if the recipe and input file are unchanged and the cube
+    still matches, e.g. a step killed while changing the cube in place
+    (spiceinit, footprintinit) invalidates the checkpoint.
+
+    Attributes
+    ----------
+    path : str
+        Checkpoint file
+    fingerprint : str
+        recipe_fingerprint() of the input file and recipe
+    """
+
+    def __init__(self, path, inputfile, recipe):
+        """
+        Parameters
+        ----------
+        path : str
+        inputfile : str
+        recipe : list
+            Fingerprinted before any step changes it
+        """
+        self.path = path
+        self.fingerprint = recipe_fingerprint(inputfile, recipe)
+
+    def resume(self, cube):
+        """
+        Parameters
+        ----------
+        cube : str
+            Intermediate cube the steps were run on
+
+        Returns
+        -------
+        int
+            Number of leading recipe steps cube already has applied, 0 if
+            there is no valid checkpoint
+        """
+        try:
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+        except (IOError, OSError, ValueError):
+            return 0
+
+        if state.get('recipe') != self.fingerprint:
+            return 0
+        if state.get('cube') != cube or state.get('fingerprint') != cube_fingerprint(cube):
+            return 0
+        return state.get('steps', 0)
+
+    def save(self, steps, cube):
+        """
+        Parameters
+        ----------
+        steps : int
+            Number of leading recipe steps done
+        cube : str
+            Intermediate cube they produced
+        """
+        state = {'recipe': self.fingerprint,
+                 'steps': steps,
+                 'cube': cube,
+                 'fingerprint': cube_fingerprint(cube)}
+        tmp = self.path + '.tmp'
+        # A checkpoint never fails a step
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(state, f)
+            # rename is atomic, so a killed job never leaves a partial checkpoint
+            os.rename(tmp, self.path)
+        except (IOError, OSError):
+            pass
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
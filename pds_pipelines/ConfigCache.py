@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+import os
+import json
+import threading
+from collections import OrderedDict
+
+# path -> ((mtime, size), parsed object)
+_cache = {}
+_lock = threading.Lock()
+
+
+def load_json(path, validate=None):
+    """ Parse a JSON configuration file once per process.
+
+    The parsed object is cached and reused until the file's mtime or size
+    changes, so long-lived workers pick up edited recipes without
+    re-parsing the file for every item they process.  Objects are parsed
+    with OrderedDict to keep recipe step order.
+
+    The returned object is shared between callers and must not be modified.
+
+    Parameters
+    ----------
+    path : str
+        Path to the JSON file
+    validate : callable
+        Called as validate(path, obj) after parsing; expected to raise
+        ValueError if the contents are unusable.  Only run on (re)load.
+
+    Returns
+    -------
+    OrderedDict
+        The parsed file
+    """
+    st = os.stat(path)
+    stamp = (st.st_mtime, st.st_size)
+
+    entry = _cache.get(path)
+    if entry is not None and entry[0] == stamp:
+        return entry[1]
+
+    with open(path, 'r') as f:
+        obj = json.load(f, object_pairs_hook=OrderedDict)
+    if validate is not None:
+        validate(path, obj)
+
+    with _lock:
+        _cache[path] = (stamp, obj)
+    return obj
+
+
+def validate_recipe(path, obj):
+    """
+    Parameters
+    ----------
+    path : str
+    obj : dict
+        Parsed recipe file
+
+    Raises
+    ------
+    ValueError
+        If any section's recipe is not a mapping of process -> parameters
+    """
+    if not isinstance(obj, dict):
+        raise ValueError("Recipe {} is not a JSON object".format(path))
+    for section, value in obj.items():
+        if not isinstance(value, dict) or 'recipe' not in value:
+            continue
+        recipe = value['recipe']
+        if not isinstance(recipe, dict):
+            raise ValueError("Recipe {} section '{}' is not a JSON object".format(path, section))
+        for process, params in recipe.items():
+            if not isinstance(params, dict):
+                raise ValueError("Recipe {} section '{}' process '{}' has no parameters".format(
+                    path, section, process))
+
+
+def validate_keyword_def(path, obj):
+    """
+    Parameters
+    ----------
+    path : str
+    obj : dict
+        Parsed Keyword_Definition.json
+
+    Raises
+    ------
+    ValueError
+        If the COMMON section is missing or a keyword lacks type/keyword
+    """
+    try:
+        instruments = obj['instrument']
+        instruments['COMMON']
+    except (KeyError, TypeError):
+        raise ValueError("Keyword definition {} has no instrument/COMMON section".format(path))
+    for archive, keywords in instruments.items():
+        for name, definition in keywords.items():
+            if 'type' not in definition or 'keyword' not in definition:
+                raise ValueError("Keyword definition {} entry {}/{} needs 'type' and 'keyword'".format(
+                    path, archive, name))
+
+
+def validate_pds_info(path, obj):
+    """
+    Parameters
+    ----------
+    path : str
+    obj : dict
+        Parsed PDSinfo.json
+
+    Raises
+    ------
+    ValueError
+        If an archive entry has no path or archiveid
+    """
+    for archive, info in obj.items():
+        if 'path' not in info or 'archiveid' not in info:
+            raise ValueError("PDS info {} archive '{}' needs 'path' and 'archiveid'".format(
+                path, archive))
+
+
+def load_recipe(path):
+    """
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    OrderedDict
+        Cached, validated recipe JSON
+    """
+    return load_json(path, validate_recipe)
+
+
+def load_keyword_def(path):
+    """
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    OrderedDict
+        Cached, validated Keyword_Definition.json
+    """
+    return load_json(path, validate_keyword_def)
+
+
+def load_pds_info(path):
+    """
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    OrderedDict
+        Cached, validated PDSinfo.json
+    """
+    return load_json(path, validate_pds_info)
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+
+import os
+import json
+import errno
+import shutil
+import hashlib
+
+from pds_pipelines import config
+
+# Recipe parameters that name files rather than change the result
+PATH_PARAMS = ('from_', 'from', 'to', 'mosaic')
+
+
+def cacheable(process):
+    """
+    Parameters
+    ----------
+    process : str
+        Name of a recipe step
+
+    Returns
+    -------
+    bool
+        True for the import, SPICE and calibration steps that UPC, thumbnail
+        and browse recipes start with
+    """
+    return (process.endswith('2isis') or process == 'spiceinit'
+            or process.endswith('cal') or process.endswith('evenodd'))
+
+
+def step_signature(step):
+    """
+    Parameters
+    ----------
+    step : dict
+        {process: parameters} entry of a recipe
+
+    Returns
+    -------
+    list
+        [process, sorted parameters], leaving out parameters that only name
+        files, so steps that do the same work compare equal
+    """
+    process, params = list(step.items())[0]
+    return [process, sorted((k, str(v)) for k, v in params.items()
+                            if k not in PATH_PARAMS)]
+
+
+def prefix_length(recipe):
+    """
+    Parameters
+    ----------
+    recipe : list
+        Recipe.getRecipe() list of {process: parameters}
+
+    Returns
+    -------
+    int
+        Number of leading steps whose output can be cached
+    """
+    n = 0
+    for step in recipe:
+        if not cacheable(list(step.keys())[0]):
+            break
+        n += 1
+    return n
+
+
+class CubeCache(object):
+    """
+    Content addressed cache of the cubes produced by the first steps of a
+    recipe (e.g. *2isis and spiceinit), shared by UPC_process,
+    thumbnail_process and browse_process.
+
+    A cube is keyed on the checksum of the input file and the names and
+    parameters (other than file names) of the steps that produced it, so any
+    stages whose recipes start the same way reuse the same cube.  When the
+    cache grows over its quota the least recently used cubes are removed.
+
+    Attributes
+    ----------
+    root : str
+        Cache directory, shared by every process that uses the cache
+    quota : int
+        Maximum size of the cache in bytes
+    """
+
+    # Extension of the cached files
+    suffix = '.cub'
+
+    def __init__(self, root, quota):
+        """
+        Parameters
+        ----------
+        root : str
+        quota : int
+            bytes
+        """
+        self.root = root
+        self.quota = quota
+        try:
+            os.makedirs(root)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    @staticmethod
+    def key(checksum, recipe, n):
+        """
+        Parameters
+        ----------
+        checksum : str
+            Checksum of the input file
+        recipe : list
+            Recipe.getRecipe() list of {process: parameters}
+        n : int
+            Number of leading steps of recipe that produced the cube
+
+        Returns
+        -------
+        str
+        """
+        steps = [step_signature(step) for step in recipe[:n]]
+        data = json.dumps([checksum, steps], sort_keys=True)
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.root, key + self.suffix)
+
+    def lookup(self, key, dest, link=False):
+        """ Copy a cached file to dest.
+
+        Parameters
+        ----------
+        key : str
+        dest : str
+        link : bool
+            Hard link dest to the cached file where possible, for files
+            nothing modifies in place
+
+        Returns
+        -------
+        bool
+            False if key isn't cached
+        """
+        cached = self.path(key)
+        try:
+            if link:
+                if os.path.lexists(dest):
+                    os.remove(dest)
+                try:
+                    os.link(cached, dest)
+                except OSError as e:
+                    # e.g. on another file system
+                    if e.errno == errno.ENOENT:
+                        raise
+                    shutil.copyfile(cached, dest)
+            else:
+                shutil.copyfile(cached, dest)
+            # Mark as recently used
+            os.utime(cached, None)
+        except (IOError, OSError):
+            # Not cached, or evicted while copying
+            return False
+        return True
+
+    def add(self, key, src, link=False):
+        """ Add a file to the cache, then evict to fit the quota.
+
+        Parameters
+        ----------
+        key : str
+        src : str
+        link : bool
+            Hard link the cached file to src where possible
+        """
+        dest = self.path(key)
+        tmp = '{}.{}.tmp'.format(dest, os.getpid())
+        try:
+            if link:
+                try:
+                    os.link(src, tmp)
+                except OSError:
+                    # e.g. on another file system
+                    shutil.copyfile(src, tmp)
+            else:
+                shutil.copyfile(src, tmp)
+            # rename is atomic, so other processes never see a partial file
+            os.rename(tmp, dest)
+        except (IOError, OSError):
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.evict()
+
+    def fetch(self, checksum, recipe, dest):
+        """ Copy the longest cached prefix of recipe to dest.
+
+        The cube is copied rather than linked because later steps (e.g.
+        spiceinit, footprintinit) modify it in place.
+
+        Parameters
+        ----------
+        checksum : str
+        recipe : list
+        dest : str
+
+        Returns
+        -------
+        int
+            Number of leading recipe steps dest already has applied, 0 if
+            nothing was cached
+        """
+        for n in range(prefix_length(recipe), 0, -1):
+            if self.lookup(self.key(checksum, recipe, n), dest):
+                return n
+        return 0
+
+    def store(self, checksum, recipe, n, src):
+        """ Add the cube produced by the first n steps of recipe.
+
+        Parameters
+        ----------
+        checksum : str
+        recipe : list
+        n : int
+        src : str
+            Cube to copy into the cache
+        """
+        self.add(self.key(checksum, recipe, n), src)
+
+    def evict(self):
+        """ Remove least recently used files until the cache fits its quota. """
+        entries = []
+        total = 0
+        for name in os.listdir(self.root):
+            if not name.endswith(self.suffix):
+                continue
+            try:
+                st = os.stat(os.path.join(self.root, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+            total += st.st_size
+
+        entries.sort()
+        for _, size, name in entries:
+            if total <= self.quota:
+                break
+            try:
+                os.remove(os.path.join(self.root, name))
+            except OSError:
+                pass
+            total -= size
+
+
+def get_cube_cache():
+    """
+    Returns
+    -------
+    CubeCache
+        The cache set up by config.cube_cache (directory) and
+        config.cube_cache_quota (bytes), or None if it isn't configured
+    """
+    root = getattr(config, 'cube_cache', None)
+    if not root:
+        return None
+    quota = getattr(config, 'cube_cache_quota', 100 * 1024 ** 3)
+    return CubeCache(root, quota)
@@ -5,7 +5,6 @@ import sys
 import datetime
 import logging
 import hashlib
-import json
 import argparse
 import pytz
 
@@ -15,6 +14,7 @@ from pds_pipelines.RedisLock import RedisLock
 from pds_pipelines.config import pds_db, pds_log, pds_info, lock_obj
 from pds_pipelines.db import db_connect
 from pds_pipelines.models.pds_models import Files
+from pds_pipelines.ConfigCache import load_pds_info
 
 class Args(object):
     def __init__(self):
@@ -33,7 +33,7 @@ class Args(object):
 
 
 def main():
-    PDSinfoDICT = json.load(open(pds_info, 'r'))
+    PDSinfoDICT = load_pds_info(pds_info)
     args = Args()
     args.parse_args()
 
@@ -4,12 +4,12 @@ import sys
 import datetime
 import logging
 import argparse
-import json
 import pytz
 
 from pds_pipelines.RedisQueue import RedisQueue
 from pds_pipelines.db import db_connect
 from pds_pipelines.models.pds_models import Files
+from pds_pipelines.ConfigCache import load_pds_info
 from pds_pipelines.config import pds_info, pds_db, pds_log
 from sqlalchemy import Date, cast
 from sqlalchemy.orm.util import *
@@ -82,7 +82,7 @@ def main():
 
     RQ = RedisQueue('DI_ReadyQueue')
 
-    PDSinfoDICT = json.load(open(pds_info, 'r'))
+    PDSinfoDICT = load_pds_info(pds_info)
     try:
         archiveID = PDSinfoDICT[args.archive]['archiveid']
     except KeyError:
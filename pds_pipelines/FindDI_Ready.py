@@ -3,7 +3,6 @@
 import sys
 import datetime
 import argparse
-import json
 import logging
 import pytz
 
@@ -14,6 +13,7 @@ from sqlalchemy import or_
 
 from pds_pipelines.db import db_connect
 from pds_pipelines.models.pds_models import Files
+from pds_pipelines.ConfigCache import load_pds_info
 from pds_pipelines.config import pds_info, pds_db, pds_log
 
 class Args(object):
@@ -110,7 +110,7 @@ def main():
     args = Args()
     args.parse_args()
 
-    PDSinfoDICT = json.load(open(pds_info, 'r'))
+    PDSinfoDICT = load_pds_info(pds_info)
     try:
         archiveID = PDSinfoDICT[args.archive]['archiveid']
     except KeyError:
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+
+import re
+
+_TOKENS = re.compile(r'\(|\)|[^(),]+')
+
+
+def parse_wkt(wkt):
+    """
+    Parameters
+    ----------
+    wkt : str
+        POLYGON or MULTIPOLYGON well known text
+
+    Returns
+    -------
+    list
+        Polygons, each a list of rings (exterior first), each a list of
+        (x, y) tuples; None if wkt is not a (multi)polygon
+    """
+    if wkt is None:
+        return None
+    wkt = str(wkt).strip()
+    kind, _, body = wkt.partition('(')
+    kind = kind.strip().upper()
+    if kind not in ('POLYGON', 'MULTIPOLYGON'):
+        return None
+
+    stack = [[]]
+    try:
+        for token in _TOKENS.findall('(' + body):
+            if token == '(':
+                stack.append([])
+            elif token == ')':
+                done = stack.pop()
+                stack[-1].append(done)
+            else:
+                coords = token.split()
+                if coords:
+                    stack[-1].append((float(coords[0]), float(coords[1])))
+    except (IndexError, ValueError):
+        return None
+    if len(stack) != 1 or len(stack[0]) != 1:
+        return None
+
+    polygons = stack[0][0]
+    if kind == 'POLYGON':
+        polygons = [polygons]
+    return polygons
+
+
+def format_wkt(polygons, precision=None):
+    """
+    Parameters
+    ----------
+    polygons : list
+        As returned by parse_wkt
+    precision : int
+        Decimal places written, or None for full precision
+
+    Returns
+    -------
+    str
+        MULTIPOLYGON well known text
+    """
+    if precision is None:
+        fmt = repr
+    else:
+        def fmt(v):
+            # '%g' style without exponents, trailing zeros or '-0'
+            text = '{:.{}f}'.format(v, precision).rstrip('0').rstrip('.')
+            return '0' if text == '-0' else text
+    return 'MULTIPOLYGON ({})'.format(', '.join(
+        '({})'.format(', '.join(
+            '({})'.format(', '.join('{} {}'.format(fmt(x), fmt(y)) for x, y in ring))
+            for ring in polygon))
+        for polygon in polygons))
+
+
+def _segment_distance(p, a, b):
+    (px, py), (ax, ay), (bx, by) = p, a, b
+    dx = bx - ax
+    dy = by - ay
+    if dx == 0 and dy == 0:
+        return ((px - ax) ** 2 + (py - ay) ** 2) ** 0.5
+    t = ((px - ax) * dx + (py - ay) * dy) / float(dx * dx + dy * dy)
+    t = max(0.0, min(1.0, t))
+    return ((px - ax - t * dx) ** 2 + (py - ay - t * dy) ** 2) ** 0.5
+
+
+def simplify_ring(ring, tolerance):
+    """ Douglas-Peucker simplification of a closed ring.
+
+    Parameters
+    ----------
+    ring : list
+        (x, y) tuples, first and last the same
+    tolerance : float
+        Largest distance, in coordinate units, a removed vertex may be from
+        the simplified ring
+
+    Returns
+    -------
+    list
+        The simplified ring, or ring itself if simplifying would leave fewer
+        than three distinct vertices
+    """
+    if tolerance <= 0 or len(ring) <= 4:
+        return ring
+
+    keep = [False] * len(ring)
+    keep[0] = keep[-1] = True
+    # The closing point equals the first, so split the ring at the vertex
+    #  furthest from it
+    far = max(range(1, len(ring) - 1),
+              key=lambda i: _segment_distance(ring[i], ring[0], ring[0]))
+    keep[far] = True
+
+    stack = [(0, far), (far, len(ring) - 1)]
+    while stack:
+        first, last = stack.pop()
+        index = None
+        dmax = tolerance
+        for i in range(first + 1, last):
+            d = _segment_distance(ring[i], ring[first], ring[last])
+            if d > dmax:
+                index, dmax = i, d
+        if index is not None:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+
+    simplified = [p for p, k in zip(ring, keep) if k]
+    if len(simplified) < 4:
+        return ring
+    return simplified
+
+
+def snap_ring(ring, precision):
+    """
+    Parameters
+    ----------
+    ring : list
+    precision : int
+        Decimal places kept
+
+    Returns
+    -------
+    list
+        ring rounded to precision, without the repeated vertices rounding
+        can leave, or None if it no longer has three distinct vertices
+    """
+    snapped = []
+    for x, y in ring:
+        point = (round(x, precision), round(y, precision))
+        if not snapped or snapped[-1] != point:
+            snapped.append(point)
+    if len(snapped) < 4:
+        return None
+    return snapped
+
+
+def _clip(ring, seam, keep_left):
+    """ Sutherland-Hodgman clip of a ring to one side of x = seam. """
+    def inside(p):
+        return p[0] <= seam if keep_left else p[0] >= seam
+
+    clipped = []
+    for a, b in zip(ring, ring[1:]):
+        if inside(a):
+            clipped.append(a)
+        if inside(a) != inside(b):
+            t = (seam - a[0]) / (b[0] - a[0])
+            clipped.append((seam, a[1] + t * (b[1] - a[1])))
+    if len(clipped) < 3:
+        return None
+    clipped.append(clipped[0])
+    return clipped
+
+
+def _crosses(a, b, west, east):
+    """ True if the edge a-b jumps across the longitude seam.
+
+    Edges lying along the seam (both ends on west or east) and edges
+    touching a pole, where longitude means nothing, are not crossings.
+    """
+    if abs(a[0] - b[0]) <= 180:
+        return False
+    if a[0] in (west, east) and b[0] in (west, east):
+        return False
+    return abs(a[1]) != 90 and abs(b[1]) != 90
+
+
+def split_antimeridian(polygons):
+    """ Split polygons whose edges jump across the longitude seam.
+
+    A ring is taken to cross the seam where consecutive vertices are more
+    than 180 degrees of longitude apart, other than along the seam itself
+    or at a pole.  The seam is 360/0 if any longitude is over 180,
+    otherwise 180/-180.
+
+    Parameters
+    ----------
+    polygons : list
+        As returned by parse_wkt, x is longitude
+
+    Returns
+    -------
+    list
+        Polygons, with each crossing polygon replaced by its part on each
+        side of the seam
+    """
+    east = 360.0 if any(x > 180 for polygon in polygons
+                        for ring in polygon for x, _ in ring) else 180.0
+    west = east - 360.0
+
+    out = []
+    for polygon in polygons:
+        if not any(_crosses(a, b, west, east) for ring in polygon
+                   for a, b in zip(ring, ring[1:])):
+            out.append(polygon)
+            continue
+
+        # Make each ring's longitudes continuous, then cut at the seam
+        #  they straddle
+        unwrapped = []
+        for ring in polygon:
+            shift = 0.0
+            points = [ring[0]]
+            for a, b in zip(ring, ring[1:]):
+                if _crosses(a, b, west, east):
+                    shift += 360.0 if a[0] > b[0] else -360.0
+                points.append((b[0] + shift, b[1]))
+            unwrapped.append(points)
+        xs = [x for ring in unwrapped for x, _ in ring]
+        seam = east if min(xs) < east < max(xs) else west
+
+        for keep_left, offset in ((True, east - seam), (False, west - seam)):
+            rings = [_clip(ring, seam, keep_left) for ring in unwrapped]
+            if rings[0] is None:
+                continue
+            out.append([[(x + offset, y) for x, y in ring]
+                        for ring in rings if ring is not None])
+    return out
+
+
+def bounding_box(polygons):
+    """
+    Parameters
+    ----------
+    polygons : list
+
+    Returns
+    -------
+    str
+        POLYGON well known text of the envelope of polygons
+    """
+    xs = [x for polygon in polygons for ring in polygon for x, _ in ring]
+    ys = [y for polygon in polygons for ring in polygon for _, y in ring]
+    minx, maxx, miny, maxy = min(xs), max(xs), min(ys), max(ys)
+    return 'POLYGON (({0} {2}, {1} {2}, {1} {3}, {0} {3}, {0} {2}))'.format(
+        repr(minx), repr(maxx), repr(miny), repr(maxy))
+
+
+def clean_footprint(wkt, tolerance=0, precision=None, split=False):
+    """ Prepare a caminfo GisFootprint for storage.
+
+    Parameters
+    ----------
+    wkt : str
+        GisFootprint
+    tolerance : float
+        Douglas-Peucker tolerance in degrees, 0 to keep every vertex
+    precision : int
+        Decimal places kept, None for full precision
+    split : bool
+        Split polygons that cross the longitude seam
+
+    Returns
+    -------
+    footprint : str
+        The processed footprint, or wkt unchanged if it isn't a
+        (multi)polygon
+    bbox : str
+        Its bounding box, or None if wkt isn't a (multi)polygon or was split
+        at the seam, where one envelope would span every longitude
+    """
+    polygons = parse_wkt(wkt)
+    if not polygons:
+        return wkt, None
+
+    was_split = False
+    if split:
+        parts = split_antimeridian(polygons)
+        was_split = len(parts) != len(polygons)
+        polygons = parts
+
+    cleaned = []
+    for polygon in polygons:
+        rings = []
+        for i, ring in enumerate(polygon):
+            ring = simplify_ring(ring, tolerance)
+            if precision is not None:
+                ring = snap_ring(ring, precision)
+            if ring is None:
+                # Collapsed when snapped; a polygon without its exterior is dropped
+                if i == 0:
+                    break
+                continue
+            rings.append(ring)
+        if rings:
+            cleaned.append(rings)
+    if not cleaned:
+        return wkt, None
+
+    bbox = None if was_split else bounding_box(cleaned)
+    return format_wkt(cleaned, precision), bbox
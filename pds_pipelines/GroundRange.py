@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+
+from sqlalchemy import func
+
+from pds_pipelines import config
+from pds_pipelines.Footprint import parse_wkt
+from pds_pipelines.models.upc_models import DataFiles, Keywords, MetaGeometry
+
+# Error recorded for a file whose ground range misses the job's extent
+OUTSIDE_EXTENT = "Error Ground Range Outside Extent Range"
+
+# Degrees a footprint's range is widened by, as footprints are sampled more
+#  coarsely than camrange
+DEFAULT_MARGIN = 0.01
+
+# Most edr_sources looked up per query
+QUERY_BATCH = 1000
+
+
+def edr_source(inputfile):
+    """
+    Parameters
+    ----------
+    inputfile : str
+        Archive image, optionally with bands, e.g. 'x.IMG+1,2,3'
+
+    Returns
+    -------
+    str
+        The image's DataFiles.edr_source in UPC
+    """
+    return inputfile.split('+')[0].replace(
+        '/pds_san/PDS_Archive/',
+        'https://pdsimage.wr.ugs.gov/Missions/')
+
+
+def prefilter(spec):
+    """
+    Parameters
+    ----------
+    spec : JobSpec
+
+    Returns
+    -------
+    bool
+        True if the job's files should be checked against its extent before
+        they are queued, see job_ranges; set config.ground_range_prefilter
+        to enable
+    """
+    extent = (spec.min_lat, spec.max_lat, spec.min_lon, spec.max_lon)
+    return bool(getattr(config, 'ground_range_prefilter', False) and
+                spec.process == 'POW' and spec.range_type in ('smart', 'fill') and
+                None not in extent)
+
+
+def footprint_range(polygons, domain=360):
+    """
+    Parameters
+    ----------
+    polygons : list
+        Footprint, as returned by Footprint.parse_wkt
+    domain : int
+        Longitude domain the range is given in, 180 or 360
+
+    Returns
+    -------
+    tuple
+        (minlat, maxlat, minlon, maxlon), or None if the footprint spans
+        more than 180 degrees of longitude (e.g. it crosses the 0/360 seam,
+        split or not) or crosses the seam of domain
+    """
+    xs = [x for polygon in polygons for ring in polygon for x, _ in ring]
+    ys = [y for polygon in polygons for ring in polygon for _, y in ring]
+    minlon, maxlon = min(xs), max(xs)
+    if maxlon - minlon > 180:
+        return None
+
+    east = 180.0 if domain == 180 else 360.0
+    west = east - 360.0
+    if minlon >= east:
+        minlon, maxlon = minlon - 360, maxlon - 360
+    elif maxlon <= west:
+        minlon, maxlon = minlon + 360, maxlon + 360
+    if minlon < west or maxlon > east:
+        return None
+    return (min(ys), max(ys), minlon, maxlon)
+
+
+def footprint_ranges(session, inputfiles, margin=DEFAULT_MARGIN, domain=360):
+    """ Ground ranges of archive images from their footprints in UPC.
+
+    Parameters
+    ----------
+    session : Session
+        Session connected to the UPC database
+    inputfiles : list
+    margin : float
+    domain : int
+        Longitude domain of the ranges, 180 or 360
+
+    Returns
+    -------
+    dict
+        inputfile -> (minlat, maxlat, minlon, maxlon), for the images with
+        a footprint footprint_range can use
+    """
+    footprint_tid = session.query(Keywords.typeid).filter(
+        Keywords.typename == 'isisfootprint').scalar()
+    sources = {}
+    for inputfile in inputfiles:
+        sources.setdefault(edr_source(inputfile), []).append(inputfile)
+
+    ranges = {}
+    # Images with a footprint whose range can't be used, left to camrange
+    unusable = set()
+    names = list(sources)
+    for start in range(0, len(names), QUERY_BATCH):
+        rows = session.query(DataFiles.edr_source,
+                             func.ST_AsText(MetaGeometry.value)).join(
+            MetaGeometry, MetaGeometry.upcid == DataFiles.upcid).filter(
+            MetaGeometry.typeid == footprint_tid,
+            DataFiles.edr_source.in_(names[start:start + QUERY_BATCH]))
+        for source, wkt in rows:
+            polygons = parse_wkt(wkt)
+            if not polygons:
+                continue
+            ground = footprint_range(polygons, domain)
+            if ground is None:
+                unusable.update(sources[source])
+                continue
+            ground = (ground[0] - margin, ground[1] + margin,
+                      ground[2] - margin, ground[3] + margin)
+            for inputfile in sources[source]:
+                if inputfile in ranges:
+                    # Several UPC rows, e.g. from reprocessing; cover them all
+                    old = ranges[inputfile]
+                    ground = (min(old[0], ground[0]), max(old[1], ground[1]),
+                              min(old[2], ground[2]), max(old[3], ground[3]))
+                ranges[inputfile] = ground
+    for inputfile in unusable:
+        ranges.pop(inputfile, None)
+    return ranges
+
+
+def longitude_domain(spec):
+    """
+    Parameters
+    ----------
+    spec : JobSpec
+
+    Returns
+    -------
+    int
+        The job's longitude domain, 180 or 360; if the job doesn't give
+        one, 180 when its extent has negative longitudes
+    """
+    if spec.longitude_domain in (180, 360):
+        return spec.longitude_domain
+    return 180 if spec.min_lon < 0 else 360
+
+
+def job_range(ground, spec):
+    """ The range POWprocess gives cam2map for an image, as it would from
+    camrange.
+
+    Parameters
+    ----------
+    ground : tuple
+        (minlat, maxlat, minlon, maxlon) of the image
+    spec : JobSpec
+        A job with a 'smart' or 'fill' range
+
+    Returns
+    -------
+    tuple
+        (minlat, maxlat, minlon, maxlon), the job's extent cut to the image
+        for 'smart' ranges; None if the image is outside the job's extent
+    """
+    minlat, maxlat, minlon, maxlon = ground
+    if maxlat < spec.min_lat or minlat > spec.max_lat or \
+       maxlon < spec.min_lon or minlon > spec.max_lon:
+        return None
+    if spec.range_type == 'smart':
+        return (max(minlat, spec.min_lat), min(maxlat, spec.max_lat),
+                max(minlon, spec.min_lon), min(maxlon, spec.max_lon))
+    return (spec.min_lat, spec.max_lat, spec.min_lon, spec.max_lon)
+
+
+def job_ranges(session, inputfiles, spec):
+    """
+    Parameters
+    ----------
+    session : Session
+        Session connected to the UPC database
+    inputfiles : list
+    spec : JobSpec
+
+    Returns
+    -------
+    dict
+        inputfile -> job_range, for the images with a usable footprint in
+        UPC, in the job's longitude domain; other images are left for
+        POWprocess to check with camrange
+    """
+    margin = float(getattr(config, 'ground_range_margin', DEFAULT_MARGIN))
+    ranges = footprint_ranges(session, inputfiles, margin, longitude_domain(spec))
+    return {inputfile: job_range(ground, spec) for inputfile, ground in ranges.items()}
@@ -1,6 +1,11 @@
 #!/usr/bin/env python
 
+import os
 import subprocess
+from multiprocessing.pool import ThreadPool
+
+from pds_pipelines import config
+from pds_pipelines.resources import allocated_cpus, pipeline_slots
 
 
 class HPCjob(object):
@@ -20,8 +25,17 @@ class HPCjob(object):
     path : str
     partition : str
     memory : str
+    executor : SlurmExecutor or LocalExecutor
+        Runs the job, see get_executor
     """
-    def __init__(self):
+    def __init__(self, executor=None):
+        """
+        Parameters
+        ----------
+        executor : SlurmExecutor or LocalExecutor
+            Defaults to get_executor()
+        """
+        self.executor = executor or get_executor()
 
         self.jobstring = "#!/bin/bash"
         self.name = ''
@@ -34,6 +48,14 @@ class HPCjob(object):
         self.path = ''
         self.partition = ''
         self.memory = ''
+        # The settings as given, for executors other than slurm
+        self.job_name = ''
+        self.array_size = 1
+        self.array_limit = None
+        self.stdout_path = ''
+        self.stderr_path = ''
+        self.memory_mb = None
+        self.extra_path = ''
 
     def setJobName(self, name):
         """
@@ -47,6 +69,7 @@ class HPCjob(object):
         """
 
         self.name = "#SBATCH -J " + name
+        self.job_name = name
 
     def setJobArray(self, number):
         """
@@ -60,6 +83,10 @@ class HPCjob(object):
         number : int
         """
         self.array = "#SBATCH --array=1-" + str(number)
+        # e.g. '100' or '100%10' (at most 10 at once)
+        size, _, limit = str(number).partition('%')
+        self.array_size = int(size)
+        self.array_limit = int(limit) if limit else None
 
     def setCommand(self, cmd):
         """
@@ -81,6 +108,7 @@ class HPCjob(object):
         Ofile : str
         """
         self.Sout = "#SBATCH --output=" + Ofile
+        self.stdout_path = Ofile
 
     def setStdError(self, Efile):
         """
@@ -93,6 +121,7 @@ class HPCjob(object):
         Efile : str
         """
         self.Serror = "#SBATCH --error=" + Efile
+        self.stderr_path = Efile
 
     def setWallClock(self, time):
         """
@@ -119,6 +148,7 @@ class HPCjob(object):
 
         """
         self.memory = "#SBATCH --mem-per-cpu=" + item
+        self.memory_mb = int(item)
 
     def setModule(self, item):
         """
@@ -135,6 +165,7 @@ class HPCjob(object):
         addpath : str
         """
         self.path = "export PATH=" + addpath + ":$PATH"
+        self.extra_path = addpath
 
     def MakeJobFile(self, filename):
         """
@@ -181,9 +212,187 @@ class HPCjob(object):
         int
             result
         """
-        SB = "sbatch " + str(self.sbatchfile)
+        return self.executor.run(self)
+
+
+class SlurmExecutor(object):
+    """ Submits jobs to slurm with sbatch. """
+
+    def run(self, job):
+        """
+        Parameters
+        ----------
+        job : HPCjob
+            With its job file made, see HPCjob.MakeJobFile
+
+        Returns
+        -------
+        int
+            sbatch's exit status
+        """
+        SB = "sbatch " + str(job.sbatchfile)
         print(SB)
         print("Running sbatch")
         result = subprocess.call(SB, shell=True)
 
         return result
+
+
+class LocalExecutor(object):
+    """
+    Runs a job's array tasks as processes on this machine, as many at once
+    as its cores and memory allow, e.g. to run small jobs without waiting
+    in the slurm queue.  run() returns when every task has finished, or,
+    if detach is set, at once, leaving a background process to run them as
+    sbatch would.
+
+    Each task sees the SLURM_ARRAY_* variables slurm would set, and its
+    output goes to the job's stdout/stderr paths with the %A, %a, %j and
+    %x patterns filled in.
+
+    Attributes
+    ----------
+    workers : int
+        Most tasks run at once, None for as many as fit
+    detach : bool
+        Run the tasks in a background process
+    """
+
+    def __init__(self, workers=None, detach=False):
+        """
+        Parameters
+        ----------
+        workers : int
+        detach : bool
+        """
+        self.workers = workers
+        self.detach = detach
+
+    def slots(self, job):
+        """
+        Parameters
+        ----------
+        job : HPCjob
+
+        Returns
+        -------
+        int
+            Number of the job's tasks to run at once
+        """
+        if job.memory_mb:
+            slots = pipeline_slots(job.memory_mb)
+        else:
+            slots = allocated_cpus()
+        for limit in (self.workers, job.array_limit):
+            if limit:
+                slots = min(slots, limit)
+        return max(min(slots, job.array_size), 1)
+
+    @staticmethod
+    def log_path(pattern, job, job_id, task):
+        return (pattern.replace('%A', job_id)
+                       .replace('%a', str(task))
+                       .replace('%j', '{}_{}'.format(job_id, task))
+                       .replace('%x', job.job_name))
+
+    def run_task(self, job, job_id, task):
+        """
+        Parameters
+        ----------
+        job : HPCjob
+        job_id : str
+        task : int
+            1 based array index
+
+        Returns
+        -------
+        int
+            The task's exit status
+        """
+        env = dict(os.environ)
+        env['SLURM_ARRAY_JOB_ID'] = job_id
+        env['SLURM_ARRAY_TASK_ID'] = str(task)
+        env['SLURM_ARRAY_TASK_COUNT'] = str(job.array_size)
+        if job.extra_path:
+            env['PATH'] = job.extra_path + ':' + env.get('PATH', '')
+
+        files = []
+        try:
+            for pattern in (job.stdout_path, job.stderr_path):
+                if pattern:
+                    files.append(open(self.log_path(pattern, job, job_id, task), 'w'))
+                else:
+                    files.append(None)
+            return subprocess.call(job.cmd, shell=True, env=env,
+                                   stdout=files[0], stderr=files[1])
+        finally:
+            for f in files:
+                if f is not None:
+                    f.close()
+
+    def run(self, job):
+        """
+        Parameters
+        ----------
+        job : HPCjob
+
+        Returns
+        -------
+        int
+            0 if every task succeeded, otherwise the first non-zero exit
+            status; 0 once the background process is started if detached
+        """
+        if self.detach:
+            if os.fork():
+                return 0
+            # The child outlives the submitting process, as a slurm job would
+            status = 1
+            try:
+                os.setsid()
+                status = self.run_tasks(job)
+            finally:
+                os._exit(status)
+        return self.run_tasks(job)
+
+    def run_tasks(self, job):
+        """
+        Parameters
+        ----------
+        job : HPCjob
+
+        Returns
+        -------
+        int
+            0 if every task succeeded, otherwise the first non-zero exit
+            status
+        """
+        job_id = 'local{}'.format(os.getpid())
+        tasks = list(range(1, job.array_size + 1))
+        pool = ThreadPool(self.slots(job))
+        try:
+            results = pool.map(lambda task: self.run_task(job, job_id, task), tasks)
+        finally:
+            pool.close()
+            pool.join()
+        return next((result for result in results if result != 0), 0)
+
+
+def get_executor(name=None, detach=False):
+    """
+    Parameters
+    ----------
+    name : str
+        'slurm' or 'local'; defaults to config.job_executor, or 'slurm'
+    detach : bool
+        Have a local executor run jobs in the background, see LocalExecutor
+
+    Returns
+    -------
+    SlurmExecutor or LocalExecutor
+    """
+    name = name or getattr(config, 'job_executor', 'slurm')
+    if name == 'slurm':
+        return SlurmExecutor()
+    elif name == 'local':
+        return LocalExecutor(getattr(config, 'local_executor_workers', None), detach)
+    raise ValueError('Unknown job executor {}'.format(name))
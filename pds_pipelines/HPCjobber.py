@@ -9,7 +9,7 @@ import pytz
 import argparse
 import logging
 
-from pds_pipelines.HPCjob import *
+from pds_pipelines.HPCjob import HPCjob, get_executor
 
 import pdb
 from pds_pipelines.jobconfig import jobconfig, log_format
@@ -35,10 +35,15 @@ class Args:
         parser.add_argument('--jobarray', '-j', dest="jobarray",
                             help="Enter string to set job array size")
 
+        parser.add_argument('--executor', '-e', dest="executor",
+                            choices=['slurm', 'local'],
+                            help="Run with slurm or on this machine; defaults to config.job_executor")
+
         args = parser.parse_args()
 
         self.process = args.process
         self.jobarray = args.jobarray
+        self.executor = args.executor
 
 
 def main():
@@ -62,7 +67,7 @@ def main():
 
     # Parametrize the HPC job using the configuration file
     date = datetime.datetime.now(pytz.utc).strftime("%Y%m%d%M")
-    jobOBJ = HPCjob()
+    jobOBJ = HPCjob(get_executor(args.executor))
     jobOBJ.setJobName(job['name'])
     jobOBJ.setStdOut(job['stdout'])
     jobOBJ.setStdError(job['stderr'])
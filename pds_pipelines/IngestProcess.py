@@ -3,7 +3,6 @@ import os
 import sys
 import datetime
 import logging
-import json
 import argparse
 import hashlib
 import pytz
@@ -14,6 +13,7 @@ from pds_pipelines.RedisLock import RedisLock
 from pds_pipelines.db import db_connect
 from pds_pipelines.config import pds_info, pds_log, pds_db, archive_base, web_base, lock_obj
 from pds_pipelines.models.pds_models import Files
+from pds_pipelines.ConfigCache import load_pds_info
 
 
 class Args(object):
@@ -27,6 +27,11 @@ class Args(object):
         parser.add_argument('--override', dest='override', action='store_true')
         parser.set_defaults(override=False)
 
+        parser.add_argument('--derived', dest='derived', action='store_true',
+                            help="Queue files for the fused derived products "
+                                 "process instead of UPC, thumbnail and browse")
+        parser.set_defaults(derived=False)
+
         parser.add_argument('--log', '-l', dest="log_level",
                             choice=['DEBUG', 'INFO',
                                     'WARNING', 'ERROR', 'CRITICAL'],
@@ -35,6 +40,109 @@ class Args(object):
         args = parser.parse_args()
         self.log_level = args.log_level
         self.override = args.override
+        self.derived = args.derived
+
+
+def get_checksum(inputfile, chunk_size=4096):
+    """ Calculate the md5 checksum of a file, reading it in chunks.
+
+    Parameters
+    ----------
+    inputfile : str
+        Path to the file being hashed.
+    chunk_size : int
+        Number of bytes read per iteration.
+
+    Returns
+    -------
+    str
+        The hex digest of the file contents.
+    """
+    f_hash = hashlib.md5()
+    with open(inputfile, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            f_hash.update(chunk)
+    return f_hash.hexdigest()
+
+
+def needs_ingest(QOBJ, filechecksum, override):
+    """ Decide whether a file has to be (re)written to the files table.
+
+    Parameters
+    ----------
+    QOBJ : Files or None
+        The existing database entry for the file, if any.
+    filechecksum : str
+        Checksum of the file currently on disk.
+    override : bool
+        Whether existing entries should be ingested regardless.
+
+    Returns
+    -------
+    bool
+        True if the file is new, has changed, or override is set.
+    """
+    return QOBJ is None or filechecksum != QOBJ.checksum or override
+
+
+def make_ingest_entry(QOBJ, inputfile, archive, filechecksum, PDSinfoDICT,
+                      override, filesize=None):
+    """ Build the files table entry for a file that needs ingesting.
+
+    Parameters
+    ----------
+    QOBJ : Files or None
+        The existing database entry for the file, if any.
+    inputfile : str
+        Full path of the file in the archive.
+    archive : str
+        Archive name, used as the key into PDSinfoDICT.
+    filechecksum : str
+        Checksum of the file on disk.
+    PDSinfoDICT : dict
+        Parsed PDSinfo.json.
+    override : bool
+        If True, an existing entry is reused as-is.
+    filesize : int
+        Size of the file in bytes.  Read from disk if not supplied.
+
+    Returns
+    -------
+    ingest_entry : Files
+        The entry to merge into the session.
+    upcflag : bool
+        True if the file should be sent on to the UPC pipelines.
+    """
+    date = datetime.datetime.now(
+        pytz.utc).strftime("%Y-%m-%d %H:%M:%S")
+    subfile = inputfile.replace(PDSinfoDICT[archive]['path'], '')
+    fileURL = inputfile.replace(archive_base, web_base)
+
+    # If all upc requirements are in 'inputfile,' flag for upc
+    upcflag = all(x in inputfile for x in PDSinfoDICT[archive]['upc_reqs'])
+    if filesize is None:
+        filesize = os.path.getsize(inputfile)
+
+    # If we found an existing file and want to overwrite the data
+    if QOBJ is not None and override:
+        ingest_entry = QOBJ
+    # If the file was not found, create a new entry
+    else:
+        ingest_entry = Files()
+        ingest_entry.archiveid = PDSinfoDICT[archive]['archiveid']
+        ingest_entry.filename = subfile
+        ingest_entry.entry_date = date
+        ingest_entry.checksum = filechecksum
+        ingest_entry.upc_required = upcflag
+        ingest_entry.validation_required = True
+        ingest_entry.header_only = False
+        ingest_entry.release_date = date
+        ingest_entry.file_url = fileURL
+        ingest_entry.file_size = filesize
+        ingest_entry.di_pass = True
+        ingest_entry.di_date = date
+
+    return ingest_entry, upcflag
 
 
 def main():
@@ -53,20 +161,23 @@ def main():
     logger.addHandler(logFileHandle)
 
     logger.info("Starting Ingest Process")
-    PDSinfoDICT = json.load(open(pds_info, 'r'))
+    PDSinfoDICT = load_pds_info(pds_info)
 
     RQ_main = RedisQueue('Ingest_ReadyQueue')
     RQ_lock = RedisLock(lock_obj)
     RQ_lock.add({RQ_main.id_name: '1'})
     RQ_work = RedisQueue('Ingest_WorkQueue')
 
-    RQ_upc = RedisQueue('UPC_ReadyQueue')
-    RQ_thumb = RedisQueue('Thumbnail_ReadyQueue')
-    RQ_browse = RedisQueue('Browse_ReadyQueue')
+    # Queues for the products made from each UPC eligible file
+    if args.derived:
+        RQ_products = [RedisQueue('Derived_ReadyQueue')]
+    else:
+        RQ_products = [RedisQueue('UPC_ReadyQueue'),
+                       RedisQueue('Thumbnail_ReadyQueue'),
+                       RedisQueue('Browse_ReadyQueue')]
 
-    logger.info("UPC Queue: %s", RQ_upc.id_name)
-    logger.info("Thumbnail Queue: %s", RQ_thumb.id_name)
-    logger.info("Browse Queue: %s", RQ_browse.id_name)
+    for RQ_product in RQ_products:
+        logger.info("Product Queue: %s", RQ_product.id_name)
 
     try:
         session, engine = db_connect(pds_db)
@@ -85,55 +196,21 @@ def main():
         RQ_work.QueueAdd(inputfile)
 
         subfile = inputfile.replace(PDSinfoDICT[archive]['path'], '')
-        # Calculate checksum in chunks of 4096
-        f_hash = hashlib.md5()
-        with open(inputfile, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                f_hash.update(chunk)
-        filechecksum = f_hash.hexdigest()
+        filechecksum = get_checksum(inputfile)
 
         QOBJ = session.query(Files).filter_by(filename=subfile).first()
 
-        runflag = False
-        if QOBJ is None or filechecksum != QOBJ.checksum:
-            runflag = True
-
-        if runflag or override:
-            date = datetime.datetime.now(
-                pytz.utc).strftime("%Y-%m-%d %H:%M:%S")
-            fileURL = inputfile.replace(archive_base, web_base)
-
-            # If all upc requirements are in 'inputfile,' flag for upc
-            upcflag = all(x in inputfile for x in PDSinfoDICT[archive]['upc_reqs'])
-            filesize = os.path.getsize(inputfile)
-
+        if needs_ingest(QOBJ, filechecksum, override):
             try:
-                # If we found an existing file and want to overwrite the data
-                if QOBJ is not None and override:
-                    ingest_entry = QOBJ
-                # If the file was not found, create a new entry
-                else:
-                    ingest_entry = Files()
-                    ingest_entry.archiveid = PDSinfoDICT[archive]['archiveid']
-                    ingest_entry.filename = subfile
-                    ingest_entry.entry_date = date
-                    ingest_entry.checksum = filechecksum
-                    ingest_entry.upc_required = upcflag
-                    ingest_entry.validation_required = True
-                    ingest_entry.header_only = False
-                    ingest_entry.release_date = date
-                    ingest_entry.file_url = fileURL
-                    ingest_entry.file_size = filesize
-                    ingest_entry.di_pass = True
-                    ingest_entry.di_date = date
-
-                session.merge(ingest_entry)
+                ingest_entry, upcflag = make_ingest_entry(QOBJ, inputfile, archive,
+                                                          filechecksum, PDSinfoDICT,
+                                                          override)
+                ingest_entry = session.merge(ingest_entry)
                 session.flush()
 
                 if upcflag:
-                    RQ_upc.QueueAdd((inputfile, ingest_entry.fileid, archive))
-                    RQ_thumb.QueueAdd((inputfile, ingest_entry.fileid, archive))
-                    RQ_browse.QueueAdd((inputfile, ingest_entry.fileid, archive))
+                    for RQ_product in RQ_products:
+                        RQ_product.QueueAdd((inputfile, ingest_entry.fileid, archive))
                     #RQ_pilotB.QueueAdd((inputfile,ingest_entry.fileid, archive))
 
                 RQ_work.QueueRemove(inputfile)
@@ -143,7 +220,7 @@ def main():
             except Exception as e:
                 logger.error("Error During File Insert %s : %s", str(subfile), str(e))
 
-        elif not runflag and not override:
+        else:
             RQ_work.QueueRemove(inputfile)
             logger.warn("Not running ingest: file %s already present"
                         " in database and no override flag supplied", inputfile)
@@ -2,11 +2,11 @@
 
 import os
 import sys
-import json
 import logging
 import argparse
 
 from pds_pipelines.RedisQueue import RedisQueue
+from pds_pipelines.ConfigCache import load_pds_info
 from pds_pipelines.config import pds_info, pds_log
 
 class Args(object):
@@ -68,7 +68,7 @@ def main():
 
     print("Log File: {}Ingest.log".format(pds_log))
 
-    PDSinfoDICT = json.load(open(pds_info, 'r'))
+    PDSinfoDICT = load_pds_info(pds_info)
     try:
         archivepath = PDSinfoDICT[args.archive]['path'][:-1]
     except KeyError:
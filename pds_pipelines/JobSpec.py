@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+from collections import namedtuple
+
+import lxml.etree as ET
+
+# A file of a job and the bands requested from it, e.g.
+#  JobFile('/pds_san/.../x.cub', ('1', '2', '3'))
+JobFile = namedtuple('JobFile', ['path', 'bands'])
+
+# A POW or MAP2 job, read from its XML once.  Text fields are None when the
+#  job doesn't give them; numbers are floats (longitude_domain an int).
+JobSpec = namedtuple('JobSpec', [
+    'process',              # 'POW' or 'MAP2'
+    'instrument',
+    'url_files',            # JobFiles of the ImageUrl entries (POW)
+    'map_files',            # JobFiles of the ImageList entries (MAP2)
+    'target_name',
+    'equatorial_radius',
+    'polar_radius',
+    'latitude_type',        # 'Planetocentric' or 'Planetographic'
+    'longitude_direction',  # 'PositiveEast' or 'PositiveWest'
+    'longitude_domain',
+    'projection',
+    'center_longitude',
+    'center_latitude',
+    'first_parallel',
+    'second_parallel',
+    'output_geometry',      # True if the job has an OutputGeometry element
+    'range_type',
+    'min_lat',
+    'max_lat',
+    'min_lon',
+    'max_lon',
+    'resolution',
+    'grid_interval',
+    'out_bit',              # 'input' if the job doesn't set one
+    'out_format',
+    'stretch_type',         # 'StretchPercent', 'HistogramEqualization',
+                            #  'GaussStretch', 'SigmaStretch' or None
+    'stretch_min',
+    'stretch_max',
+    'gauss_sigma',
+    'sigma_variance',
+])
+
+PROCESSES = ('POW', 'MAP2')
+
+LATITUDE_TYPES = {'planetocentric': 'Planetocentric',
+                  'planetographic': 'Planetographic'}
+LONGITUDE_DIRECTIONS = {'POSITIVEEAST': 'PositiveEast',
+                        'POSITIVEWEST': 'PositiveWest'}
+STRETCHES = ('StretchPercent', 'HistogramEqualization', 'GaussStretch', 'SigmaStretch')
+
+
+def _text(root, parent, path):
+    """ Text of the first path under the first parent element, or None. """
+    element = root.find('.//' + parent)
+    if element is None:
+        return None
+    found = element.find(path)
+    if found is None:
+        return None
+    return found.text
+
+
+def _number(root, parent, path, kind=float):
+    text = _text(root, parent, path)
+    if text is None:
+        return None
+    try:
+        return kind(text)
+    except ValueError:
+        raise ValueError('{} {} is not a number: {!r}'.format(parent, path, text))
+
+
+def _choice(root, parent, path, choices):
+    text = _text(root, parent, path)
+    if text is None:
+        return None
+    if text not in choices:
+        raise ValueError('Unknown {} {}'.format(path.lstrip('./'), text))
+    return choices[text]
+
+
+def _files(root, entry, path, band):
+    return tuple(JobFile(element.find(path).text,
+                         tuple(b.text for b in element.findall('.//' + band)))
+                 for element in root.iter(entry))
+
+
+def _stretch_type(root):
+    process = root.find('.//Process')
+    if process is None or process.find('.//stretch') is None:
+        return None
+    for name in STRETCHES:
+        if process.find('.//' + name) is not None:
+            return name
+    return None
+
+
+def parse_job(xml):
+    """
+    Parameters
+    ----------
+    xml : str
+        POW or MAP2 job XML, as stored in the jobs table
+
+    Returns
+    -------
+    JobSpec
+
+    Raises
+    ------
+    ValueError
+        If the job isn't a POW or MAP2 job, has no files, or a value is
+        malformed
+    """
+    try:
+        root = ET.fromstring(xml.encode())
+    except ET.XMLSyntaxError as e:
+        raise ValueError('Invalid job XML: {}'.format(e))
+
+    process = None
+    if root.find('Process') is not None:
+        process = root.find('Process').findtext('ProcessName')
+    if process not in PROCESSES:
+        raise ValueError('Unknown job process {}'.format(process))
+
+    url_files = _files(root, 'ImageUrl', 'url', 'bandfilter')
+    map_files = _files(root, 'ImageList', './/internalpath', 'band')
+    if not (url_files if process == 'POW' else map_files):
+        raise ValueError('{} job has no files'.format(process))
+
+    out_bit = 'input'
+    output_type = root.find('.//OutputType')
+    if output_type is not None and output_type.find('.//BitType') is not None:
+        out_bit = output_type.find('.//BitType').text
+
+    return JobSpec(
+        process=process,
+        instrument=_text(root, 'Process', './/instrument'),
+        url_files=url_files,
+        map_files=map_files,
+        target_name=_text(root, 'Target', './/TargetName'),
+        equatorial_radius=_number(root, 'Target', './/EquatorialRadius'),
+        polar_radius=_number(root, 'Target', './/PolarRadius'),
+        latitude_type=_choice(root, 'Target', './/LatitudeType', LATITUDE_TYPES),
+        longitude_direction=_choice(root, 'Target', './/LongitudeDirection',
+                                    LONGITUDE_DIRECTIONS),
+        longitude_domain=_number(root, 'Target', './/LongitudeDomain', int),
+        projection=_text(root, 'Projection', 'ProjName'),
+        center_longitude=_number(root, 'Projection', 'CenterLongitude'),
+        center_latitude=_number(root, 'Projection', 'CenterLatitude'),
+        first_parallel=_number(root, 'Projection', './/FirstStandardParallel'),
+        second_parallel=_number(root, 'Projection', './/SecondStandardParallel'),
+        output_geometry=root.find('.//OutputGeometry') is not None,
+        range_type=_text(root, 'extents', './/extentType'),
+        min_lat=_number(root, 'extents', './/MinLatitude'),
+        max_lat=_number(root, 'extents', './/MaxLatitude'),
+        min_lon=_number(root, 'extents', './/MinLongitude'),
+        max_lon=_number(root, 'extents', './/MaxLongitude'),
+        resolution=_number(root, 'OutputOptions', './/OutputResolution'),
+        grid_interval=_number(root, 'grid', './/interval'),
+        out_bit=out_bit,
+        out_format=_text(root, 'OutputType', './/Format'),
+        stretch_type=_stretch_type(root),
+        stretch_min=_number(root, 'Process', './/min'),
+        stretch_max=_number(root, 'Process', './/max'),
+        gauss_sigma=_number(root, 'Process', './/gsigma'),
+        sigma_variance=_number(root, 'Process', './/variance'))
+
+
+def file_entry(job_file):
+    """
+    Parameters
+    ----------
+    job_file : JobFile
+
+    Returns
+    -------
+    str
+        The path with its bands as an ISIS cube attribute, e.g.
+        'x.cub+1,2,3', when one or three bands are requested
+    """
+    if len(job_file.bands) in (1, 3):
+        return job_file.path + '+' + ','.join(job_file.bands)
+    return job_file.path
+
+
+def job_files(spec):
+    """
+    Parameters
+    ----------
+    spec : JobSpec
+
+    Returns
+    -------
+    list
+        file_entry of each of the job's files
+    """
+    files = spec.url_files if spec.process == 'POW' else spec.map_files
+    return [file_entry(job_file) for job_file in files]
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import pvl
+
+# Line that ends a PVL label: 'End' (ISIS) or 'END' (PDS3) on its own
+_END = re.compile(br'^[ \t]*END[ \t]*\r?$', re.IGNORECASE | re.MULTILINE)
+_CHUNK = 64 * 1024
+
+# Number of labels kept; a pipeline only rereads the cube it is working on
+MAX_LABELS = 32
+
+# (path, strict) -> ((inode, mtime, size), parsed label), least recently used first
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def read_label(path):
+    """ Read the label at the start of a file, up to and including its End
+    line, without reading the image data that follows an attached label.
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    str
+        The label text; the whole file if it has no End line
+    """
+    data = b''
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(_CHUNK)
+            if not chunk:
+                break
+            # An End line may straddle two chunks
+            start = max(0, len(data) - 16)
+            data += chunk
+            match = _END.search(data, start)
+            if match:
+                data = data[:match.end()]
+                break
+    return data.decode('utf-8', 'replace')
+
+
+def load_label(path, strict=True):
+    """ Parse the PVL label of a cube, image or label file once per version
+    of the file.
+
+    The parsed label is reused until the file is replaced or modified
+    (inode, mtime or size change), so the steps of a recipe that each read
+    the same intermediate cube's label only parse it once, while the label
+    written by a step that changes the cube in place (e.g. spiceinit) is
+    always seen.
+
+    The returned label is shared between callers and must not be modified.
+
+    Parameters
+    ----------
+    path : str
+    strict : bool
+        Passed to pvl
+
+    Returns
+    -------
+    PVLModule
+    """
+    st = os.stat(path)
+    stamp = (st.st_ino, getattr(st, 'st_mtime_ns', st.st_mtime), st.st_size)
+    key = (path, strict)
+
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == stamp:
+            _cache[key] = _cache.pop(key)
+            return entry[1]
+
+    label = pvl.loads(read_label(path), strict=strict)
+
+    with _lock:
+        _cache.pop(key, None)
+        _cache[key] = (stamp, label)
+        while len(_cache) > MAX_LABELS:
+            _cache.popitem(last=False)
+    return label
@@ -7,7 +7,6 @@ import logging
 import shutil
 import argparse
 
-from pysis import isis
 from pysis.exceptions import ProcessError
 
 from pds_pipelines.config import lock_obj, scratch, pds_log, default_namespace
@@ -17,6 +16,9 @@ from pds_pipelines.RedisHash import RedisHash
 from pds_pipelines.Loggy import Loggy
 from pds_pipelines.SubLoggy import SubLoggy
 from pds_pipelines.Process import Process
+from pds_pipelines.StepRunner import run_isis, StepProfiler
+from pds_pipelines.Checkpoint import Checkpoint
+from pds_pipelines.TaskBudget import TaskBudget
 
 
 class Args(object):
@@ -33,21 +35,41 @@ class Args(object):
                             '-n',
                             dest='namespace',
                             help="Queue namespace")
+        parser.add_argument('--files',
+                            '-f',
+                            dest='files',
+                            type=int,
+                            default=1,
+                            help="Most files to process, 0 to process files until the queue "
+                                 "is empty or --time-budget runs out")
+        parser.add_argument('--time-budget',
+                            dest='time_budget',
+                            type=float,
+                            help="Seconds after which no more files are started")
         args = parser.parse_args()
         self.key = args.key
         self.namespace = args.namespace
+        self.files = args.files
+        self.time_budget = args.time_budget
 
 
-def main():
-    args = Args()
-    args.parse_args()
-    key = args.key
-    namespace = args.namespace
+def process_file(key, namespace):
+    """ Take a file from the job's file queue and process it.
+
+    Parameters
+    ----------
+    key : str
+    namespace : str
 
+    Returns
+    -------
+    bool
+        False if there was no file to process
+    """
     if namespace is None:
         namespace is default_namespace
 
-    workarea = scratch + args.key + '/'
+    workarea = scratch + key + '/'
     RQ_file = RedisQueue(key + '_FileQueue', namespace)
     RQ_work = RedisQueue(key + '_WorkQueue', namespace)
     RQ_zip = RedisQueue(key + '_ZIP', namespace)
@@ -60,6 +82,7 @@ def main():
 
     if int(RQ_file.QueueSize()) == 0 and RQ_lock.available('MAP'):
         print("No Files Found in Redis Queue")
+        return False
     else:
         jobFile = RQ_file.Qfile2Qwork(
             RQ_file.getQueueName(), RQ_work.getQueueName()).decode('utf-8')
@@ -78,6 +101,10 @@ def main():
 
         logger.info('Starting MAP Processing')
 
+        # Per step timing and resource use, see profile_report.py
+        profiler = StepProfiler('map')
+        profiler.item(jobFile)
+
         loggyOBJ = Loggy(basename)
 
         # File Naming
@@ -89,10 +116,20 @@ def main():
         # Recipe Stuff
 
         RQ_recipe = RedisQueue(key + '_recipe')
+        recipe = RQ_recipe.RecipeGet()
+
+        # Steps an earlier attempt at this file, killed or failed part way
+        #  through, already ran on infile
+        checkpoint = Checkpoint(workarea + basename + '.checkpoint.json', jobFile, recipe)
+        done = checkpoint.resume(infile)
+        if done:
+            logger.info('Resuming after %s steps', done)
 
         status = 'success'
 
-        for element in RQ_recipe.RecipeGet():
+        for step, element in enumerate(recipe):
+            if step < done:
+                continue
 
             if status == 'error':
                 break
@@ -137,10 +174,9 @@ def main():
                     print(processOBJ.getProcess())
 
                     for k, v in processOBJ.getProcess().items():
-                        func = getattr(isis, k)
                         subloggyOBJ = SubLoggy(k)
                         try:
-                            func(**v)
+                            run_isis(k, v, profiler=profiler)
                             logger.info('Process %s :: Success', k)
                             subloggyOBJ.setStatus('SUCCESS')
                             subloggyOBJ.setCommand(processOBJ.LogCommandline())
@@ -165,6 +201,10 @@ def main():
                             subloggyOBJ.errorOut(eSTR)
                             loggyOBJ.AddProcess(subloggyOBJ.getSLprocess())
 
+                    # isis2pds writes the final file, leaving infile as it was
+                    if status == 'success' and 'isis2pds' not in processOBJ.getProcessName():
+                        checkpoint.save(step + 1, infile)
+
                 else:
 
                     GDALcmd = ""
@@ -215,6 +255,7 @@ def main():
                         loggyOBJ.AddProcess(subloggyOBJ.getSLprocess())
 
         if status == 'success':
+            checkpoint.clear()
             if RHash.Format().decode('utf-8') == 'ISIS3':
                 finalfile = workarea + RHash.getMAPname().decode('utf-8') + '.cub'
                 shutil.move(infile, finalfile)
@@ -250,6 +291,22 @@ def main():
             logger.warning('Queues Not Empty: filequeue = %s  work queue = %s', str(
                 RQ_file.QueueSize()), str(RQ_work.QueueSize()))
 
+        logger.removeHandler(logFileHandle)
+        logFileHandle.close()
+        return True
+
+
+def main():
+    args = Args()
+    args.parse_args()
+
+    # An array task can process several files, see TaskBudget.chunking
+    budget = TaskBudget(args.files, args.time_budget)
+    while budget.claim():
+        if not process_file(args.key, args.namespace):
+            break
+        budget.done()
+
 
 if __name__ == "__main__":
     sys.exit(main())
@@ -148,6 +148,40 @@ class MakeMap(object):
         """
         self.mapDICT['PixelResolution'] = res
 
+    def FromJobSpec(self, spec, proj=None):
+        """ Set the mapping a POW or MAP2 job asks for.
+
+        Parameters
+        ----------
+        spec : JobSpec
+        proj : str
+            Projection to use in place of the job's, e.g. the input cube's
+            when the job asks for 'INPUT'
+        """
+        self.Projection(proj or spec.projection)
+
+        settings = [(self.CLon, spec.center_longitude),
+                    (self.CLat, spec.center_latitude),
+                    (self.FirstParallel, spec.first_parallel),
+                    (self.SecondParallel, spec.second_parallel),
+                    (self.PixelRes, spec.resolution),
+                    (self.Target, spec.target_name),
+                    (self.ERadius, spec.equatorial_radius),
+                    (self.PRadius, spec.polar_radius),
+                    (self.LatType, spec.latitude_type),
+                    (self.LonDirection, spec.longitude_direction),
+                    (self.LonDomain, spec.longitude_domain)]
+        # A MAP2 job's extents are the map's; a POW job's are only used to
+        #  pick the ground range
+        if spec.process == 'MAP2':
+            settings += [(self.MinLat, spec.min_lat),
+                         (self.MaxLat, spec.max_lat),
+                         (self.MinLon, spec.min_lon),
+                         (self.MaxLon, spec.max_lon)]
+        for setter, value in settings:
+            if value is not None:
+                setter(value)
+
     def Map2pvl(self):
         """
         Returns
@@ -6,7 +6,6 @@ import subprocess
 import logging
 import shutil
 import argparse
-import pvl
 
 from pysis import isis
 from pysis.exceptions import ProcessError
@@ -16,8 +15,21 @@ from pds_pipelines.RedisQueue import RedisQueue
 from pds_pipelines.RedisLock import RedisLock
 from pds_pipelines.RedisHash import RedisHash
 from pds_pipelines.Process import Process
+from pds_pipelines.StepRunner import run_isis, StepProfiler
+from pds_pipelines.Checkpoint import Checkpoint
+from pds_pipelines.TaskBudget import TaskBudget
 from pds_pipelines.Loggy import Loggy
 from pds_pipelines.SubLoggy import SubLoggy
+from pds_pipelines.LabelCache import load_label
+from pds_pipelines.ProductCache import get_product_cache
+from pds_pipelines.IngestProcess import get_checksum
+
+# Extension of the products gdal_translate writes in each job format
+FILE_EXTENSIONS = {'GeoTiff-BigTiff': 'tif',
+                   'GeoJPEG-2000': 'jp2',
+                   'JPEG': 'jpg',
+                   'PNG': 'png',
+                   'GIF': 'gif'}
 
 
 class Args(object):
@@ -34,17 +46,62 @@ class Args(object):
                             '-n',
                             dest='namespace',
                             help='Target key')
+        parser.add_argument('--files',
+                            '-f',
+                            dest='files',
+                            type=int,
+                            default=1,
+                            help="Most files to process, 0 to process files until the queue "
+                                 "is empty or --time-budget runs out")
+        parser.add_argument('--time-budget',
+                            dest='time_budget',
+                            type=float,
+                            help="Seconds after which no more files are started")
         args = parser.parse_args()
         self.key = args.key
         self.namespace = args.namespace
+        self.files = args.files
+        self.time_budget = args.time_budget
+
+
+def final_file(infile, frmt):
+    """
+    Parameters
+    ----------
+    infile : str
+        The job's working cube for a file, .../<name>.input.cub
+    frmt : str
+        Output format of the job
+
+    Returns
+    -------
+    str
+        Product the job makes from infile, or None if frmt is unknown
+    """
+    if frmt == 'ISIS3':
+        ext = 'cub'
+    elif frmt == 'PDS':
+        ext = 'img'
+    elif frmt in FILE_EXTENSIONS:
+        ext = FILE_EXTENSIONS[frmt]
+    else:
+        return None
+    return infile.replace('.input.cub', '_final.' + ext)
 
 
-def main():
-    args = Args()
-    args.parse_args()
-    key = args.key
-    namespace = args.namespace
+def process_file(key, namespace):
+    """ Take a file from the job's file queue and process it.
 
+    Parameters
+    ----------
+    key : str
+    namespace : str
+
+    Returns
+    -------
+    bool
+        False if there was no file to process
+    """
     if namespace is None:
         namespace is default_namespace
     workarea = scratch + key + '/'
@@ -56,11 +113,13 @@ def main():
     RQ_final = RedisQueue('FinalQueue', namespace)
     RHash = RedisHash(key + '_info')
     RHerror = RedisHash(key + '_error')
+    RHrange = RedisHash(key + '_range')
     RQ_lock = RedisLock(lock_obj)
     RQ_lock.add({'POW':'1'})
 
     if int(RQ_file.QueueSize()) == 0 and RQ_lock.available('POW'):
         print("No Files Found in Redis Queue")
+        return False
     else:
         print(RQ_file.getQueueName())
         jobFile = RQ_file.Qfile2Qwork(
@@ -79,6 +138,10 @@ def main():
 
         logger.info('Starting POW Processing')
 
+        # Per step timing and resource use, see profile_report.py
+        profiler = StepProfiler('pow')
+        profiler.item(jobFile)
+
         # set up loggy
         loggyOBJ = Loggy(basename)
 
@@ -96,9 +159,47 @@ def main():
             os.path.splitext(os.path.basename(jobFile))[0] + '.output.cub'
 
         RQ_recipe = RedisQueue(key + '_recipe')
+        recipe = RQ_recipe.RecipeGet()
+
+        # Steps an earlier attempt at this file, killed or failed part way
+        #  through, already ran on infile
+        checkpoint = Checkpoint(workarea + basename + '.checkpoint.json', jobFile, recipe)
+        done = checkpoint.resume(infile)
+        if done:
+            logger.info('Resuming after %s steps', done)
+
+        # The product, if an earlier job made it from the same image with the
+        #  same recipe, map and settings
+        product_cache = get_product_cache()
+        product_key = None
+        cached = False
+        frmt = RHash.Format()
+        if frmt is not None:
+            frmt = frmt.decode('utf-8')
+        grtype = RHash.getGRtype()
+        if grtype is not None:
+            grtype = grtype.decode('utf-8')
+        if product_cache is not None and final_file(infile, frmt) is not None:
+            settings = [jobFile.partition('+')[2],
+                        RHrange.getRange(basename)]
+            for item in (RHash.OutBit(), RHash.getGRtype(), RHash.getMinLat(),
+                         RHash.getMaxLat(), RHash.getMinLon(), RHash.getMaxLon()):
+                settings.append(item.decode('utf-8') if item is not None else None)
+            try:
+                product_key = product_cache.product_key(get_checksum(inputFile),
+                                                        recipe, settings)
+                cached = product_cache.lookup(product_key, final_file(infile, frmt),
+                                              link=True)
+            except (IOError, OSError) as e:
+                logger.warning('Product cache lookup failed: %s', e)
+            if cached:
+                logger.info('Product found in cache')
+                done = len(recipe)
 
         status = 'success'
-        for element in RQ_recipe.RecipeGet():
+        for step, element in enumerate(recipe):
+            if step < done:
+                continue
             if status == 'error':
                 break
             elif status == 'success':
@@ -131,7 +232,7 @@ def main():
                         processOBJ.updateParameter('from_', infile)
 
                     elif 'ctxevenodd' in processOBJ.getProcessName():
-                        label = pvl.load(infile)
+                        label = load_label(infile)
                         SS = label['IsisCube']['Instrument']['SpatialSumming']
                         print(SS)
                         if SS != 1:
@@ -141,7 +242,7 @@ def main():
                             processOBJ.updateParameter('to', outfile)
 
                     elif 'mocevenodd' in processOBJ.getProcessName():
-                        label = pvl.load(infile)
+                        label = load_label(infile)
                         CTS = label['IsisCube']['Instrument']['CrosstrackSumming']
                         print(CTS)
                         if CTS != 1:
@@ -150,7 +251,7 @@ def main():
                             processOBJ.updateParameter('from_', infile)
                             processOBJ.updateParameter('to', outfile)
                     elif 'mocnoise50' in processOBJ.getProcessName():
-                        label = pvl.load(infile)
+                        label = load_label(infile)
                         CTS = label['IsisCube']['Instrument']['CrosstrackSumming']
                         if CTS != 1:
                             continue
@@ -161,53 +262,59 @@ def main():
                         processOBJ.updateParameter('from', infile)
                         processOBJ.updateParameter('to', outfile)
 
-                        if RHash.getGRtype() == 'smart' or RHash.getGRtype() == 'fill':
+                        if grtype == 'smart' or grtype == 'fill':
                             subloggyOBJ = SubLoggy('cam2map')
-                            camrangeOUT = workarea + basename + '_camrange.txt'
-                            isis.camrange(from_=infile,
-                                          to=camrangeOUT)
-
-                            cam = pvl.load(camrangeOUT)
-
-                            if cam['UniversalGroundRange']['MaximumLatitude'] < float(RHash.getMinLat()) or \
-                               cam['UniversalGroundRange']['MinimumLatitude'] > float(RHash.getMaxLat()) or \
-                               cam['UniversalGroundRange']['MaximumLongitude'] < float(RHash.getMinLon()) or \
-                               cam['UniversalGroundRange']['MinimumLongitude'] > float(RHash.getMaxLon()):
-
-                                status = 'error'
-                                eSTR = "Error Ground Range Outside Extent Range"
-                                RHerror.addError(os.path.splitext(
-                                    os.path.basename(jobFile))[0], eSTR)
-                                subloggyOBJ.setStatus('ERROR')
-                                subloggyOBJ.errorOut(eSTR)
-                                loggyOBJ.AddProcess(subloggyOBJ.getSLprocess())
-                                break
-
-                            elif RHash.getGRtype() == 'smart':
-                                if cam['UniversalGroundRange']['MinimumLatitude'] > float(RHash.getMinLat()):
-                                    minlat = cam['UniversalGroundRange']['MinimumLatitude']
-                                else:
-                                    minlat = RHash.getMinLat()
-
-                                if cam['UniversalGroundRange']['MaximumLatitude'] < float(RHash.getMaxLat()):
-                                    maxlat = cam['UniversalGroundRange']['MaximumLatitude']
-                                else:
-                                    maxlat = RHash.getMaxLat()
-
-                                if cam['UniversalGroundRange']['MinimumLongitude'] > float(RHash.getMinLon()):
-                                    minlon = cam['UniversalGroundRange']['MinimumLongitude']
-                                else:
-                                    minlon = RHash.getMinLon()
-
-                                if cam['UniversalGroundRange']['MaximumLongitude'] < float(RHash.getMaxLon()):
-                                    maxlon = cam['UniversalGroundRange']['MaximumLongitude']
-                                else:
-                                    maxlon = RHash.getMaxLon()
-                            elif RHash.getGRtype() == 'fill':
-                                minlat = RHash.getMinLat()
-                                maxlat = RHash.getMaxLat()
-                                minlon = RHash.getMinLon()
-                                maxlon = RHash.getMaxLon()
+                            ground = RHrange.getRange(basename)
+                            if ground is not None:
+                                # Worked out from the image's footprint when the job was
+                                #  submitted, see GroundRange
+                                minlat, maxlat, minlon, maxlon = ground
+                            else:
+                                camrangeOUT = workarea + basename + '_camrange.txt'
+                                isis.camrange(from_=infile,
+                                              to=camrangeOUT)
+
+                                cam = load_label(camrangeOUT)
+
+                                if cam['UniversalGroundRange']['MaximumLatitude'] < float(RHash.getMinLat()) or \
+                                   cam['UniversalGroundRange']['MinimumLatitude'] > float(RHash.getMaxLat()) or \
+                                   cam['UniversalGroundRange']['MaximumLongitude'] < float(RHash.getMinLon()) or \
+                                   cam['UniversalGroundRange']['MinimumLongitude'] > float(RHash.getMaxLon()):
+
+                                    status = 'error'
+                                    eSTR = "Error Ground Range Outside Extent Range"
+                                    RHerror.addError(os.path.splitext(
+                                        os.path.basename(jobFile))[0], eSTR)
+                                    subloggyOBJ.setStatus('ERROR')
+                                    subloggyOBJ.errorOut(eSTR)
+                                    loggyOBJ.AddProcess(subloggyOBJ.getSLprocess())
+                                    break
+
+                                elif grtype == 'smart':
+                                    if cam['UniversalGroundRange']['MinimumLatitude'] > float(RHash.getMinLat()):
+                                        minlat = cam['UniversalGroundRange']['MinimumLatitude']
+                                    else:
+                                        minlat = float(RHash.getMinLat())
+
+                                    if cam['UniversalGroundRange']['MaximumLatitude'] < float(RHash.getMaxLat()):
+                                        maxlat = cam['UniversalGroundRange']['MaximumLatitude']
+                                    else:
+                                        maxlat = float(RHash.getMaxLat())
+
+                                    if cam['UniversalGroundRange']['MinimumLongitude'] > float(RHash.getMinLon()):
+                                        minlon = cam['UniversalGroundRange']['MinimumLongitude']
+                                    else:
+                                        minlon = float(RHash.getMinLon())
+
+                                    if cam['UniversalGroundRange']['MaximumLongitude'] < float(RHash.getMaxLon()):
+                                        maxlon = cam['UniversalGroundRange']['MaximumLongitude']
+                                    else:
+                                        maxlon = float(RHash.getMaxLon())
+                                elif grtype == 'fill':
+                                    minlat = float(RHash.getMinLat())
+                                    maxlat = float(RHash.getMaxLat())
+                                    minlon = float(RHash.getMinLon())
+                                    maxlon = float(RHash.getMaxLon())
 
                             processOBJ.AddParameter('minlat', minlat)
                             processOBJ.AddParameter('maxlat', maxlat)
@@ -228,10 +335,9 @@ def main():
                     print(processOBJ.getProcess())
 
                     for k, v in processOBJ.getProcess().items():
-                        func = getattr(isis, k)
                         subloggyOBJ = SubLoggy(k)
                         try:
-                            func(**v)
+                            run_isis(k, v, profiler=profiler)
                             logger.info('Process %s :: Success', k)
                             subloggyOBJ.setStatus('SUCCESS')
                             subloggyOBJ.setCommand(processOBJ.LogCommandline())
@@ -256,6 +362,10 @@ def main():
                             subloggyOBJ.errorOut(eSTR)
                             loggyOBJ.AddProcess(subloggyOBJ.getSLprocess())
 
+                    # isis2pds writes the final file, leaving infile as it was
+                    if status == 'success' and 'isis2pds' not in processOBJ.getProcessName():
+                        checkpoint.save(step + 1, infile)
+
                 else:
                     GDALcmd = ""
                     for process, v, in processOBJ.getProcess().items():
@@ -264,22 +374,9 @@ def main():
                         for key, value in v.items():
                             GDALcmd += ' ' + key + ' ' + value
 
-                    frmt = RHash.Format().decode('utf-8')
-                    if frmt == 'GeoTiff-BigTiff':
-                        fileext = 'tif'
-                    elif frmt == 'GeoJPEG-2000':
-                        fileext = 'jp2'
-                    elif frmt == 'JPEG':
-                        fileext = 'jpg'
-                    elif frmt == 'PNG':
-                        fileext = 'png'
-                    elif frmt == 'GIF':
-                        fileext = 'gif'
-
+                    finalfile = final_file(infile, frmt)
                     logGDALcmd = GDALcmd + ' ' + basename + \
-                        '.input.cub ' + basename + '_final.' + fileext
-                    finalfile = infile.replace(
-                        '.input.cub', '_final.' + fileext)
+                        '.input.cub ' + os.path.basename(finalfile)
                     GDALcmd += ' ' + infile + ' ' + finalfile
                     print(GDALcmd)
 
@@ -307,10 +404,20 @@ def main():
                         loggyOBJ.AddProcess(subloggyOBJ.getSLprocess())
 
         if status == 'success':
+            checkpoint.clear()
 
-            if RHash.Format() == 'ISIS3':
+            if cached:
+                finalfile = final_file(infile, frmt)
+            elif frmt == 'ISIS3':
                 finalfile = infile.replace('.input.cub', '_final.cub')
                 shutil.move(infile, finalfile)
+            if product_key is not None and not cached and \
+               os.path.isfile(final_file(infile, frmt)):
+                try:
+                    product_cache.add(product_key, final_file(infile, frmt), link=True)
+                    logger.info('Product added to cache')
+                except (IOError, OSError) as e:
+                    logger.warning('Product NOT added to cache: %s', e)
             if RHash.getStatus() != 'ERROR':
                 RHash.Status('SUCCESS')
 
@@ -346,6 +453,22 @@ def main():
             logger.warning('Work Queue Not Empty: filequeue = %s  work queue = %s', str(
                 RQ_file.QueueSize()), str(RQ_work.QueueSize()))
 
+        logger.removeHandler(logFileHandle)
+        logFileHandle.close()
+        return True
+
+
+def main():
+    args = Args()
+    args.parse_args()
+
+    # An array task can process several files, see TaskBudget.chunking
+    budget = TaskBudget(args.files, args.time_budget)
+    while budget.claim():
+        if not process_file(args.key, args.namespace):
+            break
+        budget.done()
+
 
 if __name__ == "__main__":
     sys.exit(main())
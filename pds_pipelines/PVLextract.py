@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+
+import io
+import re
+import datetime
+from collections import OrderedDict
+
+import pvl
+import pytz
+
+_BEGIN = ('object', 'group', 'begin_object', 'begin_group')
+_END_BLOCK = ('end_object', 'end_group', 'endobject', 'endgroup')
+
+_INTEGER = re.compile(r'^[+-]?\d+$')
+_REAL = re.compile(r'^[+-]?(\d+\.\d*|\.\d+|\d+)([eE][+-]?\d+)?$')
+_RADIX = re.compile(r'^([+-]?)(\d+)#([0-9A-Fa-f]+)#$')
+_DATETIME = re.compile(r'^(\d{4})-(?:(\d{2})-(\d{2})|(\d{3}))'
+                       r'(?:T(\d{2}):(\d{2})(?::(\d{2})(?:\.(\d+))?)?)?(Z)?$')
+_UNITS = re.compile(r'^(.*?)\s*<([^<>]*)>$', re.S)
+# Quoted strings, and the brackets of sequences and sets outside them
+_TOKENS = re.compile(r'"[^"]*"|\'[^\']*\'|[(){}"\']')
+
+_NULL = ('Null', 'NULL')
+_TRUE = ('TRUE', 'True', 'true')
+_FALSE = ('FALSE', 'False', 'false')
+
+
+def _split(text):
+    """ Split the inside of a sequence or set on the commas between its
+    top level elements. """
+    items = []
+    depth = 0
+    start = 0
+    quote = None
+    for i, ch in enumerate(text):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in '"\'':
+            quote = ch
+        elif ch in '({':
+            depth += 1
+        elif ch in ')}':
+            depth -= 1
+        elif ch == ',' and depth == 0:
+            items.append(text[start:i])
+            start = i + 1
+    items.append(text[start:])
+    return [item for item in items if item.strip()]
+
+
+def _datetime(match):
+    year, month, day, doy, hour, minute, second, fraction, zulu = match.groups()
+    if doy is not None:
+        date = datetime.date(int(year), 1, 1) + datetime.timedelta(int(doy) - 1)
+    else:
+        date = datetime.date(int(year), int(month), int(day))
+    if hour is None:
+        return date
+    micro = int((fraction or '0')[:6].ljust(6, '0'))
+    tzinfo = pytz.utc if zulu else None
+    return datetime.datetime(date.year, date.month, date.day, int(hour),
+                             int(minute), int(second or 0), micro, tzinfo)
+
+
+def decode_value(text):
+    """ Decode a PVL value the way pvl does, without its grammar checks.
+
+    Parameters
+    ----------
+    text : str
+        Value as written after the '=' of a statement
+
+    Returns
+    -------
+    obj
+        int, float, bool, None, str, datetime, list (sequence), set or
+        pvl.Units
+    """
+    text = text.strip()
+    match = _UNITS.match(text)
+    if match and match.group(1) and text[0] not in '"\'':
+        return pvl.Units(decode_value(match.group(1)), match.group(2).strip())
+
+    if text[:1] == '(' and text[-1:] == ')':
+        return [decode_value(item) for item in _split(text[1:-1])]
+    if text[:1] == '{' and text[-1:] == '}':
+        try:
+            return set(decode_value(item) for item in _split(text[1:-1]))
+        except TypeError:
+            return [decode_value(item) for item in _split(text[1:-1])]
+    if len(text) > 1 and text[0] in '"\'' and text[-1] == text[0]:
+        return text[1:-1]
+
+    if _INTEGER.match(text):
+        return int(text)
+    if _REAL.match(text):
+        return float(text)
+    if text in _NULL:
+        return None
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    match = _RADIX.match(text)
+    if match:
+        try:
+            value = int(match.group(3), int(match.group(2)))
+            return -value if match.group(1) == '-' else value
+        except ValueError:
+            return text
+    match = _DATETIME.match(text)
+    if match:
+        try:
+            return _datetime(match)
+        except ValueError:
+            return text
+    return text
+
+
+def _continues(value):
+    """ True if a value that starts a quoted string, sequence or set is not
+    closed on the line(s) read so far. """
+    depth = 0
+    for token in _TOKENS.findall(value):
+        if token in '({':
+            depth += 1
+        elif token in ')}':
+            depth -= 1
+        elif token in '"\'':
+            # A quote that is never closed
+            return True
+    return depth > 0
+
+
+def _strip_comment(line):
+    start = line.find('/*')
+    if start < 0 or line.count('"', 0, start) % 2:
+        return line
+    end = line.find('*/', start)
+    if end < 0:
+        return line[:start]
+    return line[:start] + line[end + 2:]
+
+
+def extract(lines, groups=None, keywords=()):
+    """ Read the keywords wanted from PVL text, e.g. caminfo output or an
+    ISIS cube label.
+
+    Unlike pvl, this is a single line-oriented pass that only decodes the
+    values that are wanted and doesn't check the grammar, so labels that
+    pvl rejects (e.g. ';' or '&' in unquoted values) are read as they are.
+    Values continued on the next line with a trailing '-', as ISIS writes
+    long values, and quoted strings, sequences and sets that span lines are
+    joined.
+
+    Parameters
+    ----------
+    lines : iterable
+        Lines of PVL text; reading stops at the End statement
+    groups : iterable
+        Lower cased names of the objects/groups whose keywords are all
+        kept, along with those of objects/groups nested in them.  If None,
+        every keyword is kept.
+    keywords : iterable
+        Lower cased keywords kept wherever they appear
+
+    Returns
+    -------
+    OrderedDict
+        The label's objects and groups (all of them, each an OrderedDict)
+        and the keywords kept, in the order and case they appear; a later
+        duplicate keyword replaces an earlier one
+
+    Raises
+    ------
+    ValueError
+        If the text ends inside a value
+    """
+    groups = None if groups is None else set(groups)
+    keywords = set(keywords)
+
+    root = OrderedDict()
+    # (block, whether its keywords are all kept)
+    stack = [(root, groups is None)]
+    name = None
+    value = None
+
+    for line in lines:
+        if value is not None:
+            # Continuation of a statement
+            line = line.strip()
+            if value.endswith('-'):
+                value = value[:-1] + line
+            elif line:
+                value = value + ' ' + line
+        else:
+            line = _strip_comment(line).strip()
+            if not line:
+                continue
+            key, sep, rest = line.partition('=')
+            key = key.strip()
+            lower = key.lower()
+            if lower == 'end' and not sep:
+                break
+            if lower in _END_BLOCK:
+                if len(stack) > 1:
+                    stack.pop()
+                continue
+            if not sep:
+                # Not a statement
+                continue
+            if lower in _BEGIN:
+                block_name = rest.strip().strip('"')
+                block = OrderedDict()
+                parent, kept = stack[-1]
+                parent[block_name] = block
+                stack.append((block, kept or (groups is not None
+                                              and block_name.lower() in groups)))
+                continue
+            name = key
+            value = rest.strip()
+
+        if value.endswith('-') or (value[:1] in '"\'({' and _continues(value)):
+            continue
+
+        block, kept = stack[-1]
+        if kept or name.lower() in keywords:
+            block[name] = decode_value(value)
+        value = None
+
+    if value is not None:
+        raise ValueError('Label ends inside the value of {}'.format(name))
+    return root
+
+
+def extract_label(path, groups=None, keywords=()):
+    """
+    Parameters
+    ----------
+    path : str
+        PVL file, or a cube or image with an attached label
+    groups : iterable
+    keywords : iterable
+        See extract
+
+    Returns
+    -------
+    OrderedDict
+    """
+    with io.open(path, 'r', errors='replace') as f:
+        return extract(f, groups, keywords)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+import os
+import json
+import hashlib
+
+from pds_pipelines import config
+from pds_pipelines.CubeCache import CubeCache, PATH_PARAMS
+
+# Recipe parameters that name a file whose contents change the result
+CONTENT_PARAMS = ('map',)
+
+_isis_version = []
+
+
+def isis_version():
+    """
+    Returns
+    -------
+    str
+        config.isis_version, or the first line of $ISISROOT/version; '' if
+        neither is set
+    """
+    if not _isis_version:
+        version = getattr(config, 'isis_version', None)
+        if version is None:
+            try:
+                with open(os.path.join(os.environ.get('ISISROOT', ''), 'version')) as f:
+                    version = f.readline().strip()
+            except (IOError, OSError):
+                version = ''
+        _isis_version.append(version)
+    return _isis_version[0]
+
+
+def file_digest(path):
+    """
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    str
+        sha1 of the file's contents, or None if it can't be read
+    """
+    digest = hashlib.sha1()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                digest.update(chunk)
+    except (IOError, OSError):
+        return None
+    return digest.hexdigest()
+
+
+def product_signature(step):
+    """
+    Parameters
+    ----------
+    step : dict
+        {process: parameters} entry of a recipe
+
+    Returns
+    -------
+    list
+        [process, sorted parameters], leaving out parameters that only name
+        files, and with the contents of map files in place of their names
+    """
+    process, params = list(step.items())[0]
+    signed = []
+    for k, v in params.items():
+        if k in PATH_PARAMS:
+            continue
+        if k in CONTENT_PARAMS:
+            v = file_digest(v)
+        signed.append((k, str(v)))
+    return [process, sorted(signed)]
+
+
+class ProductCache(CubeCache):
+    """
+    Content addressed cache of the final products of POW jobs, so a job
+    asking for an image another job already made with the same projection,
+    resolution, stretch and format is served a copy.
+
+    A product is keyed on the checksum of the input file, the steps and
+    parameters of the job's recipe, the contents of its map file, the job's
+    output settings and the ISIS version.  Products are hard linked in and
+    out of the cache where possible, and the least recently used removed
+    when it grows over its quota.
+    """
+
+    suffix = '.product'
+
+    @staticmethod
+    def product_key(checksum, recipe, settings):
+        """
+        Parameters
+        ----------
+        checksum : str
+            Checksum of the input file
+        recipe : list
+            Recipe.getRecipe() list of {process: parameters}
+        settings : list
+            Anything else the product depends on, e.g. the job's bands, bit
+            type and ground range; must be JSON serializable
+
+        Returns
+        -------
+        str
+        """
+        steps = [product_signature(step) for step in recipe]
+        data = json.dumps([checksum, steps, settings, isis_version()], sort_keys=True)
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def get_product_cache():
+    """
+    Returns
+    -------
+    ProductCache
+        The cache set up by config.product_cache (directory) and
+        config.product_cache_quota (bytes), or None if it isn't configured
+    """
+    root = getattr(config, 'product_cache', None)
+    if not root:
+        return None
+    quota = getattr(config, 'product_cache_quota', 100 * 1024 ** 3)
+    return ProductCache(root, quota)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+import os
+import errno
+import hashlib
+import threading
+
+from pds_pipelines import config
+
+ARCHIVE_ROOT = '/pds_san/pds_archive/'
+DERIVED_ROOT = '/pds_san/PDS_Derived/UPC/images/'
+
+# Directories already made by this process; cleared if it grows past
+#  MAX_DIRS, so a long running worker doesn't grow without bound
+MAX_DIRS = 100000
+_created = set()
+_lock = threading.Lock()
+
+
+def shard_depth():
+    """
+    Returns
+    -------
+    int
+        config.derived_shard_depth, the number of hashed directory levels
+        between an image's mirrored archive directory and its products; 0
+        keeps the products in the mirrored directory itself
+    """
+    return int(getattr(config, 'derived_shard_depth', 0))
+
+
+def shard(name, depth):
+    """
+    Parameters
+    ----------
+    name : str
+        Image file name
+    depth : int
+
+    Returns
+    -------
+    list
+        depth two hex digit directory names taken from the sha1 of name,
+        e.g. ['3f', 'a0'], so a directory's images are spread over up to
+        256**depth subdirectories
+    """
+    digest = hashlib.sha1(name.encode('utf-8')).hexdigest()
+    return [digest[2 * i:2 * i + 2] for i in range(depth)]
+
+
+def product_dir(inputfile, depth=None):
+    """ Directory the derived products of an archive image go in.
+
+    The archive's directory tree is mirrored under DERIVED_ROOT and, with
+    a shard depth, fanned out by a hash of the image's name, which every
+    product of an image shares.
+
+    Parameters
+    ----------
+    inputfile : str
+        Archive image
+    depth : int
+        Defaults to shard_depth()
+
+    Returns
+    -------
+    str
+    """
+    if depth is None:
+        depth = shard_depth()
+    temppath = os.path.dirname(inputfile).lower()
+    finalpath = temppath.replace(ARCHIVE_ROOT, DERIVED_ROOT)
+    name = os.path.splitext(os.path.basename(inputfile))[0]
+    return os.path.join(finalpath, *shard(name, depth))
+
+
+def ensure_dir(path):
+    """ Make a directory unless this process already has.
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    str
+        path
+    """
+    with _lock:
+        if path in _created:
+            return path
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    with _lock:
+        if len(_created) >= MAX_DIRS:
+            _created.clear()
+        _created.add(path)
+    return path
+
+
+def makedir(inputfile):
+    """
+    Parameters
+    ----------
+    inputfile : str
+        Archive image
+
+    Returns
+    -------
+    str
+        The image's product directory, made if needed
+    """
+    return ensure_dir(product_dir(inputfile))
+
+
+def product_url(path, server):
+    """
+    Parameters
+    ----------
+    path : str
+        Product file under DERIVED_ROOT
+    server : str
+        e.g. '$thumbnail_server/', which the image servers map to
+        DERIVED_ROOT
+
+    Returns
+    -------
+    str
+        The URL stored for the product.  It follows the product's path,
+        shard directories included, so it resolves whatever the shard
+        depth was when the product was made.
+    """
+    return path.replace(DERIVED_ROOT, server)
@@ -5,11 +5,11 @@ import subprocess
 import sys
 
 import redis
-import json
 from collections import OrderedDict
 
 from pds_pipelines.Process import Process
 from pds_pipelines.RedisQueue import RedisQueue
+from pds_pipelines.ConfigCache import load_recipe
 
 from pds_pipelines.config import recipe_base
 
@@ -35,8 +35,7 @@ class Recipe(Process):
         file : str
         """
 
-        # @TODO use 'with' statement for file read
-        testjson = json.loads(open(file).read(), object_pairs_hook=OrderedDict)
+        testjson = load_recipe(file)
 
         for IP in testjson[proc]['recipe']:
             process = str(IP)
@@ -107,7 +106,7 @@ class Recipe(Process):
             stepList
         """
         stepList = []
-        testjson = json.loads(open(file).read(), object_pairs_hook=OrderedDict)
+        testjson = load_recipe(file)
 
         for IP in testjson['recipe']:
             stepList.append(IP)
@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 
+import json
+
 import redis
 from pds_pipelines.config import redis_info as ri
 
@@ -201,6 +203,32 @@ class RedisHash(object):
         """
         self._db.hset(self.id_name, infile, error)
 
+    def addRange(self, infile, ground):
+        """
+        Parameters
+        ----------
+        infile : str
+        ground : tuple
+            (minlat, maxlat, minlon, maxlon)
+        """
+        self._db.hset(self.id_name, infile, json.dumps(list(ground)))
+
+    def getRange(self, infile):
+        """
+        Parameters
+        ----------
+        infile : str
+
+        Returns
+        ------
+        list
+            [minlat, maxlat, minlon, maxlon], or None
+        """
+        item = self._db.hget(self.id_name, infile)
+        if item is None:
+            return None
+        return json.loads(item)
+
     def getKeys(self):
         """
         Returns
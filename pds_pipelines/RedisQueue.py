@@ -57,6 +57,17 @@ class RedisQueue(object):
         """
         self._db.rpush(self.id_name, element)
 
+    def QueueAddMany(self, elements):
+        """
+        Pushes every element in a single round trip.
+
+        Parameters
+        ----------
+        elements : list
+        """
+        if elements:
+            self._db.rpush(self.id_name, *elements)
+
     def QueueGet(self):
         """
         Returns
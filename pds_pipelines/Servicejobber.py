@@ -2,11 +2,8 @@
 
 import os
 import sys
-import pvl
-import lxml.etree as ET
 import logging
 import argparse
-import json
 
 from pds_pipelines.PDS_DBquery import PDS_DBquery
 from pds_pipelines.RedisQueue import RedisQueue
@@ -14,548 +11,215 @@ from pds_pipelines.RedisHash import RedisHash
 from pds_pipelines.Recipe import Recipe
 from pds_pipelines.Process import Process
 from pds_pipelines.MakeMap import MakeMap
-from pds_pipelines.HPCjob import HPCjob
-from pds_pipelines.config import recipe_base, pds_log, scratch, archive_base, default_namespace, slurm_log, cmd_dir, pds_info
+from pds_pipelines.HPCjob import HPCjob, get_executor
+from pds_pipelines.TaskBudget import chunking
+from pds_pipelines.ConfigCache import load_pds_info
+from pds_pipelines.LabelCache import load_label
+from pds_pipelines.JobSpec import parse_job, file_entry, job_files
+from pds_pipelines.GroundRange import OUTSIDE_EXTENT, prefilter, job_ranges
+from pds_pipelines.db import db_connect
+from pds_pipelines import config
+from pds_pipelines.config import recipe_base, pds_log, scratch, archive_base, default_namespace, slurm_log, cmd_dir, pds_info, upc_db
 
 
 class jobXML(object):
+    """
+    Getters over a job's JobSpec, which is parsed once when the job is read.
+
+    Attributes
+    ----------
+    spec : JobSpec
+    """
 
     def __init__(self, xml):
         """
         Parameters
         ----------
-        xml
+        xml : str
+
+        Raises
+        ------
+        ValueError
+            If the job XML isn't a valid POW or MAP2 job
         """
-        self.pds_info = json.load(open(pds_info, 'r'))
-        self.root = ET.fromstring(xml.encode())
+        self.pds_info = load_pds_info(pds_info)
+        self.spec = parse_job(xml)
 
     def getInst(self):
-        """
-        Returns
-        -------
-        str
-            inst
-        """
-        for info in self.root.findall('.//Process'):
-            inst = info.find('.//instrument').text
-            return inst
+        return self.spec.instrument
 
     def getCleanName(self):
         """ Get the internally consistent representation of the instrument name.
 
-        Searches the PDSinfo dict for the 'clean name' that matches the recipes.  This function essentially
-        maps URL->file path->internally consistent name.
+        See clean_name.
         """
-        # @TODO Fix after refactor
-        # NOTE: I know this is really, really bad.  We're kind of backed into a corner here,
-        #  and partial string matching on a value-based lookup of a nested dict is the temporary solution.
-
-        # Get any file listed.  Assumes that all files are from the same instrument
-        file_name = self.getFileList()[0]
-        file_name = file_name.replace('http://pdsimage.wr.usgs.gov/Missions/', archive_base)
-
-        candidates = []
-
-        for key in self.pds_info:
-            if file_name.startswith(self.pds_info[key]['path']):
-                candidates.append(key)
-
-        # try to filter list based on upc_reqs.  If upc_reqs isn't specified, just skip the filtering step
-        # ps can't use 'filter' because not all elements have upc_reqs, so they may raise exceptions.
-        for item in candidates:
-            try:
-                if not all(x in file_name for x in self.pds_info[item]['upc_reqs']):
-                    candidates.remove(item)
-            except KeyError:
-                # Intentionally left blank.  Unspecified upc_reqs is valid -- there's just nothing to do for those elements
-                pass
-                
-        # If multiple candidates still exist, then it is not possible to uniquely identify the clean name
-        if len(candidates) > 1:
-            raise(RuntimeError('Multiple candidates found for {} with no resolvable clean name'.format(file_name)))
-
-        try:
-            return candidates[0]
-        except IndexError:
-            raise(KeyError('No key found in PDSInfo dict for path {}'.format(file_name)))
+        return clean_name(self.spec, self.pds_info)
 
-
-            
     def getProcess(self):
-        """
-        Returns
-        -------
-        str
-            PT
-        """
-        for info in self.root.findall('Process'):
-            PT = info.find('ProcessName').text
-            return PT
+        return self.spec.process
 
     def getTargetName(self):
-        """
-        Returns
-        -------
-        NoneType
-            'None' if 'info.find('.//TargetName')' is None
-        str
-            otherwise return 'info.find('.//TargetName').text'
-        """
-        for info in self.root.iter('Target'):
-            if info.find('.//TargetName') is None:
-                return None
-            else:
-                return info.find('.//TargetName').text
+        return self.spec.target_name
 
     def getERadius(self):
-        """
-        Returns
-        -------
-        NoneType
-            'None' if 'info.find('.//EquatorialRadius')' is None
-        str
-            Otherwise return 'info.find('.//EquatorialRadius').text'
-        """
-        for info in self.root.iter('Target'):
-            if info.find('.//EquatorialRadius') is None:
-                return None
-            else:
-                return info.find('.//EquatorialRadius').text
+        return self.spec.equatorial_radius
 
     def getPRadius(self):
-        """
-        Returns
-        -------
-        NoneType
-            'None' if 'info.find('.//PolarRadius')' is None
-        str
-            Otherwise return 'info.find('.//PolarRadius').text'
-        """
-        for info in self.root.iter('Target'):
-            if info.find('.//PolarRadius') is None:
-                return None
-            else:
-                return info.find('.//PolarRadius').text
+        return self.spec.polar_radius
 
     def getLatType(self):
-        """
-        Returns
-        -------
-        NoneType
-            'None' if 'info.find('.//LatitudeType')' is None
-        str
-            Otherwise return 'LT'
-        """
-        for info in self.root.iter('Target'):
-            if info.find('.//LatitudeType') is None:
-                return None
-            else:
-                temp_LT = info.find('.//LatitudeType').text
-                if temp_LT == 'planetocentric':
-                    LT = 'Planetocentric'
-                elif temp_LT == 'planetographic':
-                    LT = 'Planetographic'
-            return LT
+        return self.spec.latitude_type
 
     def getLonDirection(self):
-        """
-        Returns
-        -------
-        NoneType
-            'None' if 'info.find('.//LongitudeDirection')' is None
-        str
-            Otherwise return 'LD'
-        """
-        for info in self.root.iter('Target'):
-            if info.find('.//LongitudeDirection') is None:
-                return None
-            else:
-                temp_LD = info.find('.//LongitudeDirection').text
-                if temp_LD == 'POSITIVEEAST':
-                    LD = 'PositiveEast'
-                elif temp_LD == 'POSITIVEWEST':
-                    LD = 'PositiveWest'
-            return LD
+        return self.spec.longitude_direction
 
     def getLonDomain(self):
-        """
-        Returns
-        -------
-        NoneType
-            'None' if 'info.find('.//LongitudeDomain')' is None
-        str
-            otherwise return 'info.find('.//LongitudeDomain').text'
-        """
-        for info in self.root.iter('Target'):
-            if info.find('.//LongitudeDomain') is None:
-                return None
-            else:
-                return info.find('.//LongitudeDomain').text
+        return self.spec.longitude_domain
 
     def getProjection(self):
-        """
-        Returns
-        -------
-        NoneType
-            'None' if 'proj' is None
-        str
-            Otherwise 'info.find('ProjName').text'
-        """
-        for info in self.root.iter('Projection'):
-            proj = info.find('ProjName').text
-            if proj is None:
-                return None
-            else:
-                return info.find('ProjName').text
+        return self.spec.projection
 
     def getClon(self):
-        """
-        Returns
-        -------
-        NoneType
-            'None' if 'clon' is None
-        str
-            Otherwise 'info.find('CenterLongitude').text'
-        """
-        for info in self.root.iter('Projection'):
-            clon = info.find('CenterLongitude')
-            if clon is None:
-                return None
-            else:
-                return info.find('CenterLongitude').text
+        return self.spec.center_longitude
 
     def getClat(self):
-        """
-        Returns
-        -------
-        NoneType
-            'None' if 'clat' is None
-        str
-            Otherwise 'info.find('CenterLatitude').text'
-        """
-        for info in self.root.iter('Projection'):
-            clat = info.find('CenterLatitude')
-            if clat is None:
-                return None
-            else:
-                return info.find('CenterLatitude').text
+        return self.spec.center_latitude
 
     def getFirstParallel(self):
-        """
-        Returns
-        -------
-        NoneType
-            'None' if 'info.find('.//FirstStandardParallel')' is None
-        str
-            Otherwise 'info.find('.//FirstStandardParallel').text'
-        """
-        for info in self.root.iter('Projection'):
-            if info.find('.//FirstStandardParallel') is None:
-                return None
-            else:
-                return info.find('.//FirstStandardParallel').text
+        return self.spec.first_parallel
 
     def getSecondParallel(self):
-        """
-        Returns
-        -------
-        NoneType
-            'None' if 'info.find('.//SecondStandardParallel')' is None
-        str
-            Otherwise 'info.find('.//SecondStandardParallel').text'
-        """
-        for info in self.root.iter('Projection'):
-            if info.find('.//SecondStandardParallel') is None:
-                return None
-            else:
-                return info.find('.//SecondStandardParallel').text
+        return self.spec.second_parallel
 
     def OutputGeometry(self):
         """
         Returns
         -------
         NoneType
-            None if 'info' is None
+            None if the job has no OutputGeometry element
         bool
-            True if 'info' is not None
+            True if it has
         """
-        for info in self.root.iter('OutputGeometry'):
-            if info is None:
-                return None
-            elif info is not None:
-                return True
+        return True if self.spec.output_geometry else None
 
     def getRangeType(self):
-        """
-        Returns
-        -------
-        NoneType
-            'None' if 'info.find('.//extentType')' is None
-        str
-            Otherwise 'info.find('.//extentType').text'
-        """
-        for info in self.root.iter('extents'):
-            if info.find('.//extentType') is None:
-                return None
-            else:
-                return info.find('.//extentType').text
+        return self.spec.range_type
 
     def getMinLat(self):
-        """
-        Returns
-        -------
-        NoneType
-            'None' if 'info.find('.//MinLatitude')' is None
-        str
-            Otherwise 'info.find('.//MinLatitude').text'
-        """
-        for info in self.root.iter('extents'):
-            if info.find('.//MinLatitude') is None:
-                return None
-            else:
-                return info.find('.//MinLatitude').text
+        return self.spec.min_lat
 
     def getMaxLat(self):
-        """
-        Returns
-        -------
-        NoneType
-            'None' if 'info.find('.//MaxLatitude')' is None
-        str
-            Otherwise 'info.find('.//MaxLatitude').text'
-        """
-        for info in self.root.iter('extents'):
-            if info.find('.//MaxLatitude') is None:
-                return None
-            else:
-                return info.find('.//MaxLatitude').text
+        return self.spec.max_lat
 
     def getMinLon(self):
-        """
-        Returns
-        -------
-        NoneType
-            'None' if 'info.find('.//MinLongitude')' is None
-        str
-            Otherwise 'info.find('.//MinLongitude').text'
-        """
-        for info in self.root.iter('extents'):
-            if info.find('.//MinLongitude') is None:
-                return None
-            else:
-                return info.find('.//MinLongitude').text
+        return self.spec.min_lon
 
     def getMaxLon(self):
-        """
-        Returns
-        -------
-        NoneType
-            'None' if 'info.find('.//MaxLongitude')' is None
-        str
-            Otherwise 'info.find('.//MaxLongitude').text'
-        """
-        for info in self.root.iter('extents'):
-            if info.find('.//MaxLongitude') is None:
-                return None
-            else:
-                return info.find('.//MaxLongitude').text
+        return self.spec.max_lon
 
     def getResolution(self):
-        """
-        Returns
-        -------
-        NoneType
-            'None' if 'info.find('.//OutputResolution')' is None
-        str
-            Otherwise 'info.find('.//OutputResolution').text'
-        """
-        for info in self.root.iter('OutputOptions'):
-            if info.find('.//OutputResolution') is None:
-                return None
-            else:
-                return info.find('.//OutputResolution').text
+        return self.spec.resolution
 
     def getGridInterval(self):
-        """
-        Returns
-        -------
-        NoneType
-            'None' if 'info.find('.//interval')' is None
-        str
-            Otherwise 'info.find('.//interval').text'
-        """
-        for info in self.root.iter('grid'):
-            if info.find('.//interval') is None:
-                return None
-            else:
-                return info.find('.//interval').text
+        return self.spec.grid_interval
 
     def getOutBit(self):
-        """
-        Returns
-        -------
-        str
-            'input' if 'info.find('.//BitType')' is None,
-            otherwise 'info.find('.//BitType').text'
-        """
-        for info in self.root.findall('.//OutputType'):
-            if info.find('.//BitType') is None:
-                return 'input'
-            else:
-                return info.find('.//BitType').text
+        return self.spec.out_bit
 
     def getOutFormat(self):
-        """
-        Returns
-        -------
-        str
-            outputFormat
-        """
-        for info in self.root.findall('.//OutputType'):
-            outputFormat = info.find('.//Format').text
-            return outputFormat
+        return self.spec.out_format
 
     def STR_Type(self):
-        """
-        Returns
-        -------
-        NoneType
-            None
-        str
-            'StretchPercent', 'HistogramEqualization', 'GaussStretch',
-            "SigmaStretch'
-        """
-        for info in self.root.findall('.//Process'):
-            if info.find('.//stretch') is None:
-                return None
-            elif info.find('.//StretchPercent') is not None:
-                return 'StretchPercent'
-            elif info.find('.//HistogramEqualization') is not None:
-                return 'HistogramEqualization'
-            elif info.find('.//GaussStretch') is not None:
-                return 'GaussStretch'
-            elif info.find('.//SigmaStretch') is not None:
-                return 'SigmaStretch'
+        return self.spec.stretch_type
 
     def STR_PercentMin(self):
-        """
-        Returns
-        -------
-        NoneType
-            None
-        str
-            info.find('.//min').text
-        """
-        for info in self.root.findall('.//Process'):
-            if info.find('.//min') is None:
-                return None
-            else:
-                return info.find('.//min').text
+        return self.spec.stretch_min
 
     def STR_PercentMax(self):
-        """
-        Returns
-        -------
-        NoneType
-            None
-        str
-            info.find('.//max').text
-        """
-        for info in self.root.findall('.//Process'):
-            if info.find('.//max') is None:
-                return None
-            else:
-                return info.find('.//max').text
+        return self.spec.stretch_max
 
     def STR_GaussSigma(self):
-        """
-        Returns
-        -------
-        str
-            info.find('.//gsigma').text
-        """
-        for info in self.root.findall('.//Process'):
-            return info.find('.//gsigma').text
+        return self.spec.gauss_sigma
 
     def STR_SigmaVariance(self):
-        """
-        Returns
-        -------
-        str
-            info.find('.//variance').text
-        """
-        for info in self.root.findall('.//Process'):
-            return info.find('.//variance').text
-
-    def getBand(self):
-        for info in self.root.iter('bands'):
-            testband = info.findall('.//bandfilter')
-            print(len(testband))
-            for test in testband:
-                print("test")
-                print(test.text)
+        return self.spec.sigma_variance
 
     def getFileListWB(self):
         """
         Returns
         -------
         list
-            listArray
+            The ImageUrl files, with their bands
         """
-        listArray = []
-        for info in self.root.iter('ImageUrl'):
-            fileUrl = info.find('url').text
-            testband = info.findall('.//bandfilter')
-            if len(testband) == 1:
-                fileout = fileUrl + "+" + testband[0].text
-            elif len(testband) == 3:
-                fileout = fileUrl + "+" + \
-                    testband[0].text + "," + \
-                    testband[1].text + "," + testband[2].text
-            else:
-                fileout = fileUrl
-
-            listArray.append(fileout)
-
-        return listArray
+        return [file_entry(job_file) for job_file in self.spec.url_files]
 
     def getMFileListWB(self):
         """
         Returns
         -------
         list
-            listArray
+            The ImageList files, with their bands
         """
-        listArray = []
-        for info in self.root.iter('ImageList'):
-            Mfile = info.find('.//internalpath').text
-            testband = info.findall('.//band')
-            if len(testband) == 1:
-                fileout = Mfile + "+" + testband[0].text
-            elif len(testband) == 3:
-                fileout = Mfile + "+" + \
-                    testband[0].text + "," + \
-                    testband[1].text + "," + testband[2].text
-            else:
-                fileout = Mfile
-
-            listArray.append(fileout)
-
-        return listArray
+        return [file_entry(job_file) for job_file in self.spec.map_files]
 
     def getFileList(self):
         """
         Returns
         -------
         list
-            listArray
+            The ImageUrl urls
         """
-        listArray = []
-        for info in self.root.iter('ImageUrl'):
-            fileUrl = info.find('url').text
-            listArray.append(fileUrl)
+        return [job_file.path for job_file in self.spec.url_files]
+
+
+def clean_name(spec, pds_info):
+    """ Get the internally consistent representation of the instrument name.
+
+    Searches the PDSinfo dict for the 'clean name' that matches the recipes.  This function essentially
+    maps URL->file path->internally consistent name.
+
+    Parameters
+    ----------
+    spec : JobSpec
+    pds_info : dict
+        PDSinfo.json
+
+    Returns
+    -------
+    str
+    """
+    # @TODO Fix after refactor
+    # NOTE: I know this is really, really bad.  We're kind of backed into a corner here,
+    #  and partial string matching on a value-based lookup of a nested dict is the temporary solution.
+
+    # Get any file listed.  Assumes that all files are from the same instrument
+    file_name = spec.url_files[0].path
+    file_name = file_name.replace('http://pdsimage.wr.usgs.gov/Missions/', archive_base)
+
+    candidates = []
+
+    for key in pds_info:
+        if file_name.startswith(pds_info[key]['path']):
+            candidates.append(key)
+
+    # try to filter list based on upc_reqs.  If upc_reqs isn't specified, just skip the filtering step
+    # ps can't use 'filter' because not all elements have upc_reqs, so they may raise exceptions.
+    for item in candidates:
+        try:
+            if not all(x in file_name for x in pds_info[item]['upc_reqs']):
+                candidates.remove(item)
+        except KeyError:
+            # Intentionally left blank.  Unspecified upc_reqs is valid -- there's just nothing to do for those elements
+            pass
+
+    # If multiple candidates still exist, then it is not possible to uniquely identify the clean name
+    if len(candidates) > 1:
+        raise(RuntimeError('Multiple candidates found for {} with no resolvable clean name'.format(file_name)))
 
-        return listArray
+    try:
+        return candidates[0]
+    except IndexError:
+        raise(KeyError('No key found in PDSInfo dict for path {}'.format(file_name)))
 
 
 class Args(object):
@@ -577,6 +241,203 @@ class Args(object):
         self.key = args.key
         self.namespace = args.namespace
 
+def build_recipe(spec, recipe_file, section, label, MAPfile):
+    """ Steps of a POW or MAP2 job: the recipe's, then the stretch, bit
+    type, grid and output format steps the job asks for.
+
+    Parameters
+    ----------
+    spec : JobSpec
+    recipe_file : str
+    section : str
+        'pow' or 'map'
+    label : PVLModule
+        Label of one of the job's input cubes (MAP2)
+    MAPfile : str
+        Map file for cam2map/map2map
+
+    Returns
+    -------
+    list
+        (process name, Process2JSON) of each step, in order
+    """
+    recipeOBJ = Recipe()
+    recipeOBJ.AddJsonFile(recipe_file, section)
+    # Test for stretch and add to recipe
+    # if MAP2 and 8 or 16 bit run stretch to set range
+
+    if spec.out_bit == 'input':
+        testBitType = str(label['IsisCube']['Core']['Pixels']['Type']).upper()
+    else:
+        testBitType = spec.out_bit.upper()
+
+    if spec.process == 'MAP2' and spec.stretch_type is None:
+        if str(label['IsisCube']['Core']['Pixels']['Type']).upper() != spec.out_bit.upper() and str(label['IsisCube']['Core']['Pixels']['Type']).upper() != 'REAL':
+            if str(label['IsisCube']['Core']['Pixels']['Type']).upper() == 'SIGNEDWORD':
+                strpairs = '0:-32765 0:-32765 100:32765 100:32765'
+            elif str(label['IsisCube']['Core']['Pixels']['Type']).upper() == 'UNSIGNEDBYTE':
+                strpairs = '0:1 0:1 100:254 100:254'
+
+            STRprocessOBJ = Process()
+            STRprocessOBJ.newProcess('stretch')
+            STRprocessOBJ.AddParameter('from_', 'value')
+            STRprocessOBJ.AddParameter('to', 'value')
+            STRprocessOBJ.AddParameter('usepercentages', 'yes')
+            STRprocessOBJ.AddParameter('pairs', strpairs)
+            recipeOBJ.AddProcess(STRprocessOBJ.getProcess())
+
+    strType = spec.stretch_type
+    if strType == 'StretchPercent' and spec.stretch_min is not None and spec.stretch_max is not None and testBitType != 'REAL':
+        if spec.stretch_min != 0 and spec.stretch_max != 100:
+            if testBitType == 'UNSIGNEDBYTE':
+                strpairs = '0:1 {}:1 {}:254 100:254'.format(spec.stretch_min, spec.stretch_max)
+            elif testBitType == 'SIGNEDWORD':
+                strpairs = '0:-32765 {}:-32765 {}:32765 100:32765'.format(spec.stretch_min,
+                                                                         spec.stretch_max)
+
+            STRprocessOBJ = Process()
+            STRprocessOBJ.newProcess('stretch')
+            STRprocessOBJ.AddParameter('from_', 'value')
+            STRprocessOBJ.AddParameter('to', 'value')
+            STRprocessOBJ.AddParameter('usepercentages', 'yes')
+            STRprocessOBJ.AddParameter('pairs', strpairs)
+            recipeOBJ.AddProcess(STRprocessOBJ.getProcess())
+
+    elif strType == 'GaussStretch':
+        STRprocessOBJ = Process()
+        STRprocessOBJ.newProcess('gaussstretch')
+        STRprocessOBJ.AddParameter('from_', 'value')
+        STRprocessOBJ.AddParameter('to', 'value')
+        STRprocessOBJ.AddParameter('gsigma', spec.gauss_sigma)
+        recipeOBJ.AddProcess(STRprocessOBJ.getProcess())
+
+    elif strType == 'HistogramEqualization':
+        STRprocessOBJ = Process()
+        STRprocessOBJ.newProcess('histeq')
+        STRprocessOBJ.AddParameter('from_', 'value')
+        STRprocessOBJ.AddParameter('to', 'value')
+        if spec.stretch_min is None:
+            STRprocessOBJ.AddParameter('minper', '0')
+        else:
+            STRprocessOBJ.AddParameter('minper', spec.stretch_min)
+        if spec.stretch_max is None:
+            STRprocessOBJ.AddParameter('maxper', '100')
+        else:
+            STRprocessOBJ.AddParameter('maxper', spec.stretch_max)
+        recipeOBJ.AddProcess(STRprocessOBJ.getProcess())
+
+    elif strType == 'SigmaStretch':
+        STRprocessOBJ = Process()
+        STRprocessOBJ.newProcess('sigmastretch')
+        STRprocessOBJ.AddParameter('from_', 'value')
+        STRprocessOBJ.AddParameter('to', 'value')
+        STRprocessOBJ.AddParameter('variance', spec.sigma_variance)
+        recipeOBJ.AddProcess(STRprocessOBJ.getProcess())
+
+
+    # Test for output bit type and add to recipe
+    if spec.process == 'POW':
+        if spec.out_bit.upper() == 'UNSIGNEDBYTE' or spec.out_bit.upper() == 'SIGNEDWORD':
+            CAprocessOBJ = Process()
+            CAprocessOBJ.newProcess('cubeatt-bit')
+            CAprocessOBJ.AddParameter('from_', 'value')
+            CAprocessOBJ.AddParameter('to', 'value')
+            recipeOBJ.AddProcess(CAprocessOBJ.getProcess())
+    elif spec.process == 'MAP2':
+        if spec.out_bit.upper() != 'INPUT':
+            if spec.out_bit.upper() == 'UNSIGNEDBYTE' or spec.out_bit.upper() == 'SIGNEDWORD':
+                if str(label['IsisCube']['Core']['Pixels']['Type']).upper() != spec.out_bit.upper():
+                    CAprocessOBJ = Process()
+                    CAprocessOBJ.newProcess('cubeatt-bit')
+                    CAprocessOBJ.AddParameter('from_', 'value')
+                    CAprocessOBJ.AddParameter('to', 'value')
+                    recipeOBJ.AddProcess(CAprocessOBJ.getProcess())
+
+    # Add Grid(MAP2)
+    if spec.grid_interval is not None:
+        GprocessOBJ = Process()
+        GprocessOBJ.newProcess('grid')
+        GprocessOBJ.AddParameter('from_', 'value')
+        GprocessOBJ.AddParameter('to', 'value')
+        GprocessOBJ.AddParameter('latinc', spec.grid_interval)
+        GprocessOBJ.AddParameter('loninc', spec.grid_interval)
+        GprocessOBJ.AddParameter('outline', 'yes')
+        GprocessOBJ.AddParameter('boundary', 'yes')
+        GprocessOBJ.AddParameter('linewidth', '3')
+        recipeOBJ.AddProcess(GprocessOBJ.getProcess())
+
+    # OUTPUT FORMAT
+    # Test for GDAL and add to recipe
+    Oformat = spec.out_format
+    if Oformat == 'GeoTiff-BigTiff' or Oformat == 'GeoJPEG-2000' or Oformat == 'JPEG' or Oformat == 'PNG':
+        if Oformat == 'GeoJPEG-2000':
+            Oformat = 'JP2KAK'
+        if Oformat == 'GeoTiff-BigTiff':
+            Oformat = 'GTiff'
+        GDALprocessOBJ = Process()
+        # @TODO remove hard-coded path in favor of using whichever utilities are found within the conda environment --
+        #  we need more information here to ensure that whichever utilities are found are capable of supporting GeoJPEG-2000.
+        GDALprocessOBJ.newProcess('/usgs/apps/anaconda/bin/gdal_translate')
+        if spec.out_bit != 'input':
+            GDALprocessOBJ.AddParameter(
+                '-ot', GDALprocessOBJ.GDAL_OBit(spec.out_bit))
+        GDALprocessOBJ.AddParameter('-of', Oformat)
+
+        if Oformat == 'GTiff' or Oformat == 'JP2KAK' or Oformat == 'JPEG':
+            GDALprocessOBJ.AddParameter(
+                '-co', GDALprocessOBJ.GDAL_Creation(Oformat))
+
+        recipeOBJ.AddProcess(GDALprocessOBJ.getProcess())
+    # set up pds2isis and add to recipe
+    elif Oformat == 'PDS':
+        pdsProcessOBJ = Process()
+        pdsProcessOBJ.newProcess('isis2pds')
+        pdsProcessOBJ.AddParameter('from_', 'value')
+        pdsProcessOBJ.AddParameter('to', 'value')
+        if spec.out_bit == 'unsignedbyte':
+            pdsProcessOBJ.AddParameter('bittype', '8bit')
+        elif spec.out_bit == 'signedword':
+            pdsProcessOBJ.AddParameter('bittype', 's16bit')
+
+        recipeOBJ.AddProcess(pdsProcessOBJ.getProcess())
+
+    steps = []
+    for item in recipeOBJ.getProcesses():
+        processOBJ = Process()
+        processOBJ.ProcessFromRecipe(item, recipeOBJ.getRecipe())
+
+        if item == 'cam2map':
+
+            processOBJ.updateParameter('map', MAPfile)
+
+            if spec.resolution is None:
+                processOBJ.updateParameter('pixres', 'CAMERA')
+            else:
+                processOBJ.updateParameter('pixres', 'MAP')
+
+            if spec.range_type is None:
+                processOBJ.updateParameter('defaultrange', 'MINIMIZE')
+            elif spec.range_type == 'smart' or spec.range_type == 'fill':
+                processOBJ.updateParameter('defaultrange', 'CAMERA')
+                processOBJ.AddParameter('trim', 'YES')
+
+        elif item == 'map2map':
+            processOBJ.updateParameter('map', MAPfile)
+            if spec.resolution is None:
+                processOBJ.updateParameter('pixres', 'FROM')
+            else:
+                processOBJ.updateParameter('pixres', 'MAP')
+
+            if spec.output_geometry:
+                processOBJ.updateParameter('defaultrange', 'MAP')
+                processOBJ.AddParameter('trim', 'YES')
+            else:
+                processOBJ.updateParameter('defaultrange', 'FROM')
+
+        steps.append((item, processOBJ.Process2JSON()))
+    return steps
+
+
 def main():
     args = Args()
     args.parse_args()
@@ -610,7 +471,12 @@ def main():
 
     logger.info('Starting Process')
 
-    xmlOBJ = jobXML(DBQO.jobXML4Key(key))
+    try:
+        xmlOBJ = jobXML(DBQO.jobXML4Key(key))
+    except ValueError as e:
+        logger.error('Invalid job %s: %s', key, e)
+        exit(1)
+    spec = xmlOBJ.spec
 
     # Make directory if it doesn't exist
     directory = scratch + key
@@ -626,15 +492,15 @@ def main():
     RedisErrorH = RedisHash(key + '_error')
     RedisErrorH.RemoveAll()
     RedisH_DICT = {}
-    RedisH_DICT['service'] = xmlOBJ.getProcess()
-    RedisH_DICT['fileformat'] = xmlOBJ.getOutFormat()
-    RedisH_DICT['outbit'] = xmlOBJ.getOutBit()
-    if xmlOBJ.getRangeType() is not None:
-        RedisH_DICT['grtype'] = xmlOBJ.getRangeType()
-        RedisH_DICT['minlat'] = xmlOBJ.getMinLat()
-        RedisH_DICT['maxlat'] = xmlOBJ.getMaxLat()
-        RedisH_DICT['minlon'] = xmlOBJ.getMinLon()
-        RedisH_DICT['maxlon'] = xmlOBJ.getMaxLon()
+    RedisH_DICT['service'] = spec.process
+    RedisH_DICT['fileformat'] = spec.out_format
+    RedisH_DICT['outbit'] = spec.out_bit
+    if spec.range_type is not None:
+        RedisH_DICT['grtype'] = spec.range_type
+        RedisH_DICT['minlat'] = spec.min_lat
+        RedisH_DICT['maxlat'] = spec.max_lat
+        RedisH_DICT['minlon'] = spec.min_lon
+        RedisH_DICT['maxlon'] = spec.max_lon
 
     if RedisH.IsInHash('service'):
         pass
@@ -658,30 +524,29 @@ def main():
     RQ_zip = RedisQueue(key + '_ZIP', namespace)
     RQ_zip.RemoveAll()
 
-    if xmlOBJ.getProcess() == 'POW':
-        fileList = xmlOBJ.getFileListWB()
-    elif xmlOBJ.getProcess() == 'MAP2':
-        fileList = xmlOBJ.getMFileListWB()
+    fileList = job_files(spec)
 
+    label = None
+    inputFiles = []
     for List_file in fileList:
 
         # Input and output file naming and path stuff
-        if xmlOBJ.getProcess() == 'POW':
-            if xmlOBJ.getInst() == 'THEMIS_IR':
+        if spec.process == 'POW':
+            if spec.instrument == 'THEMIS_IR':
                 Input_file = List_file.replace('odtie1_', 'odtir1_')
                 Input_file = Input_file.replace('xxedr', 'xxrdr')
                 Input_file = Input_file.replace('EDR.QUB', 'RDR.QUB')
                 Input_file = Input_file.replace(
                     'http://pdsimage.wr.usgs.gov/Missions/', archive_base)
-            elif xmlOBJ.getInst() == 'ISSNA':
+            elif spec.instrument == 'ISSNA':
                 Input_file = List_file.replace('.IMG', '.LBL')
                 Input_file = Input_file.replace(
                     'http://pdsimage.wr.usgs.gov/Missions/', archive_base)
-            elif xmlOBJ.getInst() == 'ISSWA':
+            elif spec.instrument == 'ISSWA':
                 Input_file = List_file.replace('.IMG', '.LBL')
                 Input_file = Input_file.replace(
                     'http://pdsimage.wr.usgs.gov/Missions/', archive_base)
-            elif xmlOBJ.getInst() == 'SOLID STATE IMAGING SYSTEM':
+            elif spec.instrument == 'SOLID STATE IMAGING SYSTEM':
                 Input_file = List_file.replace('.img', '.lbl')
                 Input_file = Input_file.replace(
                     'http://pdsimage.wr.usgs.gov/Missions/', archive_base)
@@ -689,7 +554,7 @@ def main():
                 Input_file = List_file.replace(
                     'http://pdsimage.wr.usgs.gov/Missions/', archive_base)
 
-        elif xmlOBJ.getProcess() == 'MAP2':
+        elif spec.process == 'MAP2':
             Input_file = List_file.replace('file://pds_san', '/pds_san')
 
             if '+' in Input_file:
@@ -697,32 +562,61 @@ def main():
                 tempFile = tempsplit[0]
             else:
                 tempFile = Input_file
-            label = pvl.load(tempFile)
     # Output final file naming
             Tbasename = os.path.splitext(os.path.basename(tempFile))[0]
             splitBase = Tbasename.split('_')
 
-            labP = xmlOBJ.getProjection()
+            labP = spec.projection
             if labP == 'INPUT':
+                label = load_label(tempFile)
                 lab_proj = label['IsisCube']['Mapping']['ProjectionName'][0:4]
             else:
                 lab_proj = labP[0:4]
 
-            if xmlOBJ.getClat() is None or xmlOBJ.getClon() is None:
+            if spec.center_latitude is None or spec.center_longitude is None:
                 basefinal = splitBase[0] + splitBase[1] + \
                     splitBase[2] + '_MAP2_' + lab_proj.upper()
             else:
-                lab_clat = float(xmlOBJ.getClat())
+                lab_clat = spec.center_latitude
                 if lab_clat >= 0:
                     labH = 'N'
                 elif lab_clat < 0:
                     labH = 'S'
-                lab_clon = float(xmlOBJ.getClon())
+                lab_clon = spec.center_longitude
 
                 basefinal = splitBase[0] + splitBase[1] + splitBase[2] + '_MAP2_' + str(
                     lab_clat) + labH + str(lab_clon) + '_' + lab_proj.upper()
             RedisH.MAPname(basefinal)
 
+        inputFiles.append(Input_file)
+    if spec.process == 'MAP2':
+        # The map and recipe are set up from the last file's label
+        label = load_label(tempFile)
+
+    # Files outside the requested extent are left out, and the others given
+    #  their ground range, from their footprints in UPC, rather than each
+    #  array task running camrange to find out
+    RedisRangeH = RedisHash(key + '_range')
+    RedisRangeH.RemoveAll()
+    ranges = {}
+    if prefilter(spec):
+        upc_session, upc_engine = db_connect(upc_db)
+        try:
+            ranges = job_ranges(upc_session, inputFiles, spec)
+        except Exception as e:
+            logger.warn('Footprint lookup failed, leaving ground ranges to camrange: %s', e)
+        finally:
+            upc_session.close()
+            upc_engine.dispose()
+
+    for Input_file in inputFiles:
+        basename = os.path.splitext(os.path.basename(Input_file))[0]
+        if Input_file in ranges:
+            if ranges[Input_file] is None:
+                RedisErrorH.addError(basename, OUTSIDE_EXTENT)
+                logger.info('File %s Outside Extent Range', Input_file)
+                continue
+            RedisRangeH.addRange(basename, ranges[Input_file])
         try:
             RQ_file.QueueAdd(Input_file)
             logger.info('File %s Added to Redis Queue', Input_file)
@@ -736,44 +630,10 @@ def main():
     logger.info('Making Map File')
     mapOBJ = MakeMap()
 
-    if xmlOBJ.getProcess() == 'MAP2' and xmlOBJ.getProjection() == 'INPUT':
+    proj = None
+    if spec.process == 'MAP2' and spec.projection == 'INPUT':
         proj = label['IsisCube']['Mapping']['ProjectionName']
-        mapOBJ.Projection(proj)
-    else:
-        mapOBJ.Projection(xmlOBJ.getProjection())
-
-    if xmlOBJ.getClon() is not None:
-        mapOBJ.CLon(float(xmlOBJ.getClon()))
-    if xmlOBJ.getClat() is not None:
-        mapOBJ.CLat(float(xmlOBJ.getClat()))
-    if xmlOBJ.getFirstParallel() is not None:
-        mapOBJ.FirstParallel(float(xmlOBJ.getFirstParallel()))
-    if xmlOBJ.getSecondParallel() is not None:
-        mapOBJ.SecondParallel(float(xmlOBJ.getSecondParallel()))
-    if xmlOBJ.getResolution() is not None:
-        mapOBJ.PixelRes(float(xmlOBJ.getResolution()))
-    if xmlOBJ.getTargetName() is not None:
-        mapOBJ.Target(xmlOBJ.getTargetName())
-    if xmlOBJ.getERadius() is not None:
-        mapOBJ.ERadius(float(xmlOBJ.getERadius()))
-    if xmlOBJ.getPRadius() is not None:
-        mapOBJ.PRadius(float(xmlOBJ.getPRadius()))
-    if xmlOBJ.getLatType() is not None:
-        mapOBJ.LatType(xmlOBJ.getLatType())
-    if xmlOBJ.getLonDirection() is not None:
-        mapOBJ.LonDirection(xmlOBJ.getLonDirection())
-    if xmlOBJ.getLonDomain() is not None:
-        mapOBJ.LonDomain(int(xmlOBJ.getLonDomain()))
-
-    if xmlOBJ.getProcess() == 'MAP2':
-        if xmlOBJ.getMinLat() is not None:
-            mapOBJ.MinLat(float(xmlOBJ.getMinLat()))
-        if xmlOBJ.getMaxLat() is not None:
-            mapOBJ.MaxLat(float(xmlOBJ.getMaxLat()))
-        if xmlOBJ.getMinLon() is not None:
-            mapOBJ.MinLon(float(xmlOBJ.getMinLon()))
-        if xmlOBJ.getMaxLon() is not None:
-            mapOBJ.MaxLon(float(xmlOBJ.getMaxLon()))
+    mapOBJ.FromJobSpec(spec, proj)
 
     mapOBJ.Map2pvl()
 
@@ -790,199 +650,44 @@ def main():
     # ** End Map Template Stuff **
 
     logger.info('Building Recipe')
-    recipeOBJ = Recipe()
-    if xmlOBJ.getProcess() == 'POW':
-        recipeOBJ.AddJsonFile(recipe_base + xmlOBJ.getCleanName() + '.json', "pow")
-    elif xmlOBJ.getProcess() == 'MAP2':
-        recipeOBJ.AddJsonFile(recipe_base + "map2_process.json", "map")
-    # Test for stretch and add to recipe
-    # if MAP2 and 8 or 16 bit run stretch to set range
-
-    if xmlOBJ.getOutBit() == 'input':
-        testBitType = str(label['IsisCube']['Core']['Pixels']['Type']).upper()
-    else:
-        testBitType = xmlOBJ.getOutBit().upper()
-
-    if xmlOBJ.getProcess() == 'MAP2' and xmlOBJ.STR_Type() is None:
-        if str(label['IsisCube']['Core']['Pixels']['Type']).upper() != xmlOBJ.getOutBit().upper() and str(label['IsisCube']['Core']['Pixels']['Type']).upper() != 'REAL':
-            if str(label['IsisCube']['Core']['Pixels']['Type']).upper() == 'SIGNEDWORD':
-                strpairs = '0:-32765 0:-32765 100:32765 100:32765'
-            elif str(label['IsisCube']['Core']['Pixels']['Type']).upper() == 'UNSIGNEDBYTE':
-                strpairs = '0:1 0:1 100:254 100:254'
-
-            STRprocessOBJ = Process()
-            STRprocessOBJ.newProcess('stretch')
-            STRprocessOBJ.AddParameter('from_', 'value')
-            STRprocessOBJ.AddParameter('to', 'value')
-            STRprocessOBJ.AddParameter('usepercentages', 'yes')
-            STRprocessOBJ.AddParameter('pairs', strpairs)
-            recipeOBJ.AddProcess(STRprocessOBJ.getProcess())
-
-    strType = xmlOBJ.STR_Type()
-    if strType == 'StretchPercent' and xmlOBJ.STR_PercentMin() is not None and xmlOBJ.STR_PercentMax() is not None and testBitType != 'REAL':
-        if float(xmlOBJ.STR_PercentMin()) != 0 and float(xmlOBJ.STR_PercentMax()) != 100:
-            if testBitType == 'UNSIGNEDBYTE':
-                strpairs = '0:1 ' + xmlOBJ.STR_PercentMin() + ':1 ' + \
-                    xmlOBJ.STR_PercentMax() + ':254 100:254'
-            elif testBitType == 'SIGNEDWORD':
-                strpairs = '0:-32765 ' + xmlOBJ.STR_PercentMin() + ':-32765 ' + \
-                    xmlOBJ.STR_PercentMax() + ':32765 100:32765'
-
-            STRprocessOBJ = Process()
-            STRprocessOBJ.newProcess('stretch')
-            STRprocessOBJ.AddParameter('from_', 'value')
-            STRprocessOBJ.AddParameter('to', 'value')
-            STRprocessOBJ.AddParameter('usepercentages', 'yes')
-            STRprocessOBJ.AddParameter('pairs', strpairs)
-            recipeOBJ.AddProcess(STRprocessOBJ.getProcess())
-
-    elif strType == 'GaussStretch':
-        STRprocessOBJ = Process()
-        STRprocessOBJ.newProcess('gaussstretch')
-        STRprocessOBJ.AddParameter('from_', 'value')
-        STRprocessOBJ.AddParameter('to', 'value')
-        STRprocessOBJ.AddParameter('gsigma', xmlOBJ.STR_GaussSigma())
-        recipeOBJ.AddProcess(STRprocessOBJ.getProcess())
-
-    elif strType == 'HistogramEqualization':
-        STRprocessOBJ = Process()
-        STRprocessOBJ.newProcess('histeq')
-        STRprocessOBJ.AddParameter('from_', 'value')
-        STRprocessOBJ.AddParameter('to', 'value')
-        if xmlOBJ.STR_PercentMin() is None:
-            STRprocessOBJ.AddParameter('minper', '0')
-        else:
-            STRprocessOBJ.AddParameter('minper', xmlOBJ.STR_PercentMin())
-        if xmlOBJ.STR_PercentMax() is None:
-            STRprocessOBJ.AddParameter('maxper', '100')
-        else:
-            STRprocessOBJ.AddParameter('maxper', xmlOBJ.STR_PercentMax())
-        recipeOBJ.AddProcess(STRprocessOBJ.getProcess())
-
-    elif strType == 'SigmaStretch':
-        STRprocessOBJ = Process()
-        STRprocessOBJ.newProcess('sigmastretch')
-        STRprocessOBJ.AddParameter('from_', 'value')
-        STRprocessOBJ.AddParameter('to', 'value')
-        STRprocessOBJ.AddParameter('variance', xmlOBJ.STR_SigmaVariance())
-        recipeOBJ.AddProcess(STRprocessOBJ.getProcess())
-
-
-    # Test for output bit type and add to recipe
-    if xmlOBJ.getProcess() == 'POW':
-        if xmlOBJ.getOutBit().upper() == 'UNSIGNEDBYTE' or xmlOBJ.getOutBit().upper() == 'SIGNEDWORD':
-            CAprocessOBJ = Process()
-            CAprocessOBJ.newProcess('cubeatt-bit')
-            CAprocessOBJ.AddParameter('from_', 'value')
-            CAprocessOBJ.AddParameter('to', 'value')
-            recipeOBJ.AddProcess(CAprocessOBJ.getProcess())
-    elif xmlOBJ.getProcess() == 'MAP2':
-        if xmlOBJ.getOutBit().upper() != 'INPUT':
-            if xmlOBJ.getOutBit().upper() == 'UNSIGNEDBYTE' or xmlOBJ.getOutBit().upper() == 'SIGNEDWORD':
-                if str(label['IsisCube']['Core']['Pixels']['Type']).upper() != xmlOBJ.getOutBit().upper():
-                    CAprocessOBJ = Process()
-                    CAprocessOBJ.newProcess('cubeatt-bit')
-                    CAprocessOBJ.AddParameter('from_', 'value')
-                    CAprocessOBJ.AddParameter('to', 'value')
-                    recipeOBJ.AddProcess(CAprocessOBJ.getProcess())
-
-    # Add Grid(MAP2)
-    if xmlOBJ.getGridInterval() is not None:
-        GprocessOBJ = Process()
-        GprocessOBJ.newProcess('grid')
-        GprocessOBJ.AddParameter('from_', 'value')
-        GprocessOBJ.AddParameter('to', 'value')
-        GprocessOBJ.AddParameter('latinc', xmlOBJ.getGridInterval())
-        GprocessOBJ.AddParameter('loninc', xmlOBJ.getGridInterval())
-        GprocessOBJ.AddParameter('outline', 'yes')
-        GprocessOBJ.AddParameter('boundary', 'yes')
-        GprocessOBJ.AddParameter('linewidth', '3')
-        recipeOBJ.AddProcess(GprocessOBJ.getProcess())
-
-    # OUTPUT FORMAT
-    # Test for GDAL and add to recipe
-    Oformat = xmlOBJ.getOutFormat()
-    if Oformat == 'GeoTiff-BigTiff' or Oformat == 'GeoJPEG-2000' or Oformat == 'JPEG' or Oformat == 'PNG':
-        if Oformat == 'GeoJPEG-2000':
-            Oformat = 'JP2KAK'
-        if Oformat == 'GeoTiff-BigTiff':
-            Oformat = 'GTiff'
-        GDALprocessOBJ = Process()
-        # @TODO remove hard-coded path in favor of using whichever utilities are found within the conda environment --
-        #  we need more information here to ensure that whichever utilities are found are capable of supporting GeoJPEG-2000.
-        GDALprocessOBJ.newProcess('/usgs/apps/anaconda/bin/gdal_translate')
-        if xmlOBJ.getOutBit() != 'input':
-            GDALprocessOBJ.AddParameter(
-                '-ot', GDALprocessOBJ.GDAL_OBit(xmlOBJ.getOutBit()))
-        GDALprocessOBJ.AddParameter('-of', Oformat)
+    if spec.process == 'POW':
+        steps = build_recipe(spec, recipe_base + xmlOBJ.getCleanName() + '.json', 'pow',
+                             label, MAPfile)
+    elif spec.process == 'MAP2':
+        steps = build_recipe(spec, recipe_base + "map2_process.json", 'map', label, MAPfile)
 
-        if Oformat == 'GTiff' or Oformat == 'JP2KAK' or Oformat == 'JPEG':
-            GDALprocessOBJ.AddParameter(
-                '-co', GDALprocessOBJ.GDAL_Creation(Oformat))
-
-        recipeOBJ.AddProcess(GDALprocessOBJ.getProcess())
-    # set up pds2isis and add to recipe
-    elif Oformat == 'PDS':
-        pdsProcessOBJ = Process()
-        pdsProcessOBJ.newProcess('isis2pds')
-        pdsProcessOBJ.AddParameter('from_', 'value')
-        pdsProcessOBJ.AddParameter('to', 'value')
-        if xmlOBJ.getOutBit() == 'unsignedbyte':
-            pdsProcessOBJ.AddParameter('bittype', '8bit')
-        elif xmlOBJ.getOutBit() == 'signedword':
-            pdsProcessOBJ.AddParameter('bittype', 's16bit')
-
-        recipeOBJ.AddProcess(pdsProcessOBJ.getProcess())
-
-    for item in recipeOBJ.getProcesses():
-        processOBJ = Process()
-        processOBJ.ProcessFromRecipe(item, recipeOBJ.getRecipe())
-
-        if item == 'cam2map':
-
-            processOBJ.updateParameter('map', MAPfile)
-
-            if xmlOBJ.getResolution() is None:
-                processOBJ.updateParameter('pixres', 'CAMERA')
-            else:
-                processOBJ.updateParameter('pixres', 'MAP')
-
-            if xmlOBJ.getRangeType() is None:
-                processOBJ.updateParameter('defaultrange', 'MINIMIZE')
-            elif xmlOBJ.getRangeType() == 'smart' or xmlOBJ.getRangeType() == 'fill':
-                processOBJ.updateParameter('defaultrange', 'CAMERA')
-                processOBJ.AddParameter('trim', 'YES')
-
-        elif item == 'map2map':
-            processOBJ.updateParameter('map', MAPfile)
-            if xmlOBJ.getResolution() is None:
-                processOBJ.updateParameter('pixres', 'FROM')
-            else:
-                processOBJ.updateParameter('pixres', 'MAP')
-
-            if xmlOBJ.OutputGeometry() is not None:
-                processOBJ.updateParameter('defaultrange', 'MAP')
-                processOBJ.AddParameter('trim', 'YES')
-            else:
-                processOBJ.updateParameter('defaultrange', 'FROM')
-
-        processJSON = processOBJ.Process2JSON()
+    for item, processJSON in steps:
         try:
             RQ_recipe.QueueAdd(processJSON)
             logger.info('Recipe Element Added to Redis: %s : Success', item)
         except Exception as e:
             logger.warn('Recipe Element NOT Added to Redis: %s', item)
 
+    if RQ_file.QueueSize() == 0:
+        # Every file was outside the extent, so there's nothing to run
+        RedisH.Status('ERROR')
+        RedisQueue('FinalQueue', namespace).QueueAdd(key)
+        logger.info('No Files Inside Extent Range, Key %s Added to Final Queue', key)
+        return
+
     # HPC job stuff
     logger.info('HPC Cluster job Submission Starting')
-    jobOBJ = HPCjob()
+    # Small jobs run on this machine rather than waiting in the slurm queue
+    n_files = RQ_file.QueueSize()
+    run_local = n_files <= int(getattr(config, 'local_job_max_files', 0))
+    if run_local:
+        # In the background, so submission returns as it does with sbatch
+        jobOBJ = HPCjob(get_executor('local', detach=True))
+        logger.info('Running %s files locally', n_files)
+    else:
+        jobOBJ = HPCjob()
     jobOBJ.setJobName(key + '_Service')
     jobOBJ.setStdOut(slurm_log + key + '_%A_%a.out')
     jobOBJ.setStdError(slurm_log + key + '_%A_%a.err')
     jobOBJ.setWallClock('24:00:00')
     jobOBJ.setMemory('24576')
     jobOBJ.setPartition('pds')
-    JAsize = RQ_file.QueueSize()
+    JAsize, files_per_task, task_budget = chunking(n_files)
     jobOBJ.setJobArray(JAsize)
     logger.info('Job Array Size : %s', str(JAsize))
 
@@ -991,11 +696,16 @@ def main():
 
     # Whether or not we use the default namespace, this guarantees that the POW/MAP queues will match the namespace
     #  used in the job manager.
-    if xmlOBJ.getProcess() == 'POW':
+    if spec.process == 'POW':
         cmd = cmd_dir + "POWprocess.py -k {} -n {}".format(key, namespace)
-    elif xmlOBJ.getProcess() == 'MAP2':
+    elif spec.process == 'MAP2':
         cmd = cmd_dir + "MAPprocess.py -k {} -n {}".format(key, namespace)
 
+    if task_budget is not None:
+        # Each task takes files until the queue is empty or its time is up,
+        #  so slow files don't leave others waiting for a task
+        cmd += " --files 0 --time-budget {}".format(int(task_budget))
+        logger.info('Files per task: about %s', files_per_task)
     logger.info('HPC Command: %s', cmd)
     jobOBJ.setCommand(cmd)
 
@@ -1009,10 +719,14 @@ def main():
     except IOError as e:
         logger.error('SBATCH File %s Not Found', SBfile)
 
+    if run_local:
+        # Local tasks can start, and finish the job, as soon as they're run
+        DBQO.setJobsStarted(key)
     try:
         jobOBJ.Run()
         logger.info('Job Submission to HPC: Success')
-        DBQO.setJobsStarted(key)
+        if not run_local:
+            DBQO.setJobsStarted(key)
     except IOError as e:
         logger.error('Jobs NOT Submitted to HPC')
 
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+import os
+import json
+import time
+import errno
+import socket
+import resource
+import subprocess
+
+from pysis.exceptions import ProcessError
+
+from pds_pipelines.config import pds_log
+
+
+def isis_command(name, params):
+    """ Build the command line for an ISIS application.
+
+    Parameters are given the way pysis takes them, so a trailing underscore
+    (e.g. from_) is dropped from the parameter name.
+
+    Parameters
+    ----------
+    name : str
+        ISIS application, e.g. 'spiceinit'
+    params : dict
+        parameter -> value
+
+    Returns
+    -------
+    list
+        argv for subprocess
+    """
+    isisroot = os.environ.get('ISISROOT')
+    if isisroot:
+        cmd = [os.path.join(isisroot, 'bin', name)]
+    else:
+        cmd = [name]
+    for key, value in params.items():
+        cmd.append('{}={}'.format(key.rstrip('_'), value))
+    return cmd
+
+
+def file_size(path):
+    """
+    Parameters
+    ----------
+    path : str
+        File name, possibly with ISIS cube attributes (e.g. 'a.cub+1')
+
+    Returns
+    -------
+    int
+        Size in bytes, or None if there is no such file
+    """
+    if path is None:
+        return None
+    path = str(path).split('+')[0]
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+class StepProfiler(object):
+    """
+    Records the wall time, CPU time, peak memory and input/output sizes of
+    each ISIS step run through run_isis, one JSON object per line, under
+    pds_log + 'profile/'.  profile_report.py aggregates the records.
+
+    Each process writes its own file, so pipelines running in parallel
+    (or on other nodes) never interleave records.
+
+    Attributes
+    ----------
+    stage : str
+        Pipeline the steps belong to, e.g. 'upc', 'pow'
+    path : str
+        File records are appended to
+    inputfile : str
+        Image currently being processed
+    instrument : str
+        Archive/instrument of the image.  If not given, it is taken from
+        the first *2isis step run for the image.
+    """
+
+    def __init__(self, stage):
+        """
+        Parameters
+        ----------
+        stage : str
+        """
+        self.stage = stage
+        self.path = os.path.join(pds_log, 'profile', '{}_{}_{}.jsonl'.format(
+            stage, socket.gethostname(), os.getpid()))
+        self.inputfile = None
+        self.instrument = None
+
+    def item(self, inputfile, instrument=None):
+        """ Start recording steps for a new image.
+
+        Parameters
+        ----------
+        inputfile : str
+        instrument : str
+        """
+        self.inputfile = inputfile
+        self.instrument = instrument
+
+    def record(self, name, params, wall, before, after, returncode):
+        """
+        Parameters
+        ----------
+        name : str
+            ISIS application
+        params : dict
+            Parameters it was run with
+        wall : float
+            Elapsed seconds
+        before : struct_rusage
+            getrusage(RUSAGE_CHILDREN) before the step
+        after : struct_rusage
+            getrusage(RUSAGE_CHILDREN) after the step
+        returncode : int
+        """
+        if self.instrument is None and name.endswith('2isis'):
+            self.instrument = name[:-len('2isis')]
+
+        infile = params.get('from_', params.get('from'))
+        record = {'time': time.time(),
+                  'stage': self.stage,
+                  'instrument': self.instrument,
+                  'file': self.inputfile,
+                  'step': name,
+                  'status': returncode,
+                  'wall': wall,
+                  'user': after.ru_utime - before.ru_utime,
+                  'sys': after.ru_stime - before.ru_stime,
+                  # Largest of any child so far, in kB; exact while a
+                  #  process only runs one step at a time and each new
+                  #  step is the largest, otherwise an upper bound
+                  'maxrss': after.ru_maxrss,
+                  'in_size': file_size(infile),
+                  'out_size': file_size(params.get('to'))}
+
+        # Profiling never fails a step
+        try:
+            try:
+                os.makedirs(os.path.dirname(self.path))
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        except (IOError, OSError):
+            pass
+
+
+def run_isis(name, params, cwd=None, profiler=None):
+    """ Run an ISIS application in its own working directory.
+
+    Unlike calling it through pysis, this does not need the caller to
+    os.chdir() (which is process wide) to keep print.prt and other files an
+    application writes to its working directory out of the way, so several
+    pipelines can run from the same process.
+
+    Parameters
+    ----------
+    name : str
+        ISIS application, e.g. 'spiceinit'
+    params : dict
+        parameter -> value, as passed to pysis
+    cwd : str
+        Working directory for the application
+    profiler : StepProfiler
+        If given, the step's timing and resource use are recorded
+
+    Returns
+    -------
+    bytes
+        The application's standard output
+
+    Raises
+    ------
+    ProcessError
+        If the application exits with a non-zero status
+    """
+    cmd = isis_command(name, params)
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.time()
+    proc = subprocess.Popen(cmd, cwd=cwd,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    stdout, stderr = proc.communicate()
+    if profiler is not None:
+        profiler.record(name, params, time.time() - start, before,
+                        resource.getrusage(resource.RUSAGE_CHILDREN),
+                        proc.returncode)
+    if proc.returncode != 0:
+        raise ProcessError(proc.returncode, cmd, stdout=stdout, stderr=stderr)
+    return stdout
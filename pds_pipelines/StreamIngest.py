@@ -0,0 +1,396 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import stat
+import logging
+import argparse
+import threading
+from queue import Queue
+
+from pds_pipelines.RedisQueue import RedisQueue
+from pds_pipelines.db import db_connect
+from pds_pipelines.IngestProcess import get_checksum, needs_ingest, make_ingest_entry
+from pds_pipelines.models.pds_models import Files
+from pds_pipelines.ConfigCache import load_pds_info
+from pds_pipelines.config import pds_info, pds_log, pds_db
+
+# Sentinel passed between stages to signal the end of the stream
+_DONE = object()
+
+# Larger reads than IngestProcess -- the hash stage is bound by disk/SAN throughput
+HASH_CHUNK = 1024 * 1024
+
+
+class Args(object):
+    """
+    Attributes
+    ----------
+    archive : str
+    volume : str
+    search : str
+    override : bool
+    stat_workers : int
+    hash_workers : int
+    db_workers : int
+    batch_size : int
+    queue_size : int
+    """
+    def __init__(self):
+        pass
+
+    def parse_args(self):
+
+        parser = argparse.ArgumentParser(description='PDS Streaming Ingest')
+
+        parser.add_argument('--archive', '-a', dest="archive", required=True,
+                            help="Enter archive - archive to ingest")
+
+        parser.add_argument('--volume', '-v', dest="volume",
+                            help="Enter volume to Ingest")
+
+        parser.add_argument('--search', '-s', dest="search",
+                            help="Enter string to search for")
+
+        parser.add_argument('--override', dest='override', action='store_true')
+        parser.set_defaults(override=False)
+
+        parser.add_argument('--derived', dest='derived', action='store_true',
+                            help="Queue files for the fused derived products "
+                                 "process instead of UPC, thumbnail and browse")
+        parser.set_defaults(derived=False)
+
+        parser.add_argument('--stat-workers', dest="stat_workers", type=int,
+                            default=4, help="Threads used to stat crawled files")
+
+        parser.add_argument('--hash-workers', dest="hash_workers", type=int,
+                            default=8, help="Threads used to checksum files")
+
+        parser.add_argument('--db-workers', dest="db_workers", type=int,
+                            default=1, help="Database sessions used for upserts")
+
+        parser.add_argument('--batch-size', dest="batch_size", type=int,
+                            default=250, help="Files per database/queue batch")
+
+        parser.add_argument('--queue-size', dest="queue_size", type=int,
+                            default=1000, help="Bound on items held between stages")
+
+        parser.add_argument('--log', '-l', dest="log_level",
+                            choices=['DEBUG', 'INFO', 'WARNING',
+                                     'ERROR', 'CRITICAL'],
+                            help="Set the log level.", default='INFO')
+
+        args = parser.parse_args()
+
+        self.archive = args.archive
+        self.volume = args.volume
+        self.search = args.search
+        self.override = args.override
+        self.derived = args.derived
+        self.stat_workers = max(1, args.stat_workers)
+        self.hash_workers = max(1, args.hash_workers)
+        self.db_workers = max(1, args.db_workers)
+        self.batch_size = max(1, args.batch_size)
+        self.queue_size = args.queue_size
+        self.log_level = args.log_level
+
+
+def crawl(archivepath, search=None, voldescs=None):
+    """ Walk an archive path and yield every file name found.
+
+    Parameters
+    ----------
+    archivepath : str
+        Directory to walk.
+    search : str
+        If given, only paths containing this string are yielded.
+    voldescs : list
+        If given, voldesc.cat files are appended to it for linking.
+
+    Yields
+    ------
+    str
+        Full path of each file.
+    """
+    for dirpath, _, files in os.walk(archivepath):
+        for filename in files:
+            fname = os.path.join(dirpath, filename)
+            if search and search not in fname:
+                continue
+            if voldescs is not None and filename == "voldesc.cat":
+                voldescs.append(fname)
+            yield fname
+
+
+def stat_filter(fname):
+    """ Drop anything that is not a readable regular file.
+
+    Parameters
+    ----------
+    fname : str
+
+    Returns
+    -------
+    tuple or None
+        (fname, size) for regular files, otherwise None
+    """
+    try:
+        st = os.stat(fname)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return fname, st.st_size
+
+
+def hash_file(item):
+    """
+    Parameters
+    ----------
+    item : tuple
+        (fname, size) as produced by stat_filter
+
+    Returns
+    -------
+    tuple
+        (fname, size, checksum)
+    """
+    fname, size = item
+    return fname, size, get_checksum(fname, HASH_CHUNK)
+
+
+def upsert_batch(session, batch, archive, PDSinfoDICT, override):
+    """ Write a batch of hashed files to the files table.
+
+    Uses the same rules as IngestProcess, but resolves existing entries
+    with one query per batch and commits once per batch.
+
+    Parameters
+    ----------
+    session : Session
+    batch : list
+        (fname, size, checksum) tuples
+    archive : str
+    PDSinfoDICT : dict
+    override : bool
+
+    Returns
+    -------
+    list
+        (inputfile, fileid, archive) tuples for files flagged for UPC
+    """
+    archive_path = PDSinfoDICT[archive]['path']
+    subfiles = [fname.replace(archive_path, '') for fname, _, _ in batch]
+
+    existing = {}
+    for QOBJ in session.query(Files).filter(Files.filename.in_(subfiles)):
+        existing.setdefault(QOBJ.filename, QOBJ)
+
+    entries = []
+    for (fname, size, checksum), subfile in zip(batch, subfiles):
+        QOBJ = existing.get(subfile)
+        if not needs_ingest(QOBJ, checksum, override):
+            continue
+        ingest_entry, upcflag = make_ingest_entry(QOBJ, fname, archive, checksum,
+                                                  PDSinfoDICT, override, size)
+        entries.append((fname, session.merge(ingest_entry), upcflag))
+
+    session.flush()
+    upc_items = [(fname, entry.fileid, archive)
+                 for fname, entry, upcflag in entries if upcflag]
+    session.commit()
+    return upc_items
+
+
+def batches(inq, batch_size):
+    """ Group items from a stage queue into lists.
+
+    Parameters
+    ----------
+    inq : Queue
+    batch_size : int
+
+    Yields
+    ------
+    list
+        Up to batch_size items, in arrival order.
+    """
+    batch = []
+    while True:
+        item = inq.get()
+        if item is _DONE:
+            break
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def start_stage(func, inq, outq, workers, consumers, logger, batch_size=None):
+    """ Run func over everything arriving on inq using a pool of threads.
+
+    Items for which func returns None are dropped.  Once every worker has
+    seen the end of its input, one sentinel per downstream consumer is put
+    on outq.
+
+    Parameters
+    ----------
+    func : callable
+    inq : Queue
+    outq : Queue or None
+        Where results go.  None for a terminal stage.
+    workers : int
+        Number of threads for this stage.
+    consumers : int
+        Number of threads reading from outq.
+    logger : Logger
+    batch_size : int
+        If set, func is called on lists of items instead of single items.
+
+    Returns
+    -------
+    Thread
+        Joins once the stage has drained.
+    """
+    def work():
+        if batch_size:
+            source = batches(inq, batch_size)
+        else:
+            source = iter(inq.get, _DONE)
+        for item in source:
+            try:
+                result = func(item)
+            except Exception as e:
+                logger.error('Stage %s failed: %s', func.__name__, str(e))
+                continue
+            if result is not None and outq is not None:
+                outq.put(result)
+
+    threads = [threading.Thread(target=work) for _ in range(max(1, workers))]
+    for t in threads:
+        t.daemon = True
+        t.start()
+
+    def close():
+        for t in threads:
+            t.join()
+        if outq is not None:
+            for _ in range(consumers):
+                outq.put(_DONE)
+
+    closer = threading.Thread(target=close)
+    closer.daemon = True
+    closer.start()
+    return closer
+
+
+def main():
+
+    args = Args()
+    args.parse_args()
+
+    # Set up logging
+    logger = logging.getLogger(args.archive + '_STREAM_INGEST')
+    level = logging.getLevelName(args.log_level)
+    logger.setLevel(level)
+    logFileHandle = logging.FileHandler(pds_log + 'Ingest.log')
+    formatter = logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s, %(message)s')
+    logFileHandle.setFormatter(formatter)
+    logger.addHandler(logFileHandle)
+
+    print("Log File: {}Ingest.log".format(pds_log))
+
+    PDSinfoDICT = load_pds_info(pds_info)
+    try:
+        archivepath = PDSinfoDICT[args.archive]['path'][:-1]
+    except KeyError:
+        print("\nArchive '{}' not found in {}\n".format(args.archive, pds_info))
+        print("The following archives are available:")
+        for k in PDSinfoDICT.keys():
+            print("\t{}".format(k))
+        logger.error("Unable to locate %s", args.archive)
+        return 1
+
+    if args.volume:
+        archivepath = archivepath + '/' + args.volume
+
+    RQ_linking = RedisQueue('LinkQueue')
+    # Queues for the products made from each UPC eligible file
+    if args.derived:
+        RQ_products = [RedisQueue('Derived_ReadyQueue')]
+    else:
+        RQ_products = [RedisQueue('UPC_ReadyQueue'),
+                       RedisQueue('Thumbnail_ReadyQueue'),
+                       RedisQueue('Browse_ReadyQueue')]
+
+    logger.info('Starting Streaming Ingest for: %s', archivepath)
+    for RQ_product in RQ_products:
+        logger.info("Product Queue: %s", RQ_product.id_name)
+
+    # One session per database worker -- sessions are not thread safe
+    sessions = []
+    local = threading.local()
+
+    def upsert(batch):
+        if not hasattr(local, 'session'):
+            local.session, local.engine = db_connect(pds_db)
+            sessions.append((local.session, local.engine))
+        try:
+            return upsert_batch(local.session, batch, args.archive,
+                                PDSinfoDICT, args.override)
+        except Exception as e:
+            local.session.rollback()
+            logger.error("Error During Batch Insert of %s files: %s", len(batch), str(e))
+            return None
+
+    counts = {'queued': 0}
+
+    def enqueue(items):
+        items = [item for batch in items for item in batch]
+        for RQ_product in RQ_products:
+            RQ_product.QueueAddMany(items)
+        counts['queued'] += len(items)
+
+    # crawl -> stat filter -> hash -> db upsert -> enqueue
+    stat_q = Queue(maxsize=args.queue_size)
+    hash_q = Queue(maxsize=args.queue_size)
+    db_q = Queue(maxsize=args.queue_size)
+    enqueue_q = Queue(maxsize=args.queue_size)
+
+    stages = [start_stage(stat_filter, stat_q, hash_q, args.stat_workers,
+                          args.hash_workers, logger),
+              start_stage(hash_file, hash_q, db_q, args.hash_workers,
+                          args.db_workers, logger),
+              start_stage(upsert, db_q, enqueue_q, args.db_workers, 1, logger,
+                          batch_size=args.batch_size),
+              start_stage(enqueue, enqueue_q, None, 1, 0, logger,
+                          batch_size=max(1, args.db_workers))]
+
+    voldescs = []
+    n_crawled = 0
+    for fname in crawl(archivepath, args.search, voldescs):
+        stat_q.put(fname)
+        n_crawled += 1
+    for _ in range(args.stat_workers):
+        stat_q.put(_DONE)
+
+    for stage in stages:
+        stage.join()
+
+    for fpath in voldescs:
+        RQ_linking.QueueAdd((fpath, args.archive))
+
+    for session, engine in sessions:
+        session.close()
+        engine.dispose()
+
+    logger.info('Files crawled: %s', n_crawled)
+    logger.info('Files added to product queues: %s', counts['queued'])
+    logger.info("Streaming Ingest Complete")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+import time
+import math
+
+from pds_pipelines import config
+
+# Seconds an array task may spend starting new files, under the 24 hour
+#  wall clock service jobs are submitted with
+DEFAULT_TASK_BUDGET = 20 * 3600
+
+
+class TaskBudget(object):
+    """
+    Decides whether a service array task (POWprocess/MAPprocess) takes
+    another file from the job's file queue.
+
+    Attributes
+    ----------
+    files : int
+        Most files the task processes, 0 for no limit
+    seconds : float
+        Time after which the task stops taking files, None for no limit.
+        A file is only started if the slowest file so far would still
+        finish within it.
+    count : int
+        Files processed so far
+    """
+
+    def __init__(self, files=1, seconds=None):
+        """
+        Parameters
+        ----------
+        files : int
+        seconds : float
+        """
+        self.files = files
+        self.seconds = seconds
+        self.count = 0
+        self.start = time.time()
+        self.slowest = 0.0
+        self.file_start = None
+
+    def claim(self):
+        """
+        Returns
+        -------
+        bool
+            True if the task should start another file
+        """
+        if self.files and self.count >= self.files:
+            return False
+        now = time.time()
+        if self.seconds is not None and now - self.start + self.slowest > self.seconds:
+            return False
+        self.file_start = now
+        return True
+
+    def done(self):
+        """ Record that the file claimed last has been processed. """
+        self.count += 1
+        if self.file_start is not None:
+            self.slowest = max(self.slowest, time.time() - self.file_start)
+            self.file_start = None
+
+
+def chunking(n_files):
+    """ Size a service job array.
+
+    Each task processes up to config.service_files_per_task files, or, if
+    config.service_file_cost (expected seconds per file) is set, as many
+    as fit in config.service_task_budget seconds.
+
+    Parameters
+    ----------
+    n_files : int
+
+    Returns
+    -------
+    array_size : int
+        Number of array tasks
+    files_per_task : int
+    budget : float
+        Seconds each task may spend taking files, None if tasks process one
+        file each
+    """
+    budget = float(getattr(config, 'service_task_budget', DEFAULT_TASK_BUDGET))
+    cost = getattr(config, 'service_file_cost', None)
+    if cost:
+        files_per_task = max(int(budget // float(cost)), 1)
+    else:
+        files_per_task = max(int(getattr(config, 'service_files_per_task', 1)), 1)
+    if files_per_task == 1:
+        return n_files, 1, None
+    return max(int(math.ceil(n_files / float(files_per_task))), 1), files_per_task, budget
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+
+from sqlalchemy import and_, or_, func
+
+from pds_pipelines import config
+from pds_pipelines.Footprint import parse_wkt
+from pds_pipelines.models.upc_models import MetaTiles, MetaGeometry
+
+# Quadtree levels footprints are tiled at; a level L cell is 360/2**L
+#  degrees of longitude by 180/2**L degrees of latitude
+DEFAULT_LEVELS = (4, 8, 12)
+# A footprint is tiled at the finest level it covers at most this many cells of
+DEFAULT_MAX_CELLS = 16
+# Largest number of cells a search box is expanded to at each level
+QUERY_MAX_CELLS = 256
+
+
+def tile_levels():
+    """
+    Returns
+    -------
+    tuple
+        config.tile_levels, coarsest first
+    """
+    return tuple(sorted(getattr(config, 'tile_levels', DEFAULT_LEVELS)))
+
+
+def cell_id(ix, iy, level):
+    """
+    Parameters
+    ----------
+    ix : int
+        Column, counted east from longitude 0
+    iy : int
+        Row, counted north from latitude -90
+    level : int
+
+    Returns
+    -------
+    int
+        Morton (Z-order) code of the cell.  The cells inside a cell are a
+        contiguous range of codes at every finer level.
+    """
+    code = 0
+    for bit in range(level):
+        code |= ((ix >> bit) & 1) << (2 * bit)
+        code |= ((iy >> bit) & 1) << (2 * bit + 1)
+    return code
+
+
+def _lon_intervals(minx, maxx):
+    """ Split a longitude range into intervals within [0, 360]. """
+    if maxx - minx >= 360:
+        return [(0.0, 360.0)]
+    start = minx % 360.0
+    end = start + (maxx - minx)
+    if end <= 360:
+        return [(start, end)]
+    return [(start, 360.0), (0.0, end - 360.0)]
+
+
+def cover(bbox, level, limit=None):
+    """
+    Parameters
+    ----------
+    bbox : tuple
+        (minlon, minlat, maxlon, maxlat), longitudes in 0/360 or -180/180
+    level : int
+    limit : int
+        Give up if more than this many cells are needed
+
+    Returns
+    -------
+    set
+        Ids of the cells at level that bbox touches, or None if there are
+        more than limit
+    """
+    minx, miny, maxx, maxy = bbox
+    n = 2 ** level
+    dx = 360.0 / n
+    dy = 180.0 / n
+
+    def index(v, size):
+        return min(max(int(v // size), 0), n - 1)
+
+    iy0, iy1 = index(miny + 90, dy), index(maxy + 90, dy)
+    spans = [(index(lo, dx), index(hi, dx)) for lo, hi in _lon_intervals(minx, maxx)]
+    count = sum(ix1 - ix0 + 1 for ix0, ix1 in spans) * (iy1 - iy0 + 1)
+    if limit is not None and count > limit:
+        return None
+
+    cells = set()
+    for ix0, ix1 in spans:
+        for ix in range(ix0, ix1 + 1):
+            for iy in range(iy0, iy1 + 1):
+                cells.add(cell_id(ix, iy, level))
+    return cells
+
+
+def footprint_tiles(footprint, levels=None, max_cells=DEFAULT_MAX_CELLS):
+    """ Cells covering a footprint, at the finest level that needs at most
+    max_cells of them.
+
+    Each polygon of the footprint is covered by its bounding box, so the
+    cells are a superset of the ones the footprint touches.
+
+    Parameters
+    ----------
+    footprint : str
+        POLYGON or MULTIPOLYGON well known text
+    levels : tuple
+        Defaults to tile_levels()
+    max_cells : int
+
+    Returns
+    -------
+    level : int
+        None if footprint isn't a (multi)polygon
+    cells : list
+    """
+    polygons = parse_wkt(footprint)
+    if not polygons:
+        return None, []
+    levels = levels or tile_levels()
+
+    boxes = []
+    for polygon in polygons:
+        xs = [x for x, _ in polygon[0]]
+        ys = [y for _, y in polygon[0]]
+        boxes.append((min(xs), min(ys), max(xs), max(ys)))
+
+    for level in sorted(levels, reverse=True):
+        cells = set()
+        for box in boxes:
+            covered = cover(box, level, max_cells - len(cells))
+            if covered is None:
+                break
+            cells |= covered
+        else:
+            if len(cells) <= max_cells:
+                return level, sorted(cells)
+
+    level = min(levels)
+    cells = set()
+    for box in boxes:
+        cells |= cover(box, level)
+    return level, sorted(cells)
+
+
+def query_ranges(bbox, levels=None, max_cells=QUERY_MAX_CELLS):
+    """ Cell id ranges, at each level footprints are tiled at, that contain
+    every cell a search box touches.
+
+    At fine levels the box is covered with coarser cells, each of which is
+    one contiguous range of fine cell ids, so a large box is still a few
+    index range scans.
+
+    Parameters
+    ----------
+    bbox : tuple
+        (minlon, minlat, maxlon, maxlat)
+    levels : tuple
+        Defaults to tile_levels()
+    max_cells : int
+
+    Returns
+    -------
+    list
+        (level, first cell, last cell) tuples
+    """
+    ranges = []
+    for level in levels or tile_levels():
+        for coarse in range(level, -1, -1):
+            cells = cover(bbox, coarse, max_cells)
+            if cells is not None:
+                break
+        shift = 2 * (level - coarse)
+        current = None
+        for cell in sorted(cells):
+            first, last = cell << shift, ((cell + 1) << shift) - 1
+            if current is not None and first == current[2] + 1:
+                current = (level, current[1], last)
+            else:
+                if current is not None:
+                    ranges.append(current)
+                current = (level, first, last)
+        if current is not None:
+            ranges.append(current)
+    return ranges
+
+
+def tile_rows(upcid, footprint, levels=None, max_cells=DEFAULT_MAX_CELLS):
+    """
+    Parameters
+    ----------
+    upcid : int
+    footprint : str
+    levels : tuple
+    max_cells : int
+
+    Returns
+    -------
+    list
+        MetaTiles rows for footprint
+    """
+    level, cells = footprint_tiles(footprint, levels, max_cells)
+    return [MetaTiles(upcid=upcid, level=level, cell=cell) for cell in cells]
+
+
+def tile_filter(bbox, levels=None):
+    """
+    Parameters
+    ----------
+    bbox : tuple
+        (minlon, minlat, maxlon, maxlat)
+    levels : tuple
+
+    Returns
+    -------
+    ClauseElement
+        Condition on MetaTiles matching the cells bbox touches
+    """
+    return or_(*[and_(MetaTiles.level == level, MetaTiles.cell.between(first, last))
+                 for level, first, last in query_ranges(bbox, levels)])
+
+
+# Search helpers for coverage queries against UPC; the pipelines themselves
+#  only write tiles (UPC_process, tile_backfill)
+def candidate_upcids(session, bbox, levels=None):
+    """
+    Parameters
+    ----------
+    session : Session
+        Session connected to the UPC database
+    bbox : tuple
+        (minlon, minlat, maxlon, maxlat)
+    levels : tuple
+
+    Returns
+    -------
+    Query
+        upcids whose footprint tiles touch bbox; a superset of those whose
+        footprint intersects it
+    """
+    return session.query(MetaTiles.upcid).filter(tile_filter(bbox, levels)).distinct()
+
+
+def footprints_in(session, bbox, footprint_tid, levels=None):
+    """ upcids whose footprint intersects a box, prefiltered by tile.
+
+    Parameters
+    ----------
+    session : Session
+    bbox : tuple
+        (minlon, minlat, maxlon, maxlat), in the longitude domain the
+        footprints are stored in
+    footprint_tid : int
+        typeid of 'isisfootprint'
+    levels : tuple
+
+    Returns
+    -------
+    Query
+        upcids
+    """
+    minx, miny, maxx, maxy = bbox
+    candidates = candidate_upcids(session, bbox, levels).subquery()
+    return session.query(MetaGeometry.upcid).filter(
+        MetaGeometry.typeid == footprint_tid,
+        MetaGeometry.upcid.in_(candidates),
+        func.ST_Intersects(MetaGeometry.value,
+                           func.ST_MakeEnvelope(minx, miny, maxx, maxy)))
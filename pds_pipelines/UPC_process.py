@@ -1,33 +1,46 @@
 #!/usr/bin/env python
-import re
 import os
 import sys
 import datetime
 import logging
-import hashlib
-import json
+import argparse
 from ast import literal_eval
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import pytz
 import pvl
 
-from pysis import isis
 from pysis.exceptions import ProcessError
-from pysis.isis import getsn
 
 from pds_pipelines.RedisLock import RedisLock
 from pds_pipelines.RedisQueue import RedisQueue
 from pds_pipelines.Recipe import Recipe
 from pds_pipelines.Process import Process
-from pds_pipelines.UPCkeywords import UPCkeywords
+from pds_pipelines.UPCkeywords import UPCkeywords, keyword_groups
+from pds_pipelines.UPCregistry import UPCregistry
+from pds_pipelines.UPCwriter import UPCwriter
+from pds_pipelines.StepRunner import run_isis, StepProfiler
+from pds_pipelines.resources import pipeline_slots
+from pds_pipelines.Workarea import Workarea
+from pds_pipelines.CubeCache import get_cube_cache, prefix_length
+from pds_pipelines.Checkpoint import Checkpoint
+from pds_pipelines.Footprint import clean_footprint
+from pds_pipelines.TileKeys import tile_levels, tile_rows
+from pds_pipelines.GroundRange import edr_source
+from pds_pipelines.IngestProcess import get_checksum
 from pds_pipelines.db import db_connect
 from pds_pipelines.models import upc_models, pds_models
 from pds_pipelines.models.upc_models import MetaTime, MetaGeometry, MetaString, MetaBoolean
-from pds_pipelines.config import pds_log, pds_info, workarea, keyword_def, pds_db, upc_db, lock_obj
+from pds_pipelines.ConfigCache import load_pds_info, load_keyword_def
+from pds_pipelines.LabelCache import load_label
+from pds_pipelines import config
+from pds_pipelines.config import pds_log, pds_info, keyword_def, pds_db, upc_db, lock_obj
 
-from sqlalchemy import and_
+# Keywords UPC_process reads directly, on top of Keyword_Definition.json
+UPC_KEYWORDS = ('TargetName', 'InstrumentId', 'IsisId', 'ProductId',
+                'CentroidLongitude', 'CentroidLatitude', 'GisFootprint')
 
-def getISISid(infile):
-    serial_num = getsn(from_=infile)
+def getISISid(infile, cwd=None):
+    serial_num = run_isis('getsn', {'from_': infile}, cwd=cwd)
     # in later versions of getsn, serial_num is returned as bytes
     if isinstance(serial_num, bytes):
         serial_num = serial_num.decode()
@@ -99,479 +112,701 @@ def get_tid(keyword, session):
         return None
 
 
-def main():
-    # Connect to database - ignore engine information
-    pds_session, pds_engine = db_connect(pds_db)
+class Args(object):
+    """
+    Attributes
+    ----------
+    workers : int
+    pipeline_memory : int
+    """
+    def __init__(self):
+        pass
 
-    # Connect to database - ignore engine information
-    session, upc_engine = db_connect(upc_db)
+    def parse_args(self):
+        parser = argparse.ArgumentParser(description="UPC Process")
 
-    # ***************** Set up logging *****************
-    logger = logging.getLogger('UPC_Process')
-    logger.setLevel(logging.INFO)
-    logFileHandle = logging.FileHandler(pds_log + 'Process.log')
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s, %(message)s')
-    logFileHandle.setFormatter(formatter)
-    logger.addHandler(logFileHandle)
+        parser.add_argument('--workers', '-w', dest="workers", type=int,
+                            help="Number of images to process at once. "
+                                 "Defaults to as many as fit in the slurm allocation.")
+        parser.add_argument('--pipeline-memory', dest="pipeline_memory", type=int,
+                            help="Memory in MB one pipeline needs, used to size --workers.",
+                            default=2048)
 
-    PDSinfoDICT = json.load(open(pds_info, 'r'))
+        args = parser.parse_args()
+        self.workers = args.workers
+        self.pipeline_memory = args.pipeline_memory
 
-    # Redis Queue Objects
-    RQ_main = RedisQueue('UPC_ReadyQueue')
-    logger.info("UPC Processing Queue: %s", RQ_main.id_name)
-    RQ_lock = RedisLock(lock_obj)
-    # If the queue isn't registered, add it and set it to "running"
-    RQ_lock.add({RQ_main.id_name: '1'})
 
-    proc_date_tid = get_tid('processdate', session)
-    err_type_tid = get_tid('errortype', session)
-    err_msg_tid = get_tid('errormessage', session)
-    err_flag_tid = get_tid('error', session)
-    isis_footprint_tid = get_tid('isisfootprint', session)
-    isis_centroid_tid = get_tid('isiscentroid', session)
-    start_time_tid = get_tid('starttime', session)
-    stop_time_tid = get_tid('stoptime', session)
-    checksum_tid = get_tid('checksum', session)
-
-    # while there are items in the redis queue
-    while int(RQ_main.QueueSize()) > 0 and RQ_lock.available(RQ_main.id_name):
-        # get a file from the queue
-        item = literal_eval(RQ_main.QueueGet().decode("utf-8"))
+def get_logger(name='UPC_Process'):
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        logger.setLevel(logging.INFO)
+        logFileHandle = logging.FileHandler(pds_log + 'Process.log')
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s, %(message)s')
+        logFileHandle.setFormatter(formatter)
+        logger.addHandler(logFileHandle)
+    return logger
+
+
+class UPCworker(object):
+    """
+    Runs the UPC recipe on one image at a time and writes the results.
+
+    Each pipeline process holds one of these, with its own database
+    connections and lookup tables.  Every image is processed in its own
+    scratch directory (see Workarea), which is removed when it is done, and
+    ISIS applications are run with that directory as their working
+    directory, so any number of workers can share a node.
+
+    If processing an image fails or the job is killed, its directory is
+    kept, and the next attempt at the image resumes after the last recipe
+    step that finished (see Checkpoint).
+    """
+
+    logger_name = 'UPC_Process'
+    stage = 'upc'
+    resumable = True
+
+    def __init__(self):
+        # Connect to database - ignore engine information
+        self.pds_session, self.pds_engine = db_connect(pds_db)
+
+        # Connect to database - ignore engine information
+        self.session, self.upc_engine = db_connect(upc_db)
+
+        self.logger = get_logger(self.logger_name)
+        self.PDSinfoDICT = load_pds_info(pds_info)
+
+        # Keyword, target and instrument lookups are held in memory for the
+        #  life of the worker rather than queried per file
+        self.registry = UPCregistry(self.session)
+        # Meta table rows for an image are collected and written in one transaction
+        self.writer = UPCwriter(self.session)
+        # Converted/spiceinit'ed cubes shared with the thumbnail and browse
+        #  stages, if configured
+        self.cube_cache = get_cube_cache()
+        self.keep_on_failure = getattr(config, 'keep_failed_workarea', False)
+        # Per step timing and resource use, see profile_report.py
+        self.profiler = StepProfiler(self.stage)
+
+        registry = self.registry
+        self.proc_date_tid = registry.getTypeid('processdate')
+        self.err_type_tid = registry.getTypeid('errortype')
+        self.err_msg_tid = registry.getTypeid('errormessage')
+        self.err_flag_tid = registry.getTypeid('error')
+        self.isis_footprint_tid = registry.getTypeid('isisfootprint')
+        self.isis_centroid_tid = registry.getTypeid('isiscentroid')
+        self.footprint_bbox_tid = registry.getTypeid('footprintbbox')
+
+        # Footprint simplification (degrees), coordinate precision (decimal
+        #  places) and antimeridian splitting, see Footprint.clean_footprint
+        self.footprint_tolerance = getattr(config, 'footprint_tolerance', 0)
+        self.footprint_precision = getattr(config, 'footprint_precision', None)
+        self.footprint_split = getattr(config, 'footprint_split', False)
+        # Quadtree levels footprints are tiled at, see TileKeys
+        self.tile_levels = tile_levels()
+        self.start_time_tid = registry.getTypeid('starttime')
+        self.stop_time_tid = registry.getTypeid('stoptime')
+        self.checksum_tid = registry.getTypeid('checksum')
+
+    def process(self, item):
+        """
+        Parameters
+        ----------
+        item : tuple
+            (inputfile, fileid, archive) as queued on UPC_ReadyQueue
+        """
+        inputfile = item[0]
+        if not os.path.isfile(inputfile):
+            print("{} is not a file\n".format(inputfile))
+            return
+
+        # Node local scratch if the image's cubes fit, removed when done
+        workarea = Workarea(inputfile, self.keep_on_failure, self.resumable)
+        scratch = workarea.create()
+        status = 'error'
+        try:
+            status = self.run(item, scratch)
+        finally:
+            # A failed image keeps its intermediates, to resume from
+            workarea.cleanup(failed=status == 'error')
+
+    def run(self, item, scratch):
+        """
+        Parameters
+        ----------
+        item : tuple
+            (inputfile, fileid, archive)
+        scratch : str
+            The image's scratch directory
+
+        Returns
+        -------
+        str
+            'success' or 'error'
+        """
         inputfile = item[0]
         fid = item[1]
         archive = item[2]
-        #inputfile = (RQ_main.QueueGet()).decode('utf-8')
-        if os.path.isfile(inputfile):
-            pass
-        else:
-            print("{} is not a file\n".format(inputfile))
-        if os.path.isfile(inputfile):
-            logger.info('Starting Process: %s', inputfile)
-
-            # @TODO refactor this logic.  We're using an object to find a path, returning it,
-            #  then passing it back to the object so that the object can use it.
-            recipeOBJ = Recipe()
-            recipe_json = recipeOBJ.getRecipeJSON(archive)
-            #recipe_json = recipeOBJ.getRecipeJSON(getMission(str(inputfile)))
-            recipeOBJ.AddJsonFile(recipe_json, 'upc')
-
-            infile = workarea + os.path.splitext(
-                str(os.path.basename(inputfile)))[0] + '.UPCinput.cub'
-            outfile = workarea + os.path.splitext(
-                str(os.path.basename(inputfile)))[0] + '.UPCoutput.cub'
-            caminfoOUT = workarea + os.path.splitext(
-                str(os.path.basename(inputfile)))[0] + '_caminfo.pvl'
-            EDRsource = inputfile.replace(
-                '/pds_san/PDS_Archive/',
-                'https://pdsimage.wr.ugs.gov/Missions/')
-
-            status = 'success'
-            # Iterate through each process listed in the recipe
-            for item in recipeOBJ.getProcesses():
-                # If any of the processes failed, discontinue processing
-                if status.lower() == 'error':
-                    break
-                elif status.lower() == 'success':
-                    processOBJ = Process()
-                    processOBJ.ProcessFromRecipe(item, recipeOBJ.getRecipe())
-                    # Handle processing based on string description.
-                    if '2isis' in item:
-                        processOBJ.updateParameter('from_', inputfile)
-                        processOBJ.updateParameter('to', outfile)
-                    elif item == 'thmproc':
-                        processOBJ.updateParameter('from_', inputfile)
-                        processOBJ.updateParameter('to', outfile)
-                        thmproc_odd = str(workarea) + str(os.path.splitext(
-                            os.path.basename(inputfile))[0]) + '.UPCoutput.raw.odd.cub'
-                        thmproc_even = str(workarea) + str(
-                            os.path.splitext(os.path.basename(
-                                inputfile))[0]) + '.UPCoutput.raw.even.cub'
-                    elif item == 'handmos':
-                        processOBJ.updateParameter('from_', thmproc_even)
-                        processOBJ.updateParameter('mosaic', thmproc_odd)
-                    elif item == 'spiceinit':
-                        processOBJ.updateParameter('from_', infile)
-                    elif item == 'cubeatt':
-                        band_infile = infile + '+' + str(1)
-                        processOBJ.updateParameter('from_', band_infile)
-                        processOBJ.updateParameter('to', outfile)
-                    elif item == 'footprintinit':
-                        processOBJ.updateParameter('from_', infile)
-                    elif item == 'caminfo':
-                        processOBJ.updateParameter('from_', infile)
-                        processOBJ.updateParameter('to', caminfoOUT)
-                    else:
-                        processOBJ.updateParameter('from_', infile)
-                        processOBJ.updateParameter('to', outfile)
-
-                    pwd = os.getcwd()
-                    # iterate through functions listed in process obj
-                    for k, v in processOBJ.getProcess().items():
-                        # load a function into func
-                        func = getattr(isis, k)
-                        try:
-                            os.chdir(workarea)
-                            # execute function
-                            func(**v)
-                            os.chdir(pwd)
-                            if item == 'handmos':
-                                if os.path.isfile(thmproc_odd):
-                                    os.rename(thmproc_odd, infile)
-                            else:
-                                if os.path.isfile(outfile):
-                                    os.rename(outfile, infile)
-                            status = 'success'
-                            if '2isis' in item:
-                                label = pvl.load(infile)
-                                infile_bandlist = label['IsisCube']['BandBin'][PDSinfoDICT[archive]['bandbinQuery']]
-                                infile_centerlist = label['IsisCube']['BandBin']['Center']
-                            elif item == 'thmproc':
-                                pass
-                            elif item == 'handmos':
-                                label = pvl.load(infile)
-                                infile_bandlist = label['IsisCube']['BandBin'][PDSinfoDICT[archive]['bandbinQuery']]
-                                infile_centerlist = label['IsisCube']['BandBin']['Center']
-
-                        except ProcessError as e:
-                            print(e)
-                            status = 'error'
-                            processError = item
-
-            # keyword definitions
-            keywordsOBJ = None
-            if status.lower() == 'success':
-                try:
-                    keywordsOBJ = UPCkeywords(caminfoOUT)
-                except:
-                    with open(caminfoOUT, 'r') as f:
-                        filedata = f.read()
-
-                    filedata = filedata.replace(';', '-').replace('&', '-')
-                    filedata = re.sub(r'\-\s+', r'', filedata, flags=re.M)
-
-                    with open(caminfoOUT, 'w') as f:
-                        f.write(filedata)
-
-                    keywordsOBJ = UPCkeywords(caminfoOUT)
-                target_Qobj = session.query(upc_models.Targets).filter(
-                    upc_models.Targets.targetname == keywordsOBJ.getKeyword(
-                        'TargetName').upper()).first()
-
-                instrument_Qobj = session.query(upc_models.Instruments).filter(
-                    upc_models.Instruments.instrument == keywordsOBJ.getKeyword(
-                        'InstrumentId')).first()
-
-                if session.query(upc_models.DataFiles).filter(
-                        upc_models.DataFiles.isisid == keywordsOBJ.getKeyword(
-                            'IsisId')).first() is None:
-
-                    test_input = upc_models.DataFiles(
-                        isisid=keywordsOBJ.getKeyword('IsisId'),
-                        productid=keywordsOBJ.getKeyword('ProductId'),
-                        edr_source=EDRsource,
-                        edr_detached_label='',
-                        instrumentid=instrument_Qobj.instrumentid,
-                        targetid=target_Qobj.targetid)
-
-                    session.merge(test_input)
-                    session.commit()
-
-                Qobj = session.query(upc_models.DataFiles).filter(
-                    upc_models.DataFiles.isisid == keywordsOBJ.getKeyword('IsisId')).first()
-
-                UPCid = Qobj.upcid
-                print(UPCid)
-                # block to add band information to meta_bands
-                if isinstance(infile_bandlist, list):
-                    index = 0
-                    while index < len(infile_bandlist):
-                        B_DBinput = upc_models.MetaBands(
-                            upcid=UPCid, filter=str(
-                                infile_bandlist[index]), centerwave=infile_centerlist[index])
-                        session.merge(B_DBinput)
-                        index = index + 1
+
+        logger = self.logger
+        writer = self.writer
+        PDSinfoDICT = self.PDSinfoDICT
+
+        logger.info('Starting Process: %s', inputfile)
+        self.profiler.item(inputfile, archive)
+
+        # @TODO refactor this logic.  We're using an object to find a path, returning it,
+        #  then passing it back to the object so that the object can use it.
+        recipeOBJ = Recipe()
+        recipe_json = recipeOBJ.getRecipeJSON(archive)
+        #recipe_json = recipeOBJ.getRecipeJSON(getMission(str(inputfile)))
+        recipeOBJ.AddJsonFile(recipe_json, 'upc')
+
+        basename = os.path.splitext(str(os.path.basename(inputfile)))[0]
+        infile = os.path.join(scratch, basename + '.UPCinput.cub')
+        outfile = os.path.join(scratch, basename + '.UPCoutput.cub')
+        caminfoOUT = os.path.join(scratch, basename + '_caminfo.pvl')
+        EDRsource = edr_source(inputfile)
+
+        checksum = get_checksum(inputfile)
+        recipe = recipeOBJ.getRecipe()
+        checkpoint = Checkpoint(os.path.join(scratch, basename + '.checkpoint.json'),
+                                inputfile, recipe)
+        prefix = 0
+        # Steps an earlier, interrupted attempt at the image already ran
+        done = checkpoint.resume(infile)
+        if done:
+            logger.info('Resuming %s after %s steps', inputfile, done)
+        if self.cube_cache is not None:
+            prefix = prefix_length(recipe)
+            if not done:
+                # Start from the cube another stage already produced, if any
+                done = self.cube_cache.fetch(checksum, recipe, infile)
+                if done:
+                    logger.info('Reusing %s cached steps for %s', done, inputfile)
+        if done:
+            label = load_label(infile)
+            infile_bandlist = label['IsisCube']['BandBin'][PDSinfoDICT[archive]['bandbinQuery']]
+            infile_centerlist = label['IsisCube']['BandBin']['Center']
+
+        status = 'success'
+        # Iterate through each process listed in the recipe
+        for step, item in enumerate(recipeOBJ.getProcesses()):
+            if step < done:
+                continue
+            # If any of the processes failed, discontinue processing
+            if status.lower() == 'error':
+                break
+            elif status.lower() == 'success':
+                processOBJ = Process()
+                processOBJ.ProcessFromRecipe(item, recipeOBJ.getRecipe())
+                # Handle processing based on string description.
+                if '2isis' in item:
+                    processOBJ.updateParameter('from_', inputfile)
+                    processOBJ.updateParameter('to', outfile)
+                elif item == 'thmproc':
+                    processOBJ.updateParameter('from_', inputfile)
+                    processOBJ.updateParameter('to', outfile)
+                    thmproc_odd = os.path.join(scratch, basename + '.UPCoutput.raw.odd.cub')
+                    thmproc_even = os.path.join(scratch, basename + '.UPCoutput.raw.even.cub')
+                elif item == 'handmos':
+                    processOBJ.updateParameter('from_', thmproc_even)
+                    processOBJ.updateParameter('mosaic', thmproc_odd)
+                elif item == 'spiceinit':
+                    processOBJ.updateParameter('from_', infile)
+                elif item == 'cubeatt':
+                    band_infile = infile + '+' + str(1)
+                    processOBJ.updateParameter('from_', band_infile)
+                    processOBJ.updateParameter('to', outfile)
+                elif item == 'footprintinit':
+                    processOBJ.updateParameter('from_', infile)
+                elif item == 'caminfo':
+                    processOBJ.updateParameter('from_', infile)
+                    processOBJ.updateParameter('to', caminfoOUT)
                 else:
-                    try:
-                        # If infile_centerlist is in "Units" format, grab the value
-                        f_centerlist = float(infile_centerlist[0])
-                    except TypeError:
-                        f_centerlist = float(infile_centerlist)
-                    B_DBinput = upc_models.MetaBands(upcid=UPCid, filter=infile_bandlist, centerwave=f_centerlist)
-                    session.merge(B_DBinput)
-                session.commit()
+                    processOBJ.updateParameter('from_', infile)
+                    processOBJ.updateParameter('to', outfile)
 
-                # Block to add common keywords
-                testjson = json.load(
-                    open(keyword_def, 'r'))
-                for element_1 in testjson['instrument']['COMMON']:
-                    keyvalue = ""
-                    keytype = testjson['instrument']['COMMON'][element_1]['type']
-                    keyword = testjson['instrument']['COMMON'][element_1]['keyword']
-                    keyword_Qobj = session.query(upc_models.Keywords).filter(
-                        and_(upc_models.Keywords.typename == element_1,
-                             upc_models.Keywords.instrumentid == 1)).first()
-
-                    if keyword_Qobj is None:
-                        continue
-                    else:
-                        keyvalue = keywordsOBJ.getKeyword(keyword)
-                    if keyvalue is None:
-                        continue
-                    keyvalue = db2py(keytype, keyvalue)
+                # iterate through functions listed in process obj
+                for k, v in processOBJ.getProcess().items():
                     try:
-                        DBinput = upc_models.create_table(keytype,
-                                                          upcid=UPCid,
-                                                          typeid=keyword_Qobj.typeid,
-                                                          value=keyvalue)
-                    except Exception as e:
-                        logger.warn("Unable to enter %s into table\n\n%s", keytype, e)
-                        continue
-                    session.merge(DBinput)
+                        # execute function in the image's scratch directory
+                        run_isis(k, v, cwd=scratch, profiler=self.profiler)
+                        if item == 'handmos':
+                            if os.path.isfile(thmproc_odd):
+                                os.rename(thmproc_odd, infile)
+                        else:
+                            if os.path.isfile(outfile):
+                                os.rename(outfile, infile)
+                        status = 'success'
+                        if '2isis' in item:
+                            label = load_label(infile)
+                            infile_bandlist = label['IsisCube']['BandBin'][PDSinfoDICT[archive]['bandbinQuery']]
+                            infile_centerlist = label['IsisCube']['BandBin']['Center']
+                        elif item == 'thmproc':
+                            pass
+                        elif item == 'handmos':
+                            label = load_label(infile)
+                            infile_bandlist = label['IsisCube']['BandBin'][PDSinfoDICT[archive]['bandbinQuery']]
+                            infile_centerlist = label['IsisCube']['BandBin']['Center']
+
+                    except ProcessError as e:
+                        print(e)
+                        status = 'error'
+                        processError = item
+
+                # thmproc's output only becomes infile after handmos
+                if status == 'success' and item != 'thmproc':
+                    checkpoint.save(step + 1, infile)
+
+                if status == 'success' and step == prefix - 1:
                     try:
-                        session.flush()
-                    except:
-                        logger.warn("Unable to flush database connection")
+                        self.cube_cache.store(checksum, recipe, prefix, infile)
+                    except (IOError, OSError) as e:
+                        logger.warn('Unable to cache %s: %s', infile, e)
+
+        if status.lower() == 'success':
+            try:
+                self.add_upc_rows(inputfile, archive, caminfoOUT, infile_bandlist,
+                                  infile_centerlist, checksum, EDRsource)
+                writer.write()
+            except Exception as e:
+                logger.error("Unable to write UPC results for %s: %s", inputfile, e)
+                status = 'error'
+                processError = 'upc_write'
+            else:
+                AddProcessDB(self.pds_session, fid, True)
+
+        if status.lower() == 'error':
+            self.record_error(inputfile, fid, infile, processError, EDRsource, scratch)
+        return status
+
+    def add_upc_rows(self, inputfile, archive, caminfoOUT, infile_bandlist,
+                     infile_centerlist, checksum, EDRsource):
+        """ Add the UPC rows for a successfully processed image to the writer.
+
+        The DataFiles row is flushed, not committed, so it is written in the
+        same transaction as the meta rows when the writer is written.  If
+        any row can't be added, the rows queued so far and the flushed
+        DataFiles row are discarded before the error is re-raised.
+
+        Parameters
+        ----------
+        inputfile : str
+        archive : str
+        caminfoOUT : str
+            caminfo output for the image
+        infile_bandlist : list or str
+        infile_centerlist : list or float
+        checksum : str
+            md5 of inputfile
+        EDRsource : str
+
+        Returns
+        -------
+        int
+            upcid of the image
+
+        Raises
+        ------
+        ValueError
+            If the image's target or instrument is not in the UPC database
+        """
+        try:
+            return self._add_upc_rows(inputfile, archive, caminfoOUT, infile_bandlist,
+                                      infile_centerlist, checksum, EDRsource)
+        except:
+            self.writer.clear()
+            self.session.rollback()
+            raise
+
+    def _add_upc_rows(self, inputfile, archive, caminfoOUT, infile_bandlist,
+                      infile_centerlist, checksum, EDRsource):
+        logger = self.logger
+        session = self.session
+        registry = self.registry
+        writer = self.writer
+
+        # keyword definitions
+        testjson = load_keyword_def(keyword_def)
+        # Only index the parts of caminfo the definitions refer to
+        groups, keywords = keyword_groups(testjson, archive, UPC_KEYWORDS)
+        keywordsOBJ = UPCkeywords(caminfoOUT, groups, keywords)
+        targetid = registry.getTargetid(keywordsOBJ.getKeyword('TargetName'))
+        instrumentid = registry.getInstrumentid(keywordsOBJ.getKeyword('InstrumentId'))
+        if targetid is None or instrumentid is None:
+            raise ValueError('Unknown target {} or instrument {}'.format(
+                keywordsOBJ.getKeyword('TargetName'), keywordsOBJ.getKeyword('InstrumentId')))
+
+        Qobj = session.query(upc_models.DataFiles).filter(
+            upc_models.DataFiles.isisid == keywordsOBJ.getKeyword('IsisId')).first()
+
+        if Qobj is None:
+            Qobj = upc_models.DataFiles(
+                isisid=keywordsOBJ.getKeyword('IsisId'),
+                productid=keywordsOBJ.getKeyword('ProductId'),
+                edr_source=EDRsource,
+                edr_detached_label='',
+                instrumentid=instrumentid,
+                targetid=targetid)
+            session.add(Qobj)
+            # Flush (not commit) to get the upcid; the meta rows are
+            #  committed with it below
+            session.flush()
+
+        UPCid = Qobj.upcid
+        print(UPCid)
+        # block to add band information to meta_bands
+        if isinstance(infile_bandlist, list):
+            index = 0
+            while index < len(infile_bandlist):
+                B_DBinput = upc_models.MetaBands(
+                    upcid=UPCid, filter=str(
+                        infile_bandlist[index]), centerwave=infile_centerlist[index])
+                writer.add(B_DBinput)
+                index = index + 1
+        else:
+            try:
+                # If infile_centerlist is in "Units" format, grab the value
+                f_centerlist = float(infile_centerlist[0])
+            except TypeError:
+                f_centerlist = float(infile_centerlist)
+            B_DBinput = upc_models.MetaBands(upcid=UPCid, filter=infile_bandlist, centerwave=f_centerlist)
+            writer.add(B_DBinput)
+
+        # Block to add common keywords
+        for element_1 in testjson['instrument']['COMMON']:
+            keyvalue = ""
+            keytype = testjson['instrument']['COMMON'][element_1]['type']
+            keyword = testjson['instrument']['COMMON'][element_1]['keyword']
+            typeid = registry.getTypeid(element_1, 1)
+
+            if typeid is None:
+                continue
+            else:
+                keyvalue = keywordsOBJ.getKeyword(keyword)
+            if keyvalue is None:
+                continue
+            keyvalue = db2py(keytype, keyvalue)
+            try:
+                DBinput = upc_models.create_table(keytype,
+                                                  upcid=UPCid,
+                                                  typeid=typeid,
+                                                  value=keyvalue)
+            except Exception as e:
+                logger.warn("Unable to enter %s into table\n\n%s", keytype, e)
+                continue
+            writer.add(DBinput)
+
+        for element_1 in testjson['instrument'][archive]:
+            keyvalue = ""
+            keytype = testjson['instrument'][archive][element_1]['type']
+            keyword = testjson['instrument'][archive][element_1]['keyword']
+            typeid = registry.getTypeid(element_1, (1, instrumentid))
+
+            if typeid is None:
+                continue
+            else:
+                keyvalue = keywordsOBJ.getKeyword(keyword)
+            if keyvalue is None:
+                logger.debug("Keyword %s not found", keyword)
+                continue
+            keyvalue = db2py(keytype, keyvalue)
+            try:
+                DBinput = upc_models.create_table(keytype,
+                                                  upcid=UPCid,
+                                                  typeid=typeid,
+                                                  value=keyvalue)
+            except Exception as e:
+                logger.warn("Unable to enter %s into database\n\n%s", keytype, e)
+                continue
+            writer.add(DBinput)
+
+        # geometry stuff
+        G_centroid = 'point ({} {})'.format(
+            str(keywordsOBJ.getKeyword('CentroidLongitude')),
+            str(keywordsOBJ.getKeyword('CentroidLatitude')))
+
+        G_footprint, G_bbox = clean_footprint(keywordsOBJ.getKeyword('GisFootprint'),
+                                              self.footprint_tolerance,
+                                              self.footprint_precision,
+                                              self.footprint_split)
+        G_DBinput = upc_models.MetaGeometry(upcid=UPCid,
+                                            typeid=self.isis_centroid_tid,
+                                            value=G_centroid)
+        writer.add(G_DBinput)
+        G_DBinput = upc_models.MetaGeometry(upcid=UPCid,
+                                            typeid=self.isis_footprint_tid,
+                                            value=G_footprint)
+        writer.add(G_DBinput)
+        # Precomputed envelope, for cheap coarse spatial filtering
+        if G_bbox is not None and self.footprint_bbox_tid is not None:
+            G_DBinput = upc_models.MetaGeometry(upcid=UPCid,
+                                                typeid=self.footprint_bbox_tid,
+                                                value=G_bbox)
+            writer.add(G_DBinput)
+        if self.tile_levels:
+            # Replaces the cells of an earlier run, in the same transaction
+            session.query(upc_models.MetaTiles).filter(
+                upc_models.MetaTiles.upcid == UPCid).delete(synchronize_session=False)
+            for T_DBinput in tile_rows(UPCid, G_footprint, self.tile_levels):
+                writer.add(T_DBinput)
+
+        DBinput = upc_models.MetaString(upcid=UPCid, typeid=self.checksum_tid, value=checksum)
+        writer.add(DBinput)
+        DBinput = upc_models.MetaBoolean(upcid=UPCid, typeid=self.err_flag_tid, value=False)
+        writer.add(DBinput)
+        return UPCid
+
+    def record_error(self, inputfile, fid, infile, processError, EDRsource, scratch):
+        """ Write the error rows for an image whose recipe failed.
+
+        Parameters
+        ----------
+        inputfile : str
+        fid : int
+            fileid in the pds database
+        infile : str
+            Cube the failed step was run on
+        processError : str
+            Recipe step that failed
+        EDRsource : str
+        scratch : str
+            Scratch directory of the image
+        """
+        logger = self.logger
+        session = self.session
+        registry = self.registry
+        writer = self.writer
+
+        try:
+            label = load_label(infile)
+        except Exception as e:
+            logger.info('%s', e)
+            return
+        date = datetime.datetime.now(pytz.utc).strftime(
+            "%Y-%m-%d %H:%M:%S")
+
+        if '2isis' in processError or processError == 'thmproc':
+            if session.query(upc_models.DataFiles).filter(
+                    upc_models.DataFiles.edr_source == EDRsource).first() is None:
+
+                error1_input = upc_models.DataFiles(isisid='1',
+                                                    edr_source=EDRsource)
+                session.merge(error1_input)
                 session.commit()
 
-                for element_1 in testjson['instrument'][archive]:
-                    keyvalue = ""
-                    keytype = testjson['instrument'][archive][element_1]['type']
-                    keyword = testjson['instrument'][archive][element_1]['keyword']
-                    keyword_Qobj = session.query(upc_models.Keywords).filter(
-                        and_(upc_models.Keywords.typename == element_1,
-                             upc_models.Keywords.instrumentid.in_(
-                                 (1, instrument_Qobj.instrumentid)))).first()
-
-                    if keyword_Qobj is None:
-                        continue
-                    else:
-                        keyvalue = keywordsOBJ.getKeyword(keyword)
-                    if keyvalue is None:
-                        logger.debug("Keyword %s not found", keyword)
-                        continue
-                    keyvalue = db2py(keytype, keyvalue)
-                    try:
-                        DBinput = upc_models.create_table(keytype,
-                                                          upcid=UPCid,
-                                                          typeid=keyword_Qobj.typeid,
-                                                          value=keyvalue)
-                    except Exception as e:
-                        logger.warn("Unable to enter %s into database\n\n%s", keytype, e)
-                        continue
-                    session.merge(DBinput)
-                    try:
-                        session.flush()
-                    except:
-                        logger.warn("Unable to flush database connection")
-                session.commit()
+            EQ1obj = session.query(upc_models.DataFiles).filter(
+                upc_models.DataFiles.edr_source == EDRsource).first()
+            UPCid = EQ1obj.upcid
 
-                # geometry stuff
-                G_centroid = 'point ({} {})'.format(
-                    str(keywordsOBJ.getKeyword('CentroidLongitude')),
-                    str(keywordsOBJ.getKeyword('CentroidLatitude')))
-
-                G_keyword_Qobj = session.query(upc_models.Keywords.typeid).filter(
-                    upc_models.Keywords.typename == 'isiscentroid').first()
-                G_footprint_Qobj = session.query(upc_models.Keywords.typeid).filter(
-                    upc_models.Keywords.typename == 'isisfootprint').first()
-                G_footprint = keywordsOBJ.getKeyword('GisFootprint')
-                G_DBinput = upc_models.MetaGeometry(upcid=UPCid,
-                                                    typeid=G_keyword_Qobj,
-                                                    value=G_centroid)
-                session.merge(G_DBinput)
-                G_DBinput = upc_models.MetaGeometry(upcid=UPCid,
-                                                    typeid=G_footprint_Qobj,
-                                                    value=G_footprint)
-                session.merge(G_DBinput)
-                session.flush()
-                session.commit()
+            errorMSG = 'Error running {} on file {}'.format(
+                processError, inputfile)
+
+            DBinput = MetaTime(upcid=UPCid,
+                               typeid=self.proc_date_tid,
+                               value=date)
+            writer.add(DBinput)
+
+            DBinput = MetaString(upcid=UPCid,
+                                 typeid=self.err_type_tid,
+                                 value=processError)
+            writer.add(DBinput)
+
+            DBinput = MetaString(upcid=UPCid,
+                                 typeid=self.err_msg_tid,
+                                 value=errorMSG)
+            writer.add(DBinput)
+
+            DBinput = MetaBoolean(upcid=UPCid,
+                                  typeid=self.err_flag_tid,
+                                  value=True)
+            writer.add(DBinput)
 
-                f_hash = hashlib.md5()
-                with open(inputfile, "rb") as f:
-                    for chunk in iter(lambda: f.read(4096), b""):
-                        f_hash.update(chunk)
-                checksum = f_hash.hexdigest()
+            DBinput = MetaGeometry(upcid=UPCid,
+                                   typeid=self.isis_footprint_tid,
+                                   value='POINT(361 0)')
+            writer.add(DBinput)
 
+            DBinput = MetaGeometry(upcid=UPCid,
+                                   typeid=self.isis_centroid_tid,
+                                   value='POINT(361 0)')
+            writer.add(DBinput)
 
-                DBinput = upc_models.MetaString(upcid=UPCid, typeid=checksum_tid, value=checksum)
-                session.merge(DBinput)
-                DBinput = upc_models.MetaBoolean(upcid=UPCid, typeid=err_flag_tid, value=False)
-                session.merge(DBinput)
+            writer.write()
+        else:
+            try:
+                label = load_label(infile)
+            except Exception as e:
+                logger.warn('%s', e)
+                return
+
+            isisSerial = getISISid(infile, scratch)
+
+            if session.query(upc_models.DataFiles).filter(
+                    upc_models.DataFiles.isisid == isisSerial).first() is None:
+                try:
+                    targetid = registry.getTargetid(
+                        label['IsisCube']['Instrument']['TargetName'])
+                    instrumentid = registry.getInstrumentid(
+                        label['IsisCube']['Instrument']['InstrumentId'])
+                except (KeyError, ValueError) as e:
+                    logger.warn('%s', e)
+                    targetid = instrumentid = None
+
+                if targetid is None or instrumentid is None:
+                    logger.warn('Unknown target or instrument, error for %s NOT recorded in UPC',
+                                inputfile)
+                    AddProcessDB(self.pds_session, fid, False)
+                    return
+
+                error2_input = upc_models.DataFiles(isisid=isisSerial, productid=label['IsisCube']['Archive']['ProductId'], edr_source=EDRsource, instrumentid=instrumentid, targetid=targetid)
+                session.merge(error2_input)
                 session.commit()
-                AddProcessDB(pds_session, fid, True)
-                os.remove(infile)
-                os.remove(caminfoOUT)
 
-            elif status.lower() == 'error':
+            try:
+                EQ2obj = session.query(upc_models.DataFiles).filter(
+                    upc_models.DataFiles.isisid == isisSerial).first()
+                UPCid = EQ2obj.upcid
+                errorMSG = 'Error running {} on file {}'.format(
+                    processError, inputfile)
+
+                DBinput = MetaTime(upcid=UPCid,
+                                   typeid=self.proc_date_tid,
+                                   value=date)
+                writer.add(DBinput)
+
+                DBinput = MetaString(upcid=UPCid,
+                                     typeid=self.err_type_tid,
+                                     value=processError)
+                writer.add(DBinput)
+
+                DBinput = MetaString(upcid=UPCid,
+                                     typeid=self.err_msg_tid,
+                                     value=errorMSG)
+                writer.add(DBinput)
+
+                DBinput = MetaBoolean(upcid=UPCid,
+                                      typeid=self.err_flag_tid,
+                                      value=True)
+                writer.add(DBinput)
+
+                DBinput = MetaGeometry(upcid=UPCid,
+                                       typeid=self.isis_footprint_tid,
+                                       value='POINT(361 0)')
+                writer.add(DBinput)
+
+                DBinput = MetaGeometry(upcid=UPCid,
+                                       typeid=self.isis_centroid_tid,
+                                       value='POINT(361 0)')
+                writer.add(DBinput)
+            except:
+                pass
+
+            try:
+                v = label['IsisCube']['Instrument']['StartTime']
+            except KeyError:
+                v = None
+            except:
+                return
+
+            try:
+                DBinput = MetaTime(upcid=UPCid,
+                                   typeid=self.start_time_tid,
+                                   value=v)
+                writer.add(DBinput)
+            except:
+                return
+
+            try:
+                v = label['IsisCube']['Instrument']['StopTime']
+            except KeyError:
+                v = None
+            DBinput = MetaTime(upcid=UPCid,
+                               typeid=self.stop_time_tid,
+                               value=v)
+            writer.add(DBinput)
+
+            writer.write()
+
+        AddProcessDB(self.pds_session, fid, False)
+
+
+# The UPCworker of a pipeline process, created by init_worker
+_worker = None
+
+
+def init_worker(worker_class=UPCworker):
+    global _worker
+    _worker = worker_class()
+
+
+def process_item(item):
+    """ Process one queued image in a pipeline process. """
+    _worker.process(item)
+
+
+def serve(RQ_main, RQ_lock, workers, logger, worker_class=UPCworker):
+    """ Process queued images with a pool of pipeline processes.
+
+    Parameters
+    ----------
+    RQ_main : RedisQueue
+        Queue of (inputfile, fileid, archive) items
+    RQ_lock : RedisLock
+    workers : int
+        Number of images processed at once
+    logger : Logger
+    worker_class : class
+        UPCworker or a subclass, created once in each pipeline process
+    """
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(worker_class,)) as pool:
+        running = set()
+        while True:
+            # while there are items in the redis queue, keep every pipeline busy
+            while (len(running) < workers and int(RQ_main.QueueSize()) > 0
+                   and RQ_lock.available(RQ_main.id_name)):
+                # get a file from the queue
+                queued = RQ_main.QueueGet()
+                if queued is None:
+                    break
+                item = literal_eval(queued.decode("utf-8"))
+                running.add(pool.submit(process_item, item))
+
+            if not running:
+                break
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
                 try:
-                    label = pvl.load(infile)
+                    future.result()
                 except Exception as e:
-                    logger.info('%s', e)
-                    continue
-                date = datetime.datetime.now(pytz.utc).strftime(
-                    "%Y-%m-%d %H:%M:%S")
-
-                if '2isis' in processError or processError == 'thmproc':
-                    if session.query(upc_models.DataFiles).filter(
-                            upc_models.DataFiles.edr_source == EDRsource.decode(
-                                "utf-8")).first() is None:
-
-                        target_Qobj = session.query(upc_models.Targets).filter(
-                            upc_models.Targets.targetname == str(
-                                label['IsisCube']['Instrument']['TargetName']).upper()).first()
-
-                        instrument_Qobj = session.query(upc_models.Instruments).filter(
-                            upc_models.Instruments.instrument == str(
-                                label['IsisCube']
-                                ['Instrument']
-                                ['InstrumentId'])).first()
-
-                        error1_input = upc_models.DataFiles(isisid='1',
-                                                            edr_source=EDRsource)
-                        session.merge(error1_input)
-                        session.commit()
-
-                    EQ1obj = session.query(upc_models.DataFiles).filter(
-                        upc_models.DataFiles.edr_source == EDRsource).first()
-                    UPCid = EQ1obj.upcid
-
-                    errorMSG = 'Error running {} on file {}'.format(
-                        processError, inputfile)
-
-                    DBinput = MetaTime(upcid=UPCid,
-                                       typeid=proc_date_tid,
-                                       value=date)
-                    session.merge(DBinput)
-
-                    DBinput = MetaString(upcid=UPCid,
-                                         typeid=err_type_tid,
-                                         value=processError)
-                    session.merge(DBinput)
-
-                    DBinput = MetaString(upcid=UPCid,
-                                         typeid=err_msg_tid,
-                                         value=errorMSG)
-                    session.merge(DBinput)
-
-                    DBinput = MetaBoolean(upcid=UPCid,
-                                          typeid=err_flag_tid,
-                                          value=True)
-                    session.merge(DBinput)
-
-                    DBinput = MetaGeometry(upcid=UPCid,
-                                           typeid=isis_footprint_tid,
-                                           value='POINT(361 0)')
-                    session.merge(DBinput)
-
-                    DBinput = MetaGeometry(upcid=UPCid,
-                                           typeid=isis_centroid_tid,
-                                           value='POINT(361 0)')
-                    session.merge(DBinput)
-
-                    session.commit()
-                else:
-                    try:
-                        label = pvl.load(infile)
-                    except Exception as e:
-                        logger.warn('%s', e)
-                        continue
-
-                    isisSerial = getISISid(infile)
-
-                    if session.query(upc_models.DataFiles).filter(
-                            upc_models.DataFiles.isisid == isisSerial).first() is None:
-                        target_Qobj = session.query(upc_models.Targets).filter(
-                            upc_models.Targets.targetname == str(
-                                label['IsisCube']['Instrument']['TargetName'])
-                            .upper()).first()
-                        instrument_Qobj = session.query(upc_models.Instruments).filter(
-                            upc_models.Instruments.instrument == str(
-                                label['IsisCube']
-                                ['Instrument']
-                                ['InstrumentId'])).first()
-
-                        if target_Qobj is None or instrument_Qobj is None:
-                            continue
-
-                        error2_input = upc_models.DataFiles(isisid=isisSerial, productid=label['IsisCube']['Archive']['ProductId'], edr_source=EDRsource, instrumentid=instrument_Qobj.instrumentid, targetid=target_Qobj.targetid)
-                    session.merge(error2_input)
-                    session.commit()
+                    logger.error("Pipeline failed: %s", e)
 
-                    try:
-                        EQ2obj = session.query(upc_models.DataFiles).filter(
-                            upc_models.DataFiles.isisid == isisSerial).first()
-                        UPCid = EQ2obj.upcid
-                        errorMSG = 'Error running {} on file {}'.format(
-                            processError, inputfile)
-
-                        DBinput = MetaTime(upcid=UPCid,
-                                           typeid=proc_date_tid,
-                                           value=date)
-                        session.merge(DBinput)
-
-                        DBinput = MetaString(upcid=UPCid,
-                                             typeid=err_type_tid,
-                                             value=processError)
-                        session.merge(DBinput)
-
-                        DBinput = MetaString(upcid=UPCid,
-                                             typeid=err_msg_tid,
-                                             value=errorMSG)
-                        session.merge(DBinput)
-
-                        DBinput = MetaBoolean(upcid=UPCid,
-                                              typeid=err_flag_tid,
-                                              value=True)
-                        session.merge(DBinput)
-
-                        DBinput = MetaGeometry(upcid=UPCid,
-                                               typeid=isis_footprint_tid,
-                                               value='POINT(361 0)')
-                        session.merge(DBinput)
-
-                        DBinput = MetaGeometry(upcid=UPCid,
-                                               typeid=isis_centroid_tid,
-                                               value='POINT(361 0)')
-                        session.merge(DBinput)
-                    except:
-                        pass
 
-                    try:
-                        v = label['IsisCube']['Instrument']['StartTime']
-                    except KeyError:
-                        v = None
-                    except:
-                        continue
+def main():
+    args = Args()
+    args.parse_args()
 
-                    try:
-                        DBinput = MetaTime(upcid=UPCid,
-                                           typeid=start_time_tid,
-                                           value=v)
-                        session.merge(DBinput)
-                    except:
-                        continue
+    # ***************** Set up logging *****************
+    logger = get_logger()
+
+    # Redis Queue Objects
+    RQ_main = RedisQueue('UPC_ReadyQueue')
+    logger.info("UPC Processing Queue: %s", RQ_main.id_name)
+    RQ_lock = RedisLock(lock_obj)
+    # If the queue isn't registered, add it and set it to "running"
+    RQ_lock.add({RQ_main.id_name: '1'})
+
+    # ISIS applications are mostly single threaded, so run as many images at
+    #  once as the cores and memory given to the job allow
+    workers = args.workers or pipeline_slots(args.pipeline_memory)
+    logger.info("Running %s UPC pipelines", workers)
+
+    serve(RQ_main, RQ_lock, workers, logger)
 
-                    try:
-                        v = label['IsisCube']['Instrument']['StopTime']
-                    except KeyError:
-                        v = None
-                    DBinput = MetaTime(upcid=UPCid,
-                                       typeid=stop_time_tid,
-                                       value=v)
-                    session.merge(DBinput)
-
-                    session.commit()
-
-                AddProcessDB(pds_session, fid, False)
-                os.remove(infile)
-
-    # Disconnect from db sessions
-    pds_session.close()
-    session.close()
-    # Disconnect from the engines
-    pds_engine.dispose()
-    upc_engine.dispose()
     logger.info("UPC processing exited successfully")
 
 if __name__ == "__main__":
@@ -2,7 +2,10 @@
 
 import os
 import sys
-import pvl
+from collections import OrderedDict
+
+from pds_pipelines.LabelCache import load_label
+from pds_pipelines.PVLextract import extract_label
 
 
 def find_keyword(obj, key, group=None):
@@ -17,7 +20,7 @@ def find_keyword(obj, key, group=None):
             F_item = find_keyword(v, key)
             if F_item is not None:
                 return F_item
-            
+
 def lower_keys(x):
     if isinstance(x, list):
         return [lower_keys(v) for v in x]
@@ -26,16 +29,123 @@ def lower_keys(x):
     else:
         return x
 
+
+def keyword_groups(keyword_def, archive, extra=()):
+    """ Work out which parts of a caminfo label a keyword definition uses.
+
+    Parameters
+    ----------
+    keyword_def : dict
+        Parsed Keyword_Definition.json
+    archive : str
+        Archive whose keywords are used in addition to COMMON
+    extra : iterable
+        Further keyword names to look up regardless of group
+
+    Returns
+    -------
+    groups : set
+        Lower cased names of groups that are indexed in full
+    keywords : set
+        Lower cased keywords that have no group and are indexed wherever
+        they appear
+    """
+    groups = set()
+    keywords = set(k.lower() for k in extra)
+    for section in ('COMMON', archive):
+        for definition in keyword_def['instrument'].get(section, {}).values():
+            if definition.get('group'):
+                groups.add(definition['group'].lower())
+            else:
+                keywords.add(definition['keyword'].lower())
+    return groups, keywords
+
+
 class UPCkeywords(object):
+    """
+    Keyword lookups on a caminfo PVL file.
+
+    Only the groups and keywords asked for are read from the file, with
+    PVLextract, which also reads labels pvl rejects; pvl is used only if
+    that fails.  The label is flattened once into a dict of lower cased keyword -> value,
+    so getKeyword is a dict lookup.  When the same keyword appears more than
+    once the value kept is the one the old recursive find_keyword returned:
+    a group's own keywords before those of the groups nested in it, and
+    earlier groups before later ones.
+
+    Attributes
+    ----------
+    label : OrderedDict
+        The keywords read from the label, in their groups, with their
+        original case
+    index : dict
+        lower cased keyword -> value
+    grouped : dict
+        (lower cased group, lower cased keyword) -> value
+    """
+
+    def __init__(self, pvlfile, groups=None, keywords=None):
+        """
+        Parameters
+        ----------
+        pvlfile : str
+        groups : iterable
+            If given, only keywords inside these groups (and anything
+            nested in them) are indexed, see keyword_groups.
+        keywords : iterable
+            With groups, additional keywords indexed wherever they appear.
+        """
+        self.groups = None if groups is None else set(g.lower() for g in groups)
+        self.keywords = set() if keywords is None else set(k.lower() for k in keywords)
+        try:
+            self.label = extract_label(pvlfile, self.groups, self.keywords)
+        except ValueError:
+            self.label = load_label(pvlfile, strict=False)
+        self.index = {}
+        self.grouped = {}
+        self._flatten(self.label, None, self.groups is None, True)
+
+    def _flatten(self, obj, name, indexed, root):
+        # Later duplicates of a key at the same level replace earlier ones,
+        #  as they did when the label was converted with lower_keys
+        level = OrderedDict()
+        for k, v in obj.items():
+            level[k.lower()] = v
 
-    def __init__(self, pvlfile):
-        self.label = lower_keys(pvl.load(pvlfile, strict=False))
+        for k, v in level.items():
+            if not indexed and k not in self.keywords:
+                continue
+            # find_keyword skipped None values below the top level
+            if v is None and not root:
+                continue
+            self.index.setdefault(k, v)
+            if name is not None:
+                self.grouped.setdefault((name, k), v)
 
+        for k, v in level.items():
+            if isinstance(v, dict):
+                self._flatten(v, k, indexed or k in self.groups, False)
 
     def __str__(self):
         return(str(self.label))
 
+    def getKeyword(self, keyword, group=None):
+        """
+        Parameters
+        ----------
+        keyword : str
+        group : str
+            If given, only a keyword directly inside this group matches
 
-    def getKeyword(self, keyword):
-        Gkey = find_keyword(self.label, keyword.lower())
+        Returns
+        -------
+        obj
+            The keyword's value, or None if it was not found
+        """
+        if group is not None:
+            Gkey = self.grouped.get((group.lower(), keyword.lower()))
+        else:
+            Gkey = self.index.get(keyword.lower())
+        if isinstance(Gkey, (dict, list)):
+            return lower_keys(Gkey)
         return Gkey
@@ -3,10 +3,10 @@
 import sys
 import logging
 import argparse
-import json
 from pds_pipelines.db import db_connect
 from pds_pipelines.models.pds_models import Files
 from pds_pipelines.RedisQueue import RedisQueue
+from pds_pipelines.ConfigCache import load_pds_info
 from pds_pipelines.config import pds_log, pds_info, pds_db
 
 
@@ -56,7 +56,7 @@ def main():
 
     logger.info('Starting Process')
 
-    PDSinfoDICT = json.load(open(pds_info, 'r'))
+    PDSinfoDICT = load_pds_info(pds_info)
     try:
         archiveID = PDSinfoDICT[args.archive]['archiveid']
     except KeyError:
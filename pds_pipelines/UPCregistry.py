@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+import time
+
+from pds_pipelines.models import upc_models
+
+
+class UPCregistry(object):
+    """
+    In-memory copy of the UPC lookup tables (keywords, targets and
+    instruments), loaded once when a worker starts.
+
+    A lookup that misses reloads the tables, at most once every
+    refresh_interval seconds, so rows added while a worker is running are
+    still picked up without querying on every miss.
+
+    Attributes
+    ----------
+    session : Session
+    refresh_interval : float
+    keywords : dict
+        (typename, instrumentid) -> typeid
+    typenames : dict
+        typename -> typeid, for lookups that ignore the instrument
+    targets : dict
+        upper case targetname -> targetid
+    instruments : dict
+        instrument -> instrumentid
+    """
+
+    def __init__(self, session, refresh_interval=300):
+        """
+        Parameters
+        ----------
+        session : Session
+            Session connected to the UPC database
+        refresh_interval : float
+            Minimum number of seconds between reloads triggered by misses
+        """
+        self.session = session
+        self.refresh_interval = refresh_interval
+        self.load()
+
+    def load(self):
+        """ (Re)read the keyword, target and instrument tables. """
+        keywords = {}
+        typenames = {}
+        query = self.session.query(upc_models.Keywords.typeid,
+                                   upc_models.Keywords.typename,
+                                   upc_models.Keywords.instrumentid)
+        for typeid, typename, instrumentid in query.order_by(upc_models.Keywords.typeid):
+            keywords.setdefault((typename, instrumentid), typeid)
+            typenames.setdefault(typename, typeid)
+
+        query = self.session.query(upc_models.Targets.targetid,
+                                   upc_models.Targets.targetname)
+        targets = dict((str(name).upper(), targetid) for targetid, name in query)
+
+        query = self.session.query(upc_models.Instruments.instrumentid,
+                                   upc_models.Instruments.instrument)
+        instruments = dict((name, instrumentid) for instrumentid, name in query)
+
+        self.keywords = keywords
+        self.typenames = typenames
+        self.targets = targets
+        self.instruments = instruments
+        self.loaded = time.time()
+
+    def _refresh(self):
+        """ Reload the tables if the last load is older than refresh_interval.
+
+        Returns
+        -------
+        bool
+            True if the tables were reloaded
+        """
+        if time.time() - self.loaded < self.refresh_interval:
+            return False
+        self.load()
+        return True
+
+    def _lookup(self, table, key):
+        value = getattr(self, table).get(key)
+        if value is None and self._refresh():
+            value = getattr(self, table).get(key)
+        return value
+
+    def getTypeid(self, typename, instrumentids=None):
+        """
+        Parameters
+        ----------
+        typename : str
+        instrumentids : int or tuple
+            Instrument ids to match, in order of preference.  If None, the
+            first keyword with a matching typename is used.
+
+        Returns
+        -------
+        int
+            typeid, or None if no keyword matches
+        """
+        if instrumentids is None:
+            return self._lookup('typenames', typename)
+        if isinstance(instrumentids, int):
+            instrumentids = (instrumentids,)
+
+        for refreshed in (False, True):
+            for instrumentid in instrumentids:
+                typeid = self.keywords.get((typename, instrumentid))
+                if typeid is not None:
+                    return typeid
+            if refreshed or not self._refresh():
+                break
+        return None
+
+    def getTargetid(self, targetname):
+        """
+        Parameters
+        ----------
+        targetname : str
+
+        Returns
+        -------
+        int
+            targetid, or None if the target is unknown
+        """
+        if targetname is None:
+            return None
+        return self._lookup('targets', str(targetname).upper())
+
+    def getInstrumentid(self, instrument):
+        """
+        Parameters
+        ----------
+        instrument : str
+
+        Returns
+        -------
+        int
+            instrumentid, or None if the instrument is unknown
+        """
+        if instrument is None:
+            return None
+        return self._lookup('instruments', str(instrument))
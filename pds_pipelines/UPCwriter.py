@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+from collections import OrderedDict
+
+from sqlalchemy.dialects.postgresql import insert
+
+
+class UPCwriter(object):
+    """
+    Collects UPC meta table rows and writes them with one multi-row
+    INSERT ... ON CONFLICT DO UPDATE per table, inside a single transaction.
+
+    Rows are added as the usual model instances (e.g. MetaString,
+    MetaGeometry, MetaBands), so the per-table value checks in the models
+    still apply.  Adding a second row with the same primary key replaces
+    the first, which gives the same result session.merge did.
+
+    Attributes
+    ----------
+    session : Session
+    rows : OrderedDict
+        (table, columns) -> {primary key: row values}
+    """
+
+    def __init__(self, session):
+        """
+        Parameters
+        ----------
+        session : Session
+            Session connected to the UPC database
+        """
+        self.session = session
+        self.rows = OrderedDict()
+
+    def __len__(self):
+        return sum(len(v) for v in self.rows.values())
+
+    def add(self, DBinput):
+        """
+        Parameters
+        ----------
+        DBinput : Base
+            A mapped instance, e.g. from upc_models.create_table
+        """
+        table = DBinput.__table__
+        # Only columns that were set, so server/column defaults still apply
+        values = OrderedDict((c.name, DBinput.__dict__[c.key])
+                             for c in table.columns if c.key in DBinput.__dict__)
+        pkey = tuple(values.get(c.name) for c in table.primary_key.columns)
+        group = (table, tuple(values.keys()))
+        self.rows.setdefault(group, OrderedDict())[pkey] = values
+
+    def statements(self):
+        """ Build one upsert statement per table/column set.
+
+        Returns
+        -------
+        list
+            sqlalchemy Insert statements
+        """
+        stmts = []
+        for (table, columns), rows in self.rows.items():
+            stmt = insert(table).values(list(rows.values()))
+            pkey = [c.name for c in table.primary_key.columns]
+            update = dict((name, stmt.excluded[name])
+                          for name in columns if name not in pkey)
+            if update:
+                stmt = stmt.on_conflict_do_update(index_elements=pkey,
+                                                  set_=update)
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=pkey)
+            stmts.append(stmt)
+        return stmts
+
+    def write(self):
+        """ Write and commit everything collected so far.
+
+        The pending rows are cleared whether or not the write succeeds; on
+        failure the transaction is rolled back and the error re-raised.
+
+        Returns
+        -------
+        int
+            Number of rows written
+        """
+        n_rows = len(self)
+        stmts = self.statements()
+        self.rows = OrderedDict()
+        try:
+            for stmt in stmts:
+                self.session.execute(stmt)
+            self.session.commit()
+        except:
+            self.session.rollback()
+            raise
+        return n_rows
+
+    def clear(self):
+        """ Drop any rows that have not been written. """
+        self.rows = OrderedDict()
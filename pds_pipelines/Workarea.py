@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+import os
+import errno
+import fcntl
+import shutil
+import hashlib
+import tempfile
+
+
+from pds_pipelines import config
+from pds_pipelines.UPCkeywords import find_keyword
+from pds_pipelines.LabelCache import load_label
+
+# Bytes per pixel for ISIS Pixels/Type
+ISIS_PIXEL_BYTES = {'UnsignedByte': 1,
+                    'SignedWord': 2,
+                    'UnsignedWord': 2,
+                    'SignedInteger': 4,
+                    'UnsignedInteger': 4,
+                    'Real': 4,
+                    'Double': 8}
+
+# Calibrated intermediates are usually Real, and a step has its input and
+#  output cube on disk at the same time
+INTERMEDIATE_PIXEL_BYTES = 4
+INTERMEDIATE_COPIES = 2
+
+
+def estimate_cube_size(inputfile):
+    """ Estimate the space an image's intermediate cubes need.
+
+    Dimensions are read from the PDS3 (LINES, LINE_SAMPLES, BANDS,
+    SAMPLE_BITS) or ISIS (Core/Dimensions, Pixels/Type) label.
+
+    Parameters
+    ----------
+    inputfile : str
+
+    Returns
+    -------
+    int
+        Bytes, or None if the label can't be read
+    """
+    try:
+        label = load_label(inputfile)
+    except Exception:
+        return None
+
+    if 'IsisCube' in label:
+        core = label['IsisCube']['Core']
+        lines = core['Dimensions']['Lines']
+        samples = core['Dimensions']['Samples']
+        bands = core['Dimensions']['Bands']
+        pixel_bytes = ISIS_PIXEL_BYTES.get(str(core['Pixels']['Type']), 4)
+    else:
+        lines = find_keyword(label, 'LINES')
+        samples = find_keyword(label, 'LINE_SAMPLES')
+        bands = find_keyword(label, 'BANDS') or 1
+        pixel_bytes = (find_keyword(label, 'SAMPLE_BITS') or 8) // 8
+
+    try:
+        pixels = int(lines) * int(samples) * int(bands)
+    except (TypeError, ValueError):
+        return None
+    return pixels * max(pixel_bytes, INTERMEDIATE_PIXEL_BYTES) * INTERMEDIATE_COPIES
+
+
+class Workarea(object):
+    """
+    Scratch directory for the intermediate cubes of one image.
+
+    If config.fast_workarea is set (node local tmpfs or NVMe, e.g.
+    /dev/shm) and the image's estimated intermediate size fits both
+    config.fast_workarea_budget (bytes, optional) and the free space there,
+    the directory is made on it; otherwise it is made under config.workarea.
+    The directory is removed when the image is done, including when
+    processing raises, unless keep_on_failure is set.
+
+    A resumable workarea is named after the image rather than made unique,
+    and is kept when processing raises (or the job is killed), so the next
+    attempt at the image finds the intermediate cubes and checkpoint (see
+    Checkpoint) of the last one.  It is locked while in use; if another
+    worker holds it, a unique directory is used instead.
+
+    Usable as a context manager, which returns the directory path.
+
+    Attributes
+    ----------
+    inputfile : str
+    keep_on_failure : bool
+    resumable : bool
+    path : str
+        The scratch directory, once created
+    """
+
+    def __init__(self, inputfile, keep_on_failure=False, resumable=False):
+        """
+        Parameters
+        ----------
+        inputfile : str
+            Image the directory is for
+        keep_on_failure : bool
+            Leave the directory in place if processing fails, for debugging
+        resumable : bool
+            Reuse the directory of an earlier attempt at the image
+        """
+        self.inputfile = inputfile
+        self.keep_on_failure = keep_on_failure
+        self.resumable = resumable
+        self.path = None
+        self.lock = None
+
+    def root(self):
+        """
+        Returns
+        -------
+        str
+            Directory the scratch directory is made in
+        """
+        fast = getattr(config, 'fast_workarea', None)
+        if not fast or not os.path.isdir(fast):
+            return config.workarea
+
+        size = estimate_cube_size(self.inputfile)
+        if size is None:
+            return config.workarea
+
+        budget = getattr(config, 'fast_workarea_budget', None)
+        if budget is not None and size > budget:
+            return config.workarea
+        st = os.statvfs(fast)
+        if size > st.f_bavail * st.f_frsize:
+            return config.workarea
+        return fast
+
+    def resume_path(self):
+        """
+        Returns
+        -------
+        str
+            The image's resumable scratch directory, where an earlier
+            attempt left it if it is still there
+        """
+        digest = hashlib.sha1(self.inputfile.encode('utf-8')).hexdigest()[:12]
+        name = '{}.{}'.format(os.path.splitext(os.path.basename(self.inputfile))[0], digest)
+        for root in (getattr(config, 'fast_workarea', None), config.workarea):
+            if root and os.path.isdir(os.path.join(root, name)):
+                return os.path.join(root, name)
+        return os.path.join(self.root(), name)
+
+    def create(self):
+        """
+        Returns
+        -------
+        str
+            Path of the scratch directory
+        """
+        if self.resumable:
+            path = self.resume_path()
+            try:
+                os.makedirs(path)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            try:
+                self.lock = open(os.path.join(path, '.lock'), 'w')
+                fcntl.flock(self.lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self.path = path
+                return self.path
+            except (IOError, OSError):
+                # In use by another worker, or removed by it as it finished
+                if self.lock is not None:
+                    self.lock.close()
+                    self.lock = None
+
+        prefix = os.path.splitext(os.path.basename(self.inputfile))[0] + '.'
+        self.path = tempfile.mkdtemp(prefix=prefix, dir=self.root())
+        return self.path
+
+    def cleanup(self, failed=False):
+        """
+        Parameters
+        ----------
+        failed : bool
+            True if processing the image failed
+        """
+        # A locked, resumable directory is kept for the next attempt
+        keep = failed and (self.keep_on_failure or self.lock is not None)
+        if self.path is not None and not keep:
+            # Removed while still locked, so no other worker starts using it
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path = None
+        if self.lock is not None:
+            self.lock.close()
+            self.lock = None
+
+    def __enter__(self):
+        return self.create()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup(failed=exc_type is not None)
+        return False
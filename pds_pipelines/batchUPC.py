@@ -1,11 +1,11 @@
 #!/usr/bin/env python
 
-import json
 import logging
 import argparse
 from pds_pipelines.RedisQueue import RedisQueue
 from pds_pipelines.db import db_connect
 from pds_pipelines.models.pds_models import Files, Archives
+from pds_pipelines.ConfigCache import load_pds_info
 from pds_pipelines.config import pds_info, pds_db, pds_log
 
 
@@ -29,7 +29,7 @@ def main():
     args = Args()
     args.parse_args()
 
-    PDS_info = json.load(open(pds_info, 'r'))
+    PDS_info = load_pds_info(pds_info)
     reddis_queue = RedisQueue('UPC_ReadyQueue')
     logger = logging.getLogger('UPC_Queueing')
     level = logging.getLevelName(args.log_level)
@@ -3,11 +3,11 @@
 import sys
 import logging
 import argparse
-import json
 
 from pds_pipelines.RedisQueue import RedisQueue
 from pds_pipelines.db import db_connect
 from pds_pipelines.models.pds_models import Files
+from pds_pipelines.ConfigCache import load_pds_info
 from pds_pipelines.config import pds_info, pds_log, pds_db
 
 class Args(object):
@@ -54,7 +54,7 @@ def main():
 
     logger.info('Starting Process')
 
-    PDSinfoDICT = json.load(open(pds_info, 'r'))
+    PDSinfoDICT = load_pds_info(pds_info)
     archiveID = PDSinfoDICT[args.archive]['archiveid']
 
     RQ = RedisQueue('Browse_ReadyQueue')
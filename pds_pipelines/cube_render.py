@@ -0,0 +1,381 @@
+#!/usr/bin/env python
+
+import os
+import math
+
+# numpy and Pillow are only needed when config.inprocess_render is set
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from pds_pipelines import config
+from pds_pipelines.LabelCache import load_label
+from pds_pipelines import encoders as image_encoders
+
+# ISIS Pixels/Type -> numpy type code
+PIXEL_TYPES = {'UnsignedByte': 'u1',
+               'SignedWord': 'i2',
+               'UnsignedWord': 'u2',
+               'Real': 'f4'}
+
+# Range of raw values that are not special pixels (Null, Lrs, Lis, His,
+#  Hrs), from ISIS SpecialPixel.h
+VALID_RANGES = {'UnsignedByte': (1, 254),
+                'SignedWord': (-32752, 32767),
+                'UnsignedWord': (3, 65522),
+                'Real': (-3.40282265508890445e+38, 3.40282346638528860e+38)}
+
+# isis2std format -> Pillow format
+FORMATS = {'jpeg': 'JPEG', 'jpg': 'JPEG', 'png': 'PNG'}
+
+# Lines read at once when the reduce scale is small
+STRIP_LINES = 256
+
+
+def enabled():
+    """
+    Returns
+    -------
+    bool
+        True if config.inprocess_render is set and numpy and Pillow are
+        installed
+    """
+    return bool(getattr(config, 'inprocess_render', False)) and np is not None and Image is not None
+
+
+class CubeCore(object):
+    """
+    Read only, memory mapped view of the pixels of an ISIS cube with an
+    attached label.
+
+    Attributes
+    ----------
+    path : str
+    lines : int
+    samples : int
+    bands : int
+    pixel_type : str
+    base : float
+    multiplier : float
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path : str
+
+        Raises
+        ------
+        ValueError
+            If the cube's layout or pixel type isn't supported
+        """
+        label = load_label(path)
+        core = label['IsisCube']['Core']
+        if '^Core' in core:
+            raise ValueError('{} has a detached core'.format(path))
+
+        dims = core['Dimensions']
+        pixels = core['Pixels']
+        self.path = path
+        self.lines = int(dims['Lines'])
+        self.samples = int(dims['Samples'])
+        self.bands = int(dims['Bands'])
+        self.pixel_type = str(pixels['Type'])
+        if self.pixel_type not in PIXEL_TYPES:
+            raise ValueError('Unsupported pixel type {}'.format(self.pixel_type))
+        self.base = float(pixels.get('Base', 0.0))
+        self.multiplier = float(pixels.get('Multiplier', 1.0))
+
+        order = '>' if str(pixels.get('ByteOrder', 'Lsb')).lower() == 'msb' else '<'
+        dtype = np.dtype(order + PIXEL_TYPES[self.pixel_type])
+        offset = int(core['StartByte']) - 1
+
+        layout = str(core.get('Format', 'Tile'))
+        if layout == 'BandSequential':
+            self.tile_lines = self.tile_samples = None
+            shape = (self.bands, self.lines, self.samples)
+        elif layout == 'Tile':
+            self.tile_lines = int(core['TileLines'])
+            self.tile_samples = int(core['TileSamples'])
+            shape = (self.bands,
+                     int(math.ceil(self.lines / float(self.tile_lines))),
+                     int(math.ceil(self.samples / float(self.tile_samples))),
+                     self.tile_lines, self.tile_samples)
+        else:
+            raise ValueError('Unsupported cube format {}'.format(layout))
+
+        self.data = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+
+    def rows(self, band, start, stop):
+        """
+        Parameters
+        ----------
+        band : int
+            0 based
+        start : int
+            First line, 0 based
+        stop : int
+            Line after the last
+
+        Returns
+        -------
+        ndarray
+            (stop - start, samples) raw pixels
+        """
+        if self.tile_lines is None:
+            return self.data[band, start:stop]
+
+        parts = []
+        for tile_row in range(start // self.tile_lines, (stop - 1) // self.tile_lines + 1):
+            first = max(start - tile_row * self.tile_lines, 0)
+            last = min(stop - tile_row * self.tile_lines, self.tile_lines)
+            # (tiles across, lines, tile samples) -> (lines, samples)
+            tiles = self.data[band, tile_row, :, first:last, :]
+            part = tiles.transpose(1, 0, 2).reshape(last - first, -1)
+            parts.append(part[:, :self.samples])
+        return np.concatenate(parts)
+
+    def values(self, raw):
+        """
+        Parameters
+        ----------
+        raw : ndarray
+
+        Returns
+        -------
+        ndarray
+            float64 pixel values, NaN where raw is a special pixel
+        """
+        low, high = VALID_RANGES[self.pixel_type]
+        out = raw.astype(np.float64) * self.multiplier + self.base
+        out[(raw < low) | (raw > high) | ~np.isfinite(raw)] = np.nan
+        return out
+
+
+def supported(path):
+    """
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    bool
+        True if rendering is enabled and path can be rendered in process
+    """
+    if not enabled():
+        return False
+    try:
+        CubeCore(path)
+    except (ValueError, KeyError, IOError, OSError):
+        return False
+    return True
+
+
+def _edges(n, scale):
+    """ Boundaries of the output pixels along an axis of n input pixels. """
+    size = max(int(math.ceil(n / float(scale))), 1)
+    edges = np.minimum((np.arange(size + 1) * float(scale)).astype(np.int64), n)
+    edges[-1] = n
+    return edges
+
+
+def reduce_band(core, scale, band=0, algorithm='average'):
+    """ Shrink a band the way ISIS reduce mode=scale does.
+
+    Parameters
+    ----------
+    core : CubeCore
+    scale : float
+        Input pixels per output pixel, in both directions
+    band : int
+        0 based
+    algorithm : str
+        'average' (mean of the valid pixels in each block) or 'nearest'
+
+    Returns
+    -------
+    ndarray
+        float64, NaN where a block has no valid pixels
+    """
+    line_edges = _edges(core.lines, scale)
+    sample_edges = _edges(core.samples, scale)
+
+    if algorithm == 'nearest':
+        rows = np.vstack([core.rows(band, line, line + 1) for line in line_edges[:-1]])
+        return core.values(rows[:, sample_edges[:-1]])
+
+    out = np.empty((len(line_edges) - 1, len(sample_edges) - 1))
+    # Enough output lines per read to read about STRIP_LINES input lines
+    step = max(int(STRIP_LINES // scale), 1)
+    for i in range(0, len(line_edges) - 1, step):
+        j = min(i + step, len(line_edges) - 1)
+        block = core.values(core.rows(band, line_edges[i], line_edges[j]))
+        out[i:j] = _block_mean(block, line_edges[i:j] - line_edges[i], sample_edges[:-1])
+    return out
+
+
+def _block_mean(block, row_starts, sample_starts):
+    """ Mean of the finite values in each block of an array. """
+    valid = np.isfinite(block)
+    sums = np.add.reduceat(np.where(valid, block, 0.0), sample_starts, axis=1)
+    counts = np.add.reduceat(valid.astype(np.int64), sample_starts, axis=1)
+    sums = np.add.reduceat(sums, row_starts, axis=0)
+    counts = np.add.reduceat(counts, row_starts, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def reduce_image(image, scale, algorithm='average'):
+    """ Shrink an already reduced band further, e.g. browse to thumbnail.
+
+    Parameters
+    ----------
+    image : ndarray
+        float, NaN for no data
+    scale : float
+        Pixels of image per output pixel
+    algorithm : str
+        'average' or 'nearest'
+
+    Returns
+    -------
+    ndarray
+    """
+    lines, samples = image.shape
+    line_edges = _edges(lines, scale)
+    sample_edges = _edges(samples, scale)
+    if algorithm == 'nearest':
+        return image[np.ix_(line_edges[:-1], sample_edges[:-1])]
+    return _block_mean(image, line_edges[:-1], sample_edges[:-1])
+
+
+def stretch(image, params):
+    """ Scale to 8 bits the way isis2std does.
+
+    Parameters
+    ----------
+    image : ndarray
+        float, NaN for no data
+    params : dict
+        isis2std recipe parameters: stretch ('linear' or 'manual'),
+        minpercent/maxpercent or minimum/maximum
+
+    Returns
+    -------
+    ndarray
+        uint8, 0 for no data and 1-255 for valid pixels
+    """
+    valid = np.isfinite(image)
+    out = np.zeros(image.shape, dtype=np.uint8)
+    if not valid.any():
+        return out
+
+    if params.get('stretch') == 'manual':
+        low = float(params['minimum'])
+        high = float(params['maximum'])
+    else:
+        low, high = np.percentile(image[valid], [float(params.get('minpercent', 0.5)),
+                                                 float(params.get('maxpercent', 99.5))])
+    if high <= low:
+        high = low + 1.0
+    scaled = (image[valid] - low) / (high - low) * 254.0 + 1.0
+    out[valid] = np.clip(np.round(scaled), 1, 255).astype(np.uint8)
+    return out
+
+
+def _save(image, outfile, std_params, encoders=None):
+    """ Stretch and encode a reduced band, replacing outfile atomically. """
+    if encoders:
+        return image_encoders.encode(Image.fromarray(stretch(image, std_params), 'L'),
+                                     outfile, encoders)
+    fmt = FORMATS.get(str(std_params.get('format', 'jpeg')).lower(), 'JPEG')
+    options = {}
+    if fmt == 'JPEG':
+        options['quality'] = int(std_params.get('quality', 75))
+    tmp = '{}.{}.tmp'.format(outfile, os.getpid())
+    Image.fromarray(stretch(image, std_params), 'L').save(tmp, fmt, **options)
+    os.rename(tmp, outfile)
+    return [outfile]
+
+
+def _algorithm(reduce_params):
+    return 'nearest' if reduce_params.get('algorithm') == 'nearest' else 'average'
+
+
+def render_cube(path, outfile, scale, reduce_params=None, std_params=None, encoders=None):
+    """ Make a reduced, stretched 8 bit image of a cube's first band in
+    process, in place of ISIS reduce followed by isis2std.
+
+    Parameters
+    ----------
+    path : str
+        Cube with an attached label
+    outfile : str
+    scale : float
+        reduce's sscale/lscale
+    reduce_params : dict
+        reduce recipe parameters; 'algorithm' is used
+    std_params : dict
+        isis2std recipe parameters; 'format', 'quality' and the stretch
+        parameters are used
+    encoders : list
+        If given, the formats written in place of isis2std's, see
+        encoders.product_encoders
+
+    Returns
+    -------
+    list
+        Paths written
+    """
+    reduce_params = reduce_params or {}
+    std_params = std_params or {}
+    image = reduce_band(CubeCore(path), scale, 0, _algorithm(reduce_params))
+    return _save(image, outfile, std_params, encoders)
+
+
+def render_pyramid(path, sizes, reduce_params=None, std_params=None):
+    """ Make several sizes of image of a cube's first band, reading the cube
+    once.
+
+    The cube is reduced to the largest size, and each smaller size is
+    reduced from the size above it, so extra sizes cost little.
+
+    Parameters
+    ----------
+    path : str
+        Cube with an attached label
+    sizes : list
+        (outfile, scale, encoders) tuples, scale relative to the cube and
+        encoders as for render_cube
+    reduce_params : dict
+    std_params : dict
+        See render_cube
+
+    Returns
+    -------
+    list
+        Paths written for each size, in the order of sizes
+    """
+    reduce_params = reduce_params or {}
+    std_params = std_params or {}
+    algorithm = _algorithm(reduce_params)
+
+    written = {}
+    image = None
+    current = 1.0
+    for outfile, scale, encoders in sorted(sizes, key=lambda size: size[1]):
+        scale = max(float(scale), 1.0)
+        if image is None:
+            image = reduce_band(CubeCore(path), scale, 0, algorithm)
+        elif scale > current:
+            image = reduce_image(image, scale / current, algorithm)
+        current = max(scale, current)
+        written[outfile] = _save(image, outfile, std_params, encoders)
+    return [written[size[0]] for size in sizes]
@@ -0,0 +1,405 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import copy
+import shutil
+import argparse
+from collections import OrderedDict
+
+from pysis.exceptions import ProcessError
+
+from pds_pipelines.RedisLock import RedisLock
+from pds_pipelines.RedisQueue import RedisQueue
+from pds_pipelines.Recipe import Recipe
+from pds_pipelines.Process import Process
+from pds_pipelines.StepRunner import run_isis
+from pds_pipelines.CubeCache import cacheable, step_signature
+from pds_pipelines.IngestProcess import get_checksum
+from pds_pipelines.UPC_process import UPCworker, AddProcessDB, get_logger, serve
+from pds_pipelines.thumbnail_process import scaleFactor as thumbnail_scale
+from pds_pipelines.browse_process import scaleFactor as browse_scale
+from pds_pipelines.models.upc_models import MetaString
+from pds_pipelines.resources import pipeline_slots
+from pds_pipelines.LabelCache import load_label
+from pds_pipelines.ProductPaths import makedir, product_url
+from pds_pipelines.GroundRange import edr_source
+from pds_pipelines import cube_render
+from pds_pipelines.encoders import product_encoders, stage, transcode
+from pds_pipelines.config import lock_obj
+
+# Products made from the 'reduced' recipe:
+#  name -> (scale factor function, file suffix, url prefix, url typename)
+PRODUCTS = OrderedDict([
+    ('thumbnail', (thumbnail_scale, '.thumbnail.jpg', '$thumbnail_server/', 'thumbnailurl')),
+    ('browse', (browse_scale, '.browse.jpg', '$browse_server/', 'fullimageurl')),
+])
+
+
+class Args(object):
+    """
+    Attributes
+    ----------
+    workers : int
+    pipeline_memory : int
+    """
+    def __init__(self):
+        pass
+
+    def parse_args(self):
+        parser = argparse.ArgumentParser(description="Derived Products Process")
+
+        parser.add_argument('--workers', '-w', dest="workers", type=int,
+                            help="Number of images to process at once. "
+                                 "Defaults to as many as fit in the slurm allocation.")
+        parser.add_argument('--pipeline-memory', dest="pipeline_memory", type=int,
+                            help="Memory in MB one pipeline needs, used to size --workers.",
+                            default=2048)
+
+        args = parser.parse_args()
+        self.workers = args.workers
+        self.pipeline_memory = args.pipeline_memory
+
+
+def shared_steps(first, second):
+    """
+    Parameters
+    ----------
+    first : list
+        Recipe.getRecipe() list of {process: parameters}
+    second : list
+
+    Returns
+    -------
+    int
+        Number of leading import/SPICE/calibration steps that are the same
+        in both recipes
+    """
+    n = 0
+    for a, b in zip(first, second):
+        if not cacheable(list(a.keys())[0]) or step_signature(a) != step_signature(b):
+            break
+        n += 1
+    return n
+
+
+def run_steps(steps, update, infile, scratch, logger, profiler=None):
+    """ Run recipe steps, each step's output cube replacing infile.
+
+    Parameters
+    ----------
+    steps : list
+        {process: parameters} entries to run, in order
+    update : callable
+        update(process, processOBJ) sets the file (and any computed)
+        parameters of a step and returns the cube that replaces infile when
+        the step has run, or None to skip the step
+    infile : str
+    scratch : str
+        Working directory for the ISIS applications
+    logger : Logger
+    profiler : StepProfiler
+
+    Returns
+    -------
+    str
+        Name of the step that failed, or None if all steps ran
+    """
+    for step in steps:
+        process = list(step.keys())[0]
+        processOBJ = Process()
+        processOBJ.ProcessFromRecipe(process, steps)
+        result = update(process, processOBJ)
+        if result is None:
+            continue
+        for k, v in processOBJ.getProcess().items():
+            try:
+                run_isis(k, v, cwd=scratch, profiler=profiler)
+            except ProcessError as e:
+                logger.error('Process %s :: Error %s', k, e)
+                return process
+        if os.path.isfile(result):
+            os.rename(result, infile)
+    return None
+
+
+def render_params(steps):
+    """
+    Parameters
+    ----------
+    steps : list
+        {process: parameters} entries from reduce on
+
+    Returns
+    -------
+    tuple
+        (reduce parameters, isis2std parameters) if steps are only reduce
+        then isis2std, which cube_render can do in process, otherwise None
+    """
+    if [list(step.keys())[0] for step in steps] != ['reduce', 'isis2std']:
+        return None
+    return steps[0]['reduce'], steps[1]['isis2std']
+
+
+class DerivedWorker(UPCworker):
+    """
+    Makes the UPC metadata, thumbnail and browse image of an image in one
+    pass.
+
+    The 'upc' and 'reduced' recipes usually start with the same import and
+    spiceinit steps.  Those run once; the UPC steps then run on a copy of
+    the result, and the reduced steps on the original, with only the final
+    reduce/isis2std repeated for each of the thumbnail and browse images.
+    All of the UPC rows and product URLs are written in one transaction.
+    """
+
+    logger_name = 'Derived_Process'
+    stage = 'derived'
+    # Runs its steps in one pass without checkpoints
+    resumable = False
+
+    def __init__(self):
+        UPCworker.__init__(self)
+        self.url_tids = dict((product, self.registry.getTypeid(typename))
+                             for product, (_, _, _, typename) in PRODUCTS.items())
+
+    def run(self, item, scratch):
+        inputfile = item[0]
+        fid = item[1]
+        archive = item[2]
+        logger = self.logger
+        PDSinfoDICT = self.PDSinfoDICT
+
+        logger.info('Starting Process: %s', inputfile)
+        self.profiler.item(inputfile, archive)
+
+        recipe_json = Recipe().getRecipeJSON(archive)
+        upcOBJ = Recipe()
+        upcOBJ.AddJsonFile(recipe_json, 'upc')
+        reducedOBJ = Recipe()
+        reducedOBJ.AddJsonFile(recipe_json, 'reduced')
+        upc_steps = upcOBJ.getRecipe()
+        reduced_steps = reducedOBJ.getRecipe()
+
+        n_shared = shared_steps(upc_steps, reduced_steps)
+        # The thumbnail and browse images share every reduced step before reduce
+        n_reduced = next((i for i, step in enumerate(reduced_steps) if 'reduce' in step),
+                         len(reduced_steps))
+
+        basename = os.path.splitext(str(os.path.basename(inputfile)))[0]
+        infile = os.path.join(scratch, basename + '.input.cub')
+        outfile = os.path.join(scratch, basename + '.output.cub')
+        upc_infile = os.path.join(scratch, basename + '.UPCinput.cub')
+        upc_outfile = os.path.join(scratch, basename + '.UPCoutput.cub')
+        caminfoOUT = os.path.join(scratch, basename + '_caminfo.pvl')
+        EDRsource = edr_source(inputfile)
+
+        def shared_params(process, processOBJ):
+            if '2isis' in process:
+                processOBJ.updateParameter('from_', inputfile)
+                processOBJ.updateParameter('to', outfile)
+            elif process == 'spiceinit':
+                processOBJ.updateParameter('from_', infile)
+            else:
+                processOBJ.updateParameter('from_', infile)
+                processOBJ.updateParameter('to', outfile)
+            return outfile
+
+        def upc_params(process, processOBJ):
+            thmproc_odd = os.path.splitext(upc_outfile)[0] + '.raw.odd.cub'
+            thmproc_even = os.path.splitext(upc_outfile)[0] + '.raw.even.cub'
+            if '2isis' in process or process == 'thmproc':
+                processOBJ.updateParameter('from_', inputfile)
+                processOBJ.updateParameter('to', upc_outfile)
+            elif process == 'handmos':
+                processOBJ.updateParameter('from_', thmproc_even)
+                processOBJ.updateParameter('mosaic', thmproc_odd)
+                return thmproc_odd
+            elif process in ('spiceinit', 'footprintinit'):
+                processOBJ.updateParameter('from_', upc_infile)
+            elif process == 'cubeatt':
+                processOBJ.updateParameter('from_', upc_infile + '+1')
+                processOBJ.updateParameter('to', upc_outfile)
+            elif process == 'caminfo':
+                processOBJ.updateParameter('from_', upc_infile)
+                processOBJ.updateParameter('to', caminfoOUT)
+            else:
+                processOBJ.updateParameter('from_', upc_infile)
+                processOBJ.updateParameter('to', upc_outfile)
+            return upc_outfile
+
+        def reduced_params(process, processOBJ):
+            if '2isis' in process:
+                processOBJ.updateParameter('from_', inputfile)
+                processOBJ.updateParameter('to', outfile)
+            elif process == 'spiceinit':
+                processOBJ.updateParameter('from_', infile)
+            elif process == 'cubeatt':
+                label = load_label(infile)
+                bands = PDSinfoDICT[archive]['bandorder']
+                query_bands = label['IsisCube']['BandBin'][PDSinfoDICT[archive]['bandbinQuery']]
+                try:
+                    query_band_set = set(query_bands)
+                except:
+                    query_band_set = set([query_bands])
+                # First band in 'bandorder' the image has, default to 1
+                exband = next((band for band in bands if band in query_band_set), 1)
+                processOBJ.updateParameter('from_', infile + '+' + str(exband))
+                processOBJ.updateParameter('to', outfile)
+            elif process == 'ctxevenodd':
+                # Even/odd correction only applies to unsummed images
+                label = load_label(infile)
+                if label['IsisCube']['Instrument']['SpatialSumming'] != 1:
+                    return None
+                processOBJ.updateParameter('from_', infile)
+                processOBJ.updateParameter('to', outfile)
+            else:
+                processOBJ.updateParameter('from_', infile)
+                processOBJ.updateParameter('to', outfile)
+            return outfile
+
+        # Shared import/spiceinit steps
+        error_cube = infile
+        processError = run_steps(upc_steps[:n_shared], shared_params, infile,
+                                 scratch, logger, self.profiler)
+
+        # UPC steps, on a copy of the shared cube as footprintinit changes it
+        if processError is None:
+            if n_shared:
+                shutil.copyfile(infile, upc_infile)
+            error_cube = upc_infile
+            processError = run_steps(upc_steps[n_shared:], upc_params, upc_infile,
+                                     scratch, logger, self.profiler)
+
+        if processError is not None:
+            self.record_error(inputfile, fid, error_cube, processError, EDRsource, scratch)
+            return 'error'
+
+        label = load_label(upc_infile)
+        infile_bandlist = label['IsisCube']['BandBin'][PDSinfoDICT[archive]['bandbinQuery']]
+        infile_centerlist = label['IsisCube']['BandBin']['Center']
+        checksum = get_checksum(inputfile)
+        try:
+            UPCid = self.add_upc_rows(inputfile, archive, caminfoOUT, infile_bandlist,
+                                      infile_centerlist, checksum, EDRsource)
+        except Exception as e:
+            logger.error("Unable to add UPC results for %s: %s", inputfile, e)
+            self.record_error(inputfile, fid, upc_infile, 'upc_write', EDRsource, scratch)
+            return 'error'
+
+        # Reduced steps the thumbnail and browse images have in common
+        reducedError = run_steps(reduced_steps[n_shared:n_reduced], reduced_params,
+                                 infile, scratch, logger, self.profiler)
+        if reducedError is None:
+            finalpath = makedir(inputfile)
+            label = load_label(infile)
+            Nline = int(label['IsisCube']['Core']['Dimensions']['Lines'])
+            Nsample = int(label['IsisCube']['Core']['Dimensions']['Samples'])
+            finals = dict((product, finalpath + '/' + basename + suffix)
+                          for product, (_, suffix, _, _) in PRODUCTS.items())
+            scales = dict((product, scale(Nline, Nsample, recipe_json))
+                          for product, (scale, _, _, _) in PRODUCTS.items())
+            # Largest product first; each smaller one is reduced from the one
+            #  above it rather than from the full resolution cube, which is
+            #  only valid when nothing but reduce and isis2std follow reduce
+            pyramid = sorted(PRODUCTS, key=lambda product: scales[product])
+            # Formats written in place of isis2std's, if the recipe lists any
+            encoders = dict((product, product_encoders(recipe_json, 'reduced', product))
+                            for product in PRODUCTS)
+            render = render_params(reduced_steps[n_reduced:])
+            done = []
+
+            if render is not None and cube_render.supported(infile):
+                try:
+                    written = cube_render.render_pyramid(
+                        infile, [(finals[product], scales[product], encoders[product])
+                                 for product in pyramid], *render)
+                    for product, paths in zip(pyramid, written):
+                        finals[product] = paths[0]
+                    done = pyramid
+                except Exception as e:
+                    logger.error('Unable to render %s, using ISIS instead: %s', inputfile, e)
+            if not done:
+                source, source_scale = infile, 1.0
+                for product in pyramid:
+                    product_in = os.path.join(scratch, basename + '.' + product + '.cub')
+                    product_out = os.path.join(scratch, basename + '.' + product + '.out.cub')
+                    final_outfile = finals[product]
+                    staged = os.path.join(scratch, basename + '.' + product + '.png')
+                    Sfactor = max(scales[product] / source_scale, 1)
+
+                    def product_params(process, processOBJ):
+                        if process == 'reduce':
+                            processOBJ.updateParameter('lscale', Sfactor)
+                            processOBJ.updateParameter('sscale', Sfactor)
+                            processOBJ.updateParameter('from_', source)
+                            processOBJ.updateParameter('to', product_out)
+                        elif process == 'isis2std':
+                            processOBJ.updateParameter('from_', product_in)
+                            processOBJ.updateParameter('to', final_outfile)
+                            if encoders[product]:
+                                stage(processOBJ, staged)
+                        else:
+                            processOBJ.updateParameter('from_', product_in)
+                            processOBJ.updateParameter('to', product_out)
+                        return product_out
+
+                    # Copied, as staging changes the isis2std parameters
+                    if run_steps(copy.deepcopy(reduced_steps[n_reduced:]), product_params,
+                                 product_in, scratch, logger, self.profiler) is None:
+                        if encoders[product]:
+                            try:
+                                finals[product] = transcode(staged, final_outfile,
+                                                            encoders[product])[0]
+                            except (IOError, OSError) as e:
+                                logger.error('Unable to encode %s: %s', final_outfile, e)
+                                continue
+                        done.append(product)
+                        if render is not None:
+                            source, source_scale = product_in, max(scales[product], source_scale)
+
+            for product in done:
+                server = PRODUCTS[product][2]
+                url = product_url(finals[product], server)
+                self.writer.add(MetaString(upcid=UPCid,
+                                           typeid=self.url_tids[product],
+                                           value=url))
+                logger.info('%s Process Success: %s', product, inputfile)
+
+        else:
+            logger.error('Error running %s on file %s', reducedError, inputfile)
+
+        try:
+            self.writer.write()
+        except Exception as e:
+            logger.error("Unable to write derived products for %s: %s", inputfile, e)
+            self.record_error(inputfile, fid, upc_infile, 'upc_write', EDRsource, scratch)
+            return 'error'
+        # The UPC rows are kept, but the image isn't done without its
+        #  thumbnail and browse images
+        AddProcessDB(self.pds_session, fid, reducedError is None)
+        return 'success' if reducedError is None else 'error'
+
+
+def main():
+    args = Args()
+    args.parse_args()
+
+    logger = get_logger('Derived_Process')
+
+    # Redis Queue Objects
+    RQ_main = RedisQueue('Derived_ReadyQueue')
+    logger.info("Derived Processing Queue: %s", RQ_main.id_name)
+    RQ_lock = RedisLock(lock_obj)
+    # If the queue isn't registered, add it and set it to "running"
+    RQ_lock.add({RQ_main.id_name: '1'})
+
+    workers = args.workers or pipeline_slots(args.pipeline_memory)
+    logger.info("Running %s derived product pipelines", workers)
+
+    serve(RQ_main, RQ_lock, workers, logger, DerivedWorker)
+
+    logger.info("Derived processing exited successfully")
+
+if __name__ == "__main__":
+    sys.exit(main())
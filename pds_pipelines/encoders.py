@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+import os
+
+# Pillow is only needed when a recipe lists encoders
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from pds_pipelines.ConfigCache import load_recipe
+
+# encoder format -> (Pillow format, file extension)
+FORMATS = {'jpeg': ('JPEG', '.jpg'),
+           'png': ('PNG', '.png'),
+           'webp': ('WEBP', '.webp'),
+           'avif': ('AVIF', '.avif')}
+
+# Also accepted as format names
+ALIASES = {'jpg': 'jpeg'}
+
+DEFAULT_QUALITY = {'jpeg': 75, 'webp': 75, 'avif': 60}
+
+
+def _flag(value):
+    return str(value).lower() in ('yes', 'true', '1')
+
+
+def available(fmt):
+    """
+    Parameters
+    ----------
+    fmt : str
+        Encoder format, e.g. 'webp'
+
+    Returns
+    -------
+    bool
+        True if Pillow is installed and can write fmt
+    """
+    if Image is None or fmt not in FORMATS:
+        return False
+    Image.init()
+    return FORMATS[fmt][0] in Image.SAVE
+
+
+def product_encoders(jsonfile, section, product):
+    """ Encoders a recipe lists for a product, e.g.
+
+        "reduced": {
+            "thumbnail": {
+                ...
+                "encoders": [{"format": "jpeg", "quality": "80"},
+                             {"format": "webp", "quality": "70"}]
+            }
+        }
+
+    Parameters
+    ----------
+    jsonfile : str
+        Recipe file
+    section : str
+        e.g. 'reduced'
+    product : str
+        e.g. 'thumbnail' or 'browse'
+
+    Returns
+    -------
+    list
+        Encoder parameter dicts, each with a lower cased 'format', in the
+        order listed, leaving out formats Pillow can't write here; empty if
+        the recipe lists none, in which case isis2std writes the product
+    """
+    listed = load_recipe(jsonfile).get(section, {}).get(product, {}).get('encoders', [])
+    encoders = []
+    for encoder in listed:
+        encoder = dict(encoder)
+        fmt = str(encoder.get('format', 'jpeg')).lower()
+        encoder['format'] = ALIASES.get(fmt, fmt)
+        if available(encoder['format']):
+            encoders.append(encoder)
+    return encoders
+
+
+def save_options(encoder):
+    """
+    Parameters
+    ----------
+    encoder : dict
+        Encoder parameters: format, and optionally quality (jpeg, webp,
+        avif), progressive (jpeg, default yes), lossless (webp), method
+        (webp), speed (avif) and compress_level (png)
+
+    Returns
+    -------
+    dict
+        Keyword arguments for Image.save
+    """
+    fmt = encoder['format']
+    options = {}
+    if fmt in DEFAULT_QUALITY:
+        options['quality'] = int(encoder.get('quality', DEFAULT_QUALITY[fmt]))
+    if fmt == 'jpeg':
+        options['optimize'] = True
+        options['progressive'] = _flag(encoder.get('progressive', 'yes'))
+    elif fmt == 'png':
+        options['optimize'] = True
+        options['compress_level'] = int(encoder.get('compress_level', 9))
+    elif fmt == 'webp':
+        options['lossless'] = _flag(encoder.get('lossless', 'no'))
+        options['method'] = int(encoder.get('method', 6))
+    elif fmt == 'avif':
+        options['speed'] = int(encoder.get('speed', 6))
+    return options
+
+
+def output_path(outfile, encoder):
+    """
+    Parameters
+    ----------
+    outfile : str
+        Product path, e.g. .../name.thumbnail.jpg
+    encoder : dict
+
+    Returns
+    -------
+    str
+        outfile with the extension of the encoder's format
+    """
+    return os.path.splitext(outfile)[0] + FORMATS[encoder['format']][1]
+
+
+def encode(image, outfile, encoders):
+    """ Write an image in each of several formats.
+
+    Parameters
+    ----------
+    image : Image
+        Pillow image
+    outfile : str
+        Product path; each output is named after it, see output_path
+    encoders : list
+        Encoder parameter dicts, see product_encoders
+
+    Returns
+    -------
+    list
+        Paths written, in the order of encoders
+    """
+    written = []
+    for encoder in encoders:
+        fmt = encoder['format']
+        out = image
+        if fmt == 'jpeg' and out.mode not in ('L', 'RGB'):
+            out = out.convert('RGB' if len(out.getbands()) >= 3 else 'L')
+        path = output_path(outfile, encoder)
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        out.save(tmp, FORMATS[fmt][0], **save_options(encoder))
+        os.rename(tmp, path)
+        written.append(path)
+    return written
+
+
+def transcode(infile, outfile, encoders):
+    """ Encode an image isis2std wrote, e.g. as PNG, in each of several
+    formats, decoding it once.
+
+    Parameters
+    ----------
+    infile : str
+        Lossless image to start from; removed when done
+    outfile : str
+    encoders : list
+
+    Returns
+    -------
+    list
+        Paths written, see encode
+    """
+    image = Image.open(infile)
+    image.load()
+    try:
+        return encode(image, outfile, encoders)
+    finally:
+        os.remove(infile)
+
+
+def stage(processOBJ, staged):
+    """ Make an isis2std step write a PNG for transcode to start from.
+
+    Parameters
+    ----------
+    processOBJ : Process
+        The isis2std step
+    staged : str
+        Path for the PNG, e.g. in the workarea
+    """
+    params = processOBJ.getProcess()[processOBJ.getProcessName()]
+    params.pop('quality', None)
+    params['format'] = 'png'
+    params['to'] = staged
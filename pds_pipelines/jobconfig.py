@@ -68,6 +68,17 @@ jobconfig = {'di': {'logger': 'DIprocess_HPCjob',
                         'partition': 'pds',
                         'cmd': cmd_dir + 'browse_process.py',
                         'SBfile': slurm_log + 'Bhpc@date@.sbatch'},
+             'derived': {'logger': 'Derivedprocess_HPCjob',
+                         'handle': pds_log + 'Process.log',
+                         'info': 'Starting Derived Products Process HPC Job Submission',
+                         'name': 'PDS_Derivedprocess',
+                         'stdout': slurm_log + 'Derivedprocess_%A_%a.out',
+                         'stderr': slurm_log + 'Derivedprocess_%A_%a.err',
+                         'memory': '8192',
+                         'wallclock': '20:00:00',
+                         'partition': 'pds',
+                         'cmd': cmd_dir + 'derived_process.py',
+                         'SBfile': slurm_log + 'Dhpc@date@.sbatch'},
              'projectionBrowse': {'logger': 'ProjectionBrowseProcess_HPCjob',
                                   'handle': pds_log + 'Process.log',
                                   'info': 'Starting Projection Browse Process HPC Job Submission',
@@ -1,6 +1,6 @@
 from sqlalchemy.ext.declarative import declarative_base, declared_attr
-from sqlalchemy import (Column, Integer, Float,
-                        Time, String, Boolean, PrimaryKeyConstraint, ForeignKey)
+from sqlalchemy import (Column, Integer, SmallInteger, BigInteger, Float,
+                        Time, String, Boolean, PrimaryKeyConstraint, ForeignKey, Index)
 from geoalchemy2 import Geometry
 
 import datetime
@@ -33,6 +33,8 @@ def create_table(keytype, *args, **kwargs):
 
 class DataFiles(Base):
     __tablename__ = 'datafiles'
+    # Images are looked up by serial number when their products are added
+    __table_args__ = (Index('datafiles_isisid_idx', 'isisid'),)
     upcid = Column(Integer, primary_key=True, autoincrement = True)
     isisid = Column(String(256))
     productid = Column(String(256))
@@ -157,6 +159,20 @@ class MetaGeometry(Meta, Base):
         Base.__init__(self, **kwargs)
 
 
+class MetaTiles(Base):
+    """ Quadtree cells covering a footprint, see TileKeys. """
+    __tablename__ = 'meta_tiles'
+    # (level, cell) first, so cell range scans use the primary key index
+    __table_args__ = (PrimaryKeyConstraint('level', 'cell', 'upcid'),
+                      Index('meta_tiles_upcid_idx', 'upcid'))
+    upcid = Column(Integer)
+    level = Column(SmallInteger)
+    cell = Column(BigInteger)
+
+    def __init__(self, **kwargs):
+        Base.__init__(self, **kwargs)
+
+
 class NewStats(Base):
     __tablename__ = 'new_stats'
     instrumentid = Column(Integer, primary_key=True)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import glob
+import json
+import argparse
+from collections import OrderedDict
+
+from pds_pipelines.config import pds_log
+
+
+class Args(object):
+    """
+    Attributes
+    ----------
+    directory : str
+    stage : str
+    instrument : str
+    sort : str
+    """
+    def __init__(self):
+        pass
+
+    def parse_args(self):
+        parser = argparse.ArgumentParser(description="Summarize ISIS step profiles")
+
+        parser.add_argument('--dir', '-d', dest="directory",
+                            default=os.path.join(pds_log, 'profile'),
+                            help="Directory of StepProfiler records")
+        parser.add_argument('--stage', '-s', dest="stage",
+                            help="Only include this stage (upc, thumbnail, browse, derived, pow, map)")
+        parser.add_argument('--instrument', '-i', dest="instrument",
+                            help="Only include this instrument/archive")
+        parser.add_argument('--sort', dest="sort", default='total_wall',
+                            choices=['total_wall', 'mean_wall', 'total_cpu', 'maxrss', 'count'],
+                            help="Column to sort by, largest first")
+
+        args = parser.parse_args()
+        self.directory = args.directory
+        self.stage = args.stage
+        self.instrument = args.instrument
+        self.sort = args.sort
+
+
+def read_records(directory):
+    """
+    Parameters
+    ----------
+    directory : str
+
+    Yields
+    ------
+    dict
+        One record per ISIS step run
+    """
+    for path in sorted(glob.glob(os.path.join(directory, '*.jsonl'))):
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Partially written line from a killed job
+                    continue
+
+
+def summarize(records):
+    """ Aggregate step records by instrument and step.
+
+    Parameters
+    ----------
+    records : iterable
+        Records as written by StepRunner.StepProfiler
+
+    Returns
+    -------
+    OrderedDict
+        (instrument, step) -> dict of count, errors, total_wall, mean_wall,
+        max_wall, total_cpu, mean_cpu, maxrss (MB), mean_in and mean_out
+        (MB)
+    """
+    groups = OrderedDict()
+    for record in records:
+        key = (record.get('instrument') or 'unknown', record['step'])
+        group = groups.setdefault(key, {'count': 0, 'errors': 0,
+                                        'total_wall': 0.0, 'max_wall': 0.0,
+                                        'total_cpu': 0.0, 'maxrss': 0,
+                                        'in': [], 'out': []})
+        group['count'] += 1
+        if record.get('status'):
+            group['errors'] += 1
+        group['total_wall'] += record['wall']
+        group['max_wall'] = max(group['max_wall'], record['wall'])
+        group['total_cpu'] += record['user'] + record['sys']
+        group['maxrss'] = max(group['maxrss'], record.get('maxrss') or 0)
+        if record.get('in_size') is not None:
+            group['in'].append(record['in_size'])
+        if record.get('out_size') is not None:
+            group['out'].append(record['out_size'])
+
+    MB = 1024.0 * 1024.0
+    for group in groups.values():
+        group['mean_wall'] = group['total_wall'] / group['count']
+        group['mean_cpu'] = group['total_cpu'] / group['count']
+        # ru_maxrss is in kB
+        group['maxrss'] = group['maxrss'] / 1024.0
+        sizes_in = group.pop('in')
+        sizes_out = group.pop('out')
+        group['mean_in'] = sum(sizes_in) / len(sizes_in) / MB if sizes_in else None
+        group['mean_out'] = sum(sizes_out) / len(sizes_out) / MB if sizes_out else None
+    return groups
+
+
+def main():
+    args = Args()
+    args.parse_args()
+
+    records = read_records(args.directory)
+    if args.stage:
+        records = (r for r in records if r.get('stage') == args.stage)
+    if args.instrument:
+        records = (r for r in records if r.get('instrument') == args.instrument)
+    groups = summarize(records)
+
+    if not groups:
+        print("No step records found in {}".format(args.directory))
+        return 1
+
+    rows = sorted(groups.items(), key=lambda kv: kv[1][args.sort], reverse=True)
+
+    header = '{:<16} {:<16} {:>7} {:>6} {:>11} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9}'
+    row = '{:<16} {:<16} {:>7} {:>6} {:>11.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.0f} {:>9} {:>9}'
+    print(header.format('instrument', 'step', 'count', 'errors', 'total_wall',
+                        'mean_wall', 'max_wall', 'mean_cpu', 'maxrss_MB',
+                        'in_MB', 'out_MB'))
+    for (instrument, step), g in rows:
+        print(row.format(instrument[:16], step[:16], g['count'], g['errors'],
+                         g['total_wall'], g['mean_wall'], g['max_wall'],
+                         g['mean_cpu'], g['maxrss'],
+                         '-' if g['mean_in'] is None else '{:.1f}'.format(g['mean_in']),
+                         '-' if g['mean_out'] is None else '{:.1f}'.format(g['mean_out'])))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+import os
+
+
+def _slurm_int(name):
+    """ Read a slurm environment variable as an int.
+
+    Slurm reports some values per node as e.g. '16(x2)' or '16,8'; the first
+    number is the one that applies to the node the job step is on.
+    """
+    value = os.environ.get(name)
+    if not value:
+        return None
+    value = value.split(',')[0].split('(')[0]
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def allocated_cpus():
+    """
+    Returns
+    -------
+    int
+        Number of CPUs this job was allocated by slurm, or the number of CPUs
+        the process may run on when not running under slurm
+    """
+    for name in ('SLURM_CPUS_PER_TASK', 'SLURM_CPUS_ON_NODE',
+                 'SLURM_JOB_CPUS_PER_NODE'):
+        cpus = _slurm_int(name)
+        if cpus:
+            return cpus
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def allocated_memory():
+    """
+    Returns
+    -------
+    int
+        Memory this job was allocated by slurm in MB, or the memory available
+        on the machine when not running under slurm.  None if unknown.
+    """
+    mem = _slurm_int('SLURM_MEM_PER_NODE')
+    if mem:
+        return mem
+    mem = _slurm_int('SLURM_MEM_PER_CPU')
+    if mem:
+        return mem * allocated_cpus()
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+
+def pipeline_slots(memory_per_pipeline, cpus_per_pipeline=1):
+    """ Number of pipelines that fit in this job's allocation.
+
+    Parameters
+    ----------
+    memory_per_pipeline : int
+        Memory one pipeline is expected to need in MB
+    cpus_per_pipeline : int
+        CPUs one pipeline keeps busy; ISIS applications are mostly single
+        threaded
+
+    Returns
+    -------
+    int
+        At least 1
+    """
+    slots = allocated_cpus() // max(cpus_per_pipeline, 1)
+    memory = allocated_memory()
+    if memory and memory_per_pipeline:
+        slots = min(slots, memory // memory_per_pipeline)
+    return max(int(slots), 1)
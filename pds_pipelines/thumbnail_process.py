@@ -1,12 +1,9 @@
 #!/usr/bin/env python
 import os
 import sys
-import pvl
-import json
 import datetime
 import pytz
 import logging
-from pysis import isis
 from pysis.exceptions import ProcessError
 
 from pysis.isis import getsn
@@ -17,10 +14,21 @@ from pds_pipelines.RedisLock import RedisLock
 from pds_pipelines.Recipe import Recipe
 from pds_pipelines.Process import Process
 from pds_pipelines.db import db_connect
+from pds_pipelines.UPCwriter import UPCwriter
 from pds_pipelines.models.upc_models import MetaString, DataFiles
 from pds_pipelines.models.pds_models import ProcessRuns
-from pds_pipelines.config import pds_log, pds_info, workarea, pds_db, upc_db, lock_obj
+from pds_pipelines import config
+from pds_pipelines.config import pds_log, pds_info, pds_db, upc_db, lock_obj
 from pds_pipelines.UPC_process import get_tid
+from pds_pipelines.ConfigCache import load_pds_info, load_recipe
+from pds_pipelines.CubeCache import get_cube_cache, prefix_length
+from pds_pipelines.IngestProcess import get_checksum
+from pds_pipelines.Workarea import Workarea
+from pds_pipelines.StepRunner import run_isis, StepProfiler
+from pds_pipelines.LabelCache import load_label
+from pds_pipelines.ProductPaths import makedir, product_url
+from pds_pipelines import cube_render
+from pds_pipelines.encoders import product_encoders, stage, transcode
 
 def getISISid(infile):
     serial_num = getsn(from_=infile)
@@ -34,7 +42,7 @@ def scaleFactor(line, sample, jsonfile):
 
 #    pdb.set_trace()
 
-    infoDICT = json.load(open(jsonfile, 'r'))
+    infoDICT = load_recipe(jsonfile)
 
     maxLine = int(infoDICT['reduced']['thumbnail']['maxlines'])
     maxSample = int(infoDICT['reduced']['thumbnail']['maxsamples'])
@@ -60,44 +68,66 @@ def scaleFactor(line, sample, jsonfile):
     return scalefactor
 
 
-def makedir(inputfile):
-#    pdb.set_trace()
-
-    temppath = os.path.dirname(inputfile).lower()
-    # @TODO change finalpath back to production path
-    #finalpath = temppath.replace('/pds_san/pds_archive/', '/home/arsanders/PDS-Pipelines/products/thumb/')
-    finalpath = temppath.replace('/pds_san/pds_archive/', '/pds_san/PDS_Derived/UPC/images/')
-
-    if not os.path.exists(finalpath):
-        try:
-            os.makedirs(finalpath, exist_ok=True)
-        except OSError as e:
-            if e.errno != errno.EEXIST:
-                raise
-
-    return finalpath
+def DB_addURL(session, isisSerial, inputfile, tid, writer=None):
+    """
+    Parameters
+    ----------
+    session : Session
+        Session connected to the UPC database
+    isisSerial : str
+    inputfile : str
+        Path of the thumbnail image
+    tid : int
+    writer : UPCwriter
+        Collects the URL row to write in a batch; if None the row is merged
+        and committed now
+
+    Returns
+    -------
+    str
+        'SUCCESS' or 'ERROR'
+    """
+    # Exact match, so the lookup uses datafiles_isisid_idx
+    Qobj = session.query(DataFiles.upcid).filter(
+        DataFiles.isisid == str(isisSerial)).first()
+    if Qobj is None:
+        return 'ERROR'
 
-def DB_addURL(session, isisSerial, inputfile, tid):
-    # pdb.set_trace()
-    newisisSerial = isisSerial.split(':')[0]
-    likestr = '%' + newisisSerial + '%'
-    Qobj = session.query(DataFiles).filter(DataFiles.isisid.like(likestr)).first()
+    outputfile = product_url(inputfile, '$thumbnail_server/')
+    DBinput = MetaString(upcid=Qobj.upcid,
+                         typeid=tid,
+                         value=outputfile)
+    if writer is not None:
+        writer.add(DBinput)
+        return 'SUCCESS'
 
-    if str(Qobj.isisid) == str(isisSerial):
+    try:
+        session.merge(DBinput)
+        session.commit()
+        return 'SUCCESS'
+    except:
+        return 'ERROR'
 
-        outputfile = inputfile.replace('/pds_san/PDS_Derived/UPC/images/', '$thumbnail_server/')
 
-        print(Qobj.upcid)
-        DBinput = MetaString(upcid=Qobj.upcid,
-                             typeid=tid,
-                             value=outputfile)
+def write_urls(writer, session, fids, logger):
+    """ Write the batched URLs, then record their images as processed.
 
-        try:
-            session.merge(DBinput)
-            session.commit()
-            return 'SUCCESS'
-        except:
-            return 'ERROR'
+    Parameters
+    ----------
+    writer : UPCwriter
+    session : Session
+        Session connected to the PDS database
+    fids : list
+        File ids of the images whose URLs writer holds; emptied
+    logger : Logger
+    """
+    try:
+        writer.write()
+        for fid in fids:
+            AddProcessDB(session, fid, 't')
+    except Exception as e:
+        logger.error('Unable to write %s thumbnail URLs: %s', len(fids), e)
+    del fids[:]
 
 
 def AddProcessDB(session, fid, outvalue):
@@ -133,12 +163,21 @@ def main():
     RQ_lock = RedisLock(lock_obj)
     RQ_lock.add({RQ_main.id_name: '1'})
 
-    PDSinfoDICT = json.load(open(pds_info, 'r'))
+    PDSinfoDICT = load_pds_info(pds_info)
 
-    pds_session, pds_session = db_connect(pds_db)
-    upc_session, upc_session = db_connect(upc_db)
+    pds_session, pds_engine = db_connect(pds_db)
+    upc_session, upc_engine = db_connect(upc_db)
 
     tid = get_tid('thumbnailurl', upc_session)
+    # URLs are upserted url_batch images at a time
+    writer = UPCwriter(upc_session)
+    url_batch = getattr(config, 'url_batch', 100)
+    written = []
+    # Converted/spiceinit'ed cubes shared with the UPC stage, if configured
+    cube_cache = get_cube_cache()
+    keep_on_failure = getattr(config, 'keep_failed_workarea', False)
+    # Per step timing and resource use, see profile_report.py
+    profiler = StepProfiler('thumbnail')
 
     while int(RQ_main.QueueSize()) > 0 and RQ_lock.available(RQ_main.id_name):
         item = literal_eval(RQ_main.QueueGet().decode("utf-8"))
@@ -147,99 +186,166 @@ def main():
         archive = item[2]
         if os.path.isfile(inputfile):
             logger.info('Starting Process: %s', inputfile)
+            profiler.item(inputfile, archive)
 
             finalpath = makedir(inputfile)                  
 
             recipeOBJ = Recipe()
             recip_json = recipeOBJ.getRecipeJSON(archive)
             recipeOBJ.AddJsonFile(recip_json, 'reduced')
-            infile = workarea + os.path.splitext(os.path.basename(inputfile))[0] + '.Tinput.cub'
-            outfile = workarea + os.path.splitext(os.path.basename(inputfile))[0] + '.Toutput.cub'
-            status = 'success'
-            for item in recipeOBJ.getProcesses():
-                if status == 'error':
-                    break
-                elif status == 'success':
-                    processOBJ = Process()
-                    processR = processOBJ.ProcessFromRecipe(item, recipeOBJ.getRecipe())
-
-                    if '2isis' in item:
-                        processOBJ.updateParameter('from_', inputfile)
-                        processOBJ.updateParameter('to', outfile)
-                    elif item == 'spiceinit':
-                        processOBJ.updateParameter('from_', infile)
-                    elif item == 'cubeatt':
-                        label = pvl.load(infile)
-                        bands = PDSinfoDICT[archive]['bandorder']
-                        query_bands = label['IsisCube']['BandBin'][PDSinfoDICT[archive]['bandbinQuery']]
-                        # Create a set from the list / single value
-                        try:
-                            query_band_set = set(query_bands)
-                        except:
-                            query_band_set = set([query_bands])
+            # Formats written in place of isis2std's, if the recipe lists any
+            encoders = product_encoders(recip_json, 'reduced', 'thumbnail')
+            # Node local scratch if the image's cubes fit, removed when done
+            with Workarea(inputfile, keep_on_failure) as scratch:
+                infile = os.path.join(scratch, os.path.splitext(os.path.basename(inputfile))[0] + '.Tinput.cub')
+                outfile = os.path.join(scratch, os.path.splitext(os.path.basename(inputfile))[0] + '.Toutput.cub')
+                recipe = recipeOBJ.getRecipe()
+                prefix = 0
+                done = 0
+                if cube_cache is not None:
+                    checksum = get_checksum(inputfile)
+                    prefix = prefix_length(recipe)
+                    # Start from the cube another stage already produced, if any
+                    done = cube_cache.fetch(checksum, recipe, infile)
+                    if done:
+                        logger.info('Reusing %s cached steps for %s', done, inputfile)
+                        isisSerial = getISISid(infile)
+                render = None
+                status = 'success'
+                for step, item in enumerate(recipeOBJ.getProcesses()):
+                    if step < done:
+                        continue
+                    if status == 'error':
+                        break
+                    elif status == 'success':
+                        processOBJ = Process()
+                        processR = processOBJ.ProcessFromRecipe(item, recipeOBJ.getRecipe())
+
+                        if '2isis' in item:
+                            processOBJ.updateParameter('from_', inputfile)
+                            processOBJ.updateParameter('to', outfile)
+                        elif item == 'spiceinit':
+                            processOBJ.updateParameter('from_', infile)
+                        elif item == 'cubeatt':
+                            label = load_label(infile)
+                            bands = PDSinfoDICT[archive]['bandorder']
+                            query_bands = label['IsisCube']['BandBin'][PDSinfoDICT[archive]['bandbinQuery']]
+                            # Create a set from the list / single value
+                            try:
+                                query_band_set = set(query_bands)
+                            except:
+                                query_band_set = set([query_bands])
                         
-                        # Iterate through 'bands' and grab the first value that is present in the
-                        #  set defined by 'bandbinquery' -- if not present, default to 1
-                        exband = next((band for band in bands if band in query_band_set), 1)
-
-                        band_infile = infile + '+' + str(exband)
-                        processOBJ.updateParameter('from_', band_infile)
-                        processOBJ.updateParameter('to', outfile)
-
-                    elif item == 'ctxevenodd':
-                        label = pvl.load(infile)
-                        SS = label['IsisCube']['Instrument']['SpatialSumming']
-                        if SS != 1:
-                            break
-                        else:
+                            # Iterate through 'bands' and grab the first value that is present in the
+                            #  set defined by 'bandbinquery' -- if not present, default to 1
+                            exband = next((band for band in bands if band in query_band_set), 1)
+
+                            band_infile = infile + '+' + str(exband)
+                            processOBJ.updateParameter('from_', band_infile)
+                            processOBJ.updateParameter('to', outfile)
+
+                        elif item == 'ctxevenodd':
+                            label = load_label(infile)
+                            SS = label['IsisCube']['Instrument']['SpatialSumming']
+                            if SS != 1:
+                                break
+                            else:
+                                processOBJ.updateParameter('from_', infile)
+                                processOBJ.updateParameter('to', outfile)
+
+                        elif item == 'reduce':
+                            label = load_label(infile)
+                            Nline = label['IsisCube']['Core']['Dimensions']['Lines']
+                            Nsample = label['IsisCube']['Core']['Dimensions']['Samples']
+                            Nline = int(Nline)
+                            Nsample = int(Nsample)
+                            Sfactor = scaleFactor(Nline, Nsample, recip_json)
+                            processOBJ.updateParameter('lscale', Sfactor)
+                            processOBJ.updateParameter('sscale', Sfactor)
                             processOBJ.updateParameter('from_', infile)
                             processOBJ.updateParameter('to', outfile)
+                            if cube_render.supported(infile):
+                                # Reduced and encoded in process at isis2std
+                                render = (Sfactor, processOBJ.getProcess()['reduce'])
+                                continue
+
+                        elif item == 'isis2std':
+                            final_outfile = finalpath + '/' + os.path.splitext(os.path.basename(inputfile))[0] + '.thumbnail.jpg'
+                            processOBJ.updateParameter('from_', infile)
+                            processOBJ.updateParameter('to', final_outfile)
+                            if render is not None:
+                                try:
+                                    final_outfile = cube_render.render_cube(
+                                        infile, final_outfile, render[0], render[1],
+                                        processOBJ.getProcess()['isis2std'], encoders)[0]
+                                    logger.info('Process reduce/isis2std :: Success (in process)')
+                                    continue
+                                except Exception as e:
+                                    logger.error('Unable to render %s, using ISIS instead: %s',
+                                                 infile, e)
+                                # Run the reduce that was skipped, then isis2std below
+                                try:
+                                    run_isis('reduce', render[1], profiler=profiler)
+                                    logger.info('Process reduce :: Success')
+                                    os.rename(outfile, infile)
+                                except ProcessError as e:
+                                    print(e)
+                                    logger.error('Process reduce :: Error')
+                                    status = 'error'
+                                    continue
+                            if encoders:
+                                # isis2std writes a PNG each encoder starts from
+                                staged = os.path.splitext(outfile)[0] + '.png'
+                                stage(processOBJ, staged)
 
-                    elif item == 'reduce':
-                        label = pvl.load(infile)
-                        Nline = label['IsisCube']['Core']['Dimensions']['Lines']
-                        Nsample = label['IsisCube']['Core']['Dimensions']['Samples']
-                        Nline = int(Nline)
-                        Nsample = int(Nsample)
-                        Sfactor = scaleFactor(Nline, Nsample, recip_json)
-                        processOBJ.updateParameter('lscale', Sfactor)
-                        processOBJ.updateParameter('sscale', Sfactor)
-                        processOBJ.updateParameter('from_', infile)
-                        processOBJ.updateParameter('to', outfile)
-
-                    elif item == 'isis2std':
-                        final_outfile = finalpath + '/' + os.path.splitext(os.path.basename(inputfile))[0] + '.thumbnail.jpg'
-                        processOBJ.updateParameter('from_', infile)
-                        processOBJ.updateParameter('to', final_outfile)
+                        else:
+                            processOBJ.updateParameter('from_', infile)
+                            processOBJ.updateParameter('to', outfile)
 
+                        for k, v in processOBJ.getProcess().items():
+                            try:
+                                run_isis(k, v, profiler=profiler)
+                                logger.info('Process %s :: Success', k)
+                                if os.path.isfile(outfile):
+                                    if '.cub' in outfile:
+                                        os.rename(outfile, infile)
+                                status = 'success'
+                                if '2isis' in item:
+                                    isisSerial = getISISid(infile)
+                            except ProcessError as e:
+                                print(e)
+                                logger.error('Process %s :: Error', k)
+                                status = 'error'
+
+                        if status == 'success' and item == 'isis2std' and encoders:
+                            try:
+                                final_outfile = transcode(staged, final_outfile, encoders)[0]
+                            except (IOError, OSError) as e:
+                                logger.error('Unable to encode %s: %s', final_outfile, e)
+                                status = 'error'
+
+                        if status == 'success' and step == prefix - 1:
+                            try:
+                                cube_cache.store(checksum, recipe, prefix, infile)
+                            except (IOError, OSError) as e:
+                                logger.warn('Unable to cache %s: %s', infile, e)
+                if status == 'success':
+                    if DB_addURL(upc_session, isisSerial, final_outfile, tid, writer) == 'SUCCESS':
+                        written.append(fid)
+                        logger.info('Thumbnail Process Success: %s', inputfile)
                     else:
-                        processOBJ.updateParameter('from_', infile)
-                        processOBJ.updateParameter('to', outfile)
-
-                    for k, v in processOBJ.getProcess().items():
-                        func = getattr(isis, k)
-                        try:
-                            func(**v)
-                            logger.info('Process %s :: Success', k)
-                            if os.path.isfile(outfile):
-                                if '.cub' in outfile:
-                                    os.rename(outfile, infile)
-                            status = 'success'
-                            if '2isis' in item:
-                                isisSerial = getISISid(infile)
-                        except ProcessError as e:
-                            print(e)
-                            logger.error('Process %s :: Error', k)
-                            status = 'error'
-            if status == 'success':
-                DB_addURL(upc_session, isisSerial, final_outfile, tid)
-                os.remove(infile)
-                logger.info('Thumbnail Process Success: %s', inputfile)
-
-                AddProcessDB(pds_session, fid, 't')  
+                        # Not in UPC, so there's no image to add the URL to
+                        AddProcessDB(pds_session, fid, 'f')
+                        logger.error('Thumbnail URL NOT Added, %s Not in UPC', inputfile)
+
+                    if len(written) >= url_batch:
+                        write_urls(writer, pds_session, written, logger)
         else:
             logger.error('File %s Not Found', inputfile)
 
+    if written:
+        write_urls(writer, pds_session, written, logger)
+
     # Close all database connections
     pds_session.close()
     upc_session.close()
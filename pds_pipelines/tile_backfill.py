@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+import sys
+import logging
+import argparse
+
+from sqlalchemy import func, exists
+
+from pds_pipelines.models.upc_models import MetaGeometry, MetaTiles, Keywords
+from pds_pipelines.UPCwriter import UPCwriter
+from pds_pipelines.TileKeys import tile_levels, tile_rows
+from pds_pipelines.db import db_connect
+from pds_pipelines.config import upc_db
+
+
+class Args(object):
+    """
+    Attributes
+    ----------
+    batch : int
+    retile : bool
+    loglevel : int
+    """
+    def __init__(self):
+        self.batch = None
+        self.retile = None
+        self.loglevel = None
+
+    def parse_args(self):
+        parser = argparse.ArgumentParser(description='Add quadtree tile keys for UPC footprints')
+
+        parser.add_argument('--batch', '-b', dest="batch", type=int, default=1000,
+                            help="Number of footprints written per transaction")
+
+        parser.add_argument('--retile', dest="retile", action="store_true",
+                            help="Recompute tiles for footprints that already have them, "
+                                 "e.g. after changing tile_levels")
+
+        parser.add_argument('-v', dest="loglevel",
+                            help="Enable verbose output", action="store_const",
+                            const=logging.INFO, default=logging.WARNING)
+
+        args = parser.parse_args()
+        self.batch = args.batch
+        self.retile = args.retile
+        self.loglevel = args.loglevel
+
+
+def main():
+    args = Args()
+    args.parse_args()
+    logging.basicConfig(level=args.loglevel)
+    logger = logging.getLogger('tile_backfill')
+
+    session, _ = db_connect(upc_db)
+    read_session, _ = db_connect(upc_db)
+    levels = tile_levels()
+
+    footprint_tid = session.query(Keywords.typeid).filter(
+        Keywords.typename == 'isisfootprint').scalar()
+
+    query = read_session.query(MetaGeometry.upcid, func.ST_AsText(MetaGeometry.value)).filter(
+        MetaGeometry.typeid == footprint_tid)
+    if not args.retile:
+        query = query.filter(~exists().where(MetaTiles.upcid == MetaGeometry.upcid))
+
+    writer = UPCwriter(session)
+    upcids = []
+    total = 0
+    # Stream the footprints with a separate session, as the writer commits
+    for upcid, footprint in query.yield_per(args.batch):
+        rows = tile_rows(upcid, footprint, levels)
+        if not rows:
+            continue
+        for row in rows:
+            writer.add(row)
+        upcids.append(upcid)
+
+        if len(upcids) >= args.batch:
+            total += write_batch(session, writer, upcids, args.retile)
+            logger.info('Tiled %s footprints', total)
+            upcids = []
+
+    if upcids:
+        total += write_batch(session, writer, upcids, args.retile)
+    logger.info('Tiled %s footprints in total', total)
+    return 0
+
+
+def write_batch(session, writer, upcids, retile):
+    """
+    Parameters
+    ----------
+    session : Session
+    writer : UPCwriter
+        Holding the tile rows of upcids
+    upcids : list
+    retile : bool
+        Remove the existing tiles of upcids first
+
+    Returns
+    -------
+    int
+        Number of footprints written
+    """
+    if retile:
+        session.query(MetaTiles).filter(MetaTiles.upcid.in_(upcids)).delete(
+            synchronize_session=False)
+    writer.write()
+    return len(upcids)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,3 @@
+-- Index DB_addURL's exact isisid lookup uses (upc_models.DataFiles).
+-- Databases created from the models already have it.
+CREATE INDEX IF NOT EXISTS datafiles_isisid_idx ON datafiles (isisid);
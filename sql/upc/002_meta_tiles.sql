@@ -0,0 +1,9 @@
+-- Quadtree cells covering each footprint (upc_models.MetaTiles, see
+-- TileKeys).  Fill it for existing footprints with tile_backfill.py.
+CREATE TABLE IF NOT EXISTS meta_tiles (
+    upcid integer NOT NULL,
+    level smallint NOT NULL,
+    cell bigint NOT NULL,
+    PRIMARY KEY (level, cell, upcid)
+);
+CREATE INDEX IF NOT EXISTS meta_tiles_upcid_idx ON meta_tiles (upcid);
@@ -0,0 +1,122 @@
+from pds_pipelines.Footprint import (parse_wkt, format_wkt, simplify_ring, snap_ring,
+                                     split_antimeridian, clean_footprint)
+
+
+def box(minx, miny, maxx, maxy):
+    return [(minx, miny), (maxx, miny), (maxx, maxy), (minx, maxy), (minx, miny)]
+
+
+def test_parse_wkt_polygon():
+    assert parse_wkt('POLYGON ((0 0, 1 0, 1 1, 0 0))') == [[[(0, 0), (1, 0), (1, 1), (0, 0)]]]
+
+
+def test_parse_wkt_multipolygon_with_hole():
+    polygons = parse_wkt('MULTIPOLYGON (((0 0, 4 0, 4 4, 0 0), (1 1, 2 1, 2 2, 1 1)), '
+                         '((10 10, 11 10, 11 11, 10 10)))')
+    assert len(polygons) == 2
+    assert len(polygons[0]) == 2
+    assert polygons[1][0][0] == (10, 10)
+
+
+def test_parse_wkt_rejects_other_geometries():
+    assert parse_wkt('POINT (1 2)') is None
+    assert parse_wkt(None) is None
+    assert parse_wkt('POLYGON ((0 0, 1 x, 1 1, 0 0))') is None
+    assert parse_wkt('POLYGON ((0 0, 1 0, 1 1, 0 0)') is None
+
+
+def test_format_wkt_round_trip():
+    polygons = [[box(0, 0, 1.5, 1)]]
+    assert parse_wkt(format_wkt(polygons)) == polygons
+
+
+def test_format_wkt_precision():
+    assert format_wkt([[[(0.123456, -0.00001), (1.0, 2.5)]]], 3) == \
+        'MULTIPOLYGON (((0.123 0, 1 2.5)))'
+
+
+def test_simplify_ring_removes_collinear_vertices():
+    ring = [(0, 0), (1, 0), (2, 0), (2, 1), (2, 2), (1, 2), (0, 2), (0, 1), (0, 0)]
+    assert simplify_ring(ring, 0.01) == box(0, 0, 2, 2)
+
+
+def test_simplify_ring_keeps_vertices_outside_tolerance():
+    ring = [(0, 0), (1, 0.5), (2, 0), (2, 2), (0, 2), (0, 0)]
+    assert simplify_ring(ring, 0.1) == ring
+    assert (1, 0.5) not in simplify_ring(ring, 1)
+
+
+def test_simplify_ring_without_tolerance_or_vertices_to_spare():
+    ring = box(0, 0, 1, 1)
+    assert simplify_ring(ring, 0) is ring
+    assert simplify_ring(ring, 10) is ring
+
+
+def test_simplify_ring_never_collapses():
+    ring = [(0, 0), (1, 0.001), (2, 0), (1, -0.001), (0, 0)]
+    assert len(simplify_ring(ring, 1)) >= 4
+
+
+def test_snap_ring_drops_repeated_vertices():
+    ring = [(0, 0), (0.0001, 0), (1, 0), (1, 1), (0, 0)]
+    assert snap_ring(ring, 2) == [(0, 0), (1, 0), (1, 1), (0, 0)]
+
+
+def test_snap_ring_collapsed():
+    assert snap_ring([(0, 0), (0.001, 0), (0.001, 0.001), (0, 0)], 1) is None
+
+
+def test_split_leaves_ordinary_polygons():
+    polygons = [[box(10, 10, 20, 20)]]
+    assert split_antimeridian(polygons) == polygons
+
+
+def test_split_at_360():
+    polygons = [[[(359, 10), (1, 10), (1, 20), (359, 20), (359, 10)]]]
+    parts = split_antimeridian(polygons)
+    assert len(parts) == 2
+    xs = sorted(x for part in parts for x, _ in part[0])
+    assert min(xs) == 0 and max(xs) == 360
+    for part in parts:
+        ring_xs = [x for x, _ in part[0]]
+        assert max(ring_xs) - min(ring_xs) == 1
+
+
+def test_split_at_180():
+    polygons = [[[(170, 0), (-170, 0), (-170, 5), (170, 5), (170, 0)]]]
+    parts = split_antimeridian(polygons)
+    assert sorted((min(x for x, _ in p[0]), max(x for x, _ in p[0])) for p in parts) == \
+        [(-180, -170), (170, 180)]
+
+
+def test_split_ignores_edges_along_the_seam():
+    polygons = [[box(0, -90, 360, 90)]]
+    assert split_antimeridian(polygons) == polygons
+
+
+def test_split_ignores_edges_at_the_poles():
+    cap = [(0, 80), (90, 80), (180, 80), (270, 80), (360, 80), (360, 90), (0, 90), (0, 80)]
+    assert split_antimeridian([[cap]]) == [[cap]]
+
+
+def test_clean_footprint_does_not_split_by_default():
+    wkt = 'POLYGON ((359 10, 1 10, 1 20, 359 20, 359 10))'
+    footprint, bbox = clean_footprint(wkt)
+    assert len(parse_wkt(footprint)) == 1
+    assert bbox is not None
+
+
+def test_clean_footprint_split_has_no_bbox():
+    wkt = 'POLYGON ((359 10, 1 10, 1 20, 359 20, 359 10))'
+    footprint, bbox = clean_footprint(wkt, split=True)
+    assert len(parse_wkt(footprint)) == 2
+    assert bbox is None
+
+
+def test_clean_footprint_bbox():
+    footprint, bbox = clean_footprint('POLYGON ((10 10, 20 12, 15 20, 10 10))')
+    assert parse_wkt(bbox) == [[box(10, 10, 20, 20)]]
+
+
+def test_clean_footprint_other_geometries_unchanged():
+    assert clean_footprint('POINT (1 2)') == ('POINT (1 2)', None)
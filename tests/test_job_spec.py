@@ -0,0 +1,107 @@
+import pytest
+
+from pds_pipelines.JobSpec import JobFile, parse_job, file_entry, job_files
+
+POW = """<?xml version="1.0" encoding="UTF-8"?>
+<Job>
+  <Process>
+    <ProcessName>POW</ProcessName>
+    <instrument>CTX</instrument>
+    <stretch><StretchPercent><min>1</min><max>99</max></StretchPercent></stretch>
+  </Process>
+  <Target>
+    <TargetName>Mars</TargetName>
+    <EquatorialRadius>3396190</EquatorialRadius>
+    <PolarRadius>3376200</PolarRadius>
+    <LatitudeType>planetocentric</LatitudeType>
+    <LongitudeDirection>POSITIVEEAST</LongitudeDirection>
+    <LongitudeDomain>360</LongitudeDomain>
+  </Target>
+  <Projection>
+    <ProjName>Equirectangular</ProjName>
+    <CenterLongitude>180</CenterLongitude>
+  </Projection>
+  <extents>
+    <extentType>smart</extentType>
+    <MinLatitude>-10</MinLatitude>
+    <MaxLatitude>10</MaxLatitude>
+    <MinLongitude>200</MinLongitude>
+    <MaxLongitude>220</MaxLongitude>
+  </extents>
+  <OutputOptions><OutputResolution>100</OutputResolution></OutputOptions>
+  <OutputType><Format>GeoTiff-BigTiff</Format><BitType>8bit</BitType></OutputType>
+  <ImageUrl><url>/pds_san/a.IMG</url></ImageUrl>
+  <ImageUrl>
+    <url>/pds_san/b.IMG</url>
+    <bands><bandfilter>1</bandfilter><bandfilter>2</bandfilter><bandfilter>3</bandfilter></bands>
+  </ImageUrl>
+</Job>
+"""
+
+MAP2 = """<Job>
+  <Process><ProcessName>MAP2</ProcessName></Process>
+  <ImageList><internalpath>/pds_san/c.cub</internalpath><band>4</band></ImageList>
+</Job>
+"""
+
+
+def test_parse_pow_job():
+    spec = parse_job(POW)
+    assert spec.process == 'POW'
+    assert spec.instrument == 'CTX'
+    assert spec.url_files == (JobFile('/pds_san/a.IMG', ()),
+                              JobFile('/pds_san/b.IMG', ('1', '2', '3')))
+    assert spec.map_files == ()
+    assert spec.target_name == 'Mars'
+    assert spec.equatorial_radius == 3396190.0
+    assert spec.latitude_type == 'Planetocentric'
+    assert spec.longitude_direction == 'PositiveEast'
+    assert spec.longitude_domain == 360
+    assert spec.projection == 'Equirectangular'
+    assert spec.center_longitude == 180.0
+    assert spec.center_latitude is None
+    assert spec.range_type == 'smart'
+    assert (spec.min_lat, spec.max_lat, spec.min_lon, spec.max_lon) == (-10, 10, 200, 220)
+    assert spec.resolution == 100.0
+    assert spec.out_bit == '8bit'
+    assert spec.out_format == 'GeoTiff-BigTiff'
+    assert spec.stretch_type == 'StretchPercent'
+    assert (spec.stretch_min, spec.stretch_max) == (1.0, 99.0)
+    assert spec.output_geometry is False
+
+
+def test_parse_map2_job_defaults():
+    spec = parse_job(MAP2)
+    assert spec.process == 'MAP2'
+    assert spec.map_files == (JobFile('/pds_san/c.cub', ('4',)),)
+    assert spec.out_bit == 'input'
+    assert spec.stretch_type is None
+    assert spec.range_type is None
+    assert spec.longitude_domain is None
+
+
+@pytest.mark.parametrize('xml', [
+    '<Job><Process>',
+    '<Job><Process><ProcessName>DI</ProcessName></Process></Job>',
+    '<Job></Job>',
+    '<Job><Process><ProcessName>POW</ProcessName></Process></Job>',
+    MAP2.replace('MAP2', 'POW'),
+    POW.replace('<MinLatitude>-10', '<MinLatitude>south'),
+    POW.replace('planetocentric', 'geodetic'),
+    POW.replace('<LongitudeDomain>360', '<LongitudeDomain>360.5'),
+])
+def test_parse_malformed_jobs(xml):
+    with pytest.raises(ValueError):
+        parse_job(xml)
+
+
+def test_file_entry():
+    assert file_entry(JobFile('x.cub', ())) == 'x.cub'
+    assert file_entry(JobFile('x.cub', ('2',))) == 'x.cub+2'
+    assert file_entry(JobFile('x.cub', ('1', '2'))) == 'x.cub'
+    assert file_entry(JobFile('x.cub', ('1', '2', '3'))) == 'x.cub+1,2,3'
+
+
+def test_job_files():
+    assert job_files(parse_job(POW)) == ['/pds_san/a.IMG', '/pds_san/b.IMG+1,2,3']
+    assert job_files(parse_job(MAP2)) == ['/pds_san/c.cub+4']
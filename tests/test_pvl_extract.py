@@ -0,0 +1,127 @@
+import datetime
+
+import pvl
+import pytest
+import pytz
+
+from pds_pipelines.PVLextract import decode_value, extract
+
+CAMINFO = """Object = Caminfo
+  Group = Parameters
+    Program     = caminfo
+    IsisId      = MRO/CTX/0902557580:150
+    TargetName  = MARS
+    CenterLongitude = 216.87 <degrees>
+  End_Group
+
+  Group = Polygon
+    GisFootprint = "MULTIPOLYGON (((216.8 -4.1, 217.0 -4.1, -
+                    217.0 -3.9, 216.8 -4.1)))"
+  End_Group
+
+  Object = Geometry
+    Group = Nested
+      PixelResolution = 5.5
+    End_Group
+  End_Object
+End_Object
+End
+Ignored = 1
+"""
+
+
+def test_decode_numbers():
+    assert decode_value('42') == 42
+    assert decode_value(' -7 ') == -7
+    assert decode_value('1.5') == 1.5
+    assert decode_value('1.5E-3') == 1.5e-3
+    assert decode_value('.5') == 0.5
+
+
+def test_decode_radix():
+    assert decode_value('16#FF#') == 255
+    assert decode_value('-2#101#') == -5
+    assert decode_value('2#102#') == '2#102#'
+
+
+def test_decode_symbols():
+    assert decode_value('Null') is None
+    assert decode_value('TRUE') is True
+    assert decode_value('false') is False
+    assert decode_value('MARS') == 'MARS'
+    assert decode_value('"quoted (text)"') == 'quoted (text)'
+    assert decode_value("'single'") == 'single'
+
+
+def test_decode_dates():
+    assert decode_value('2008-01-02') == datetime.date(2008, 1, 2)
+    assert decode_value('2008-032') == datetime.date(2008, 2, 1)
+    assert decode_value('2008-01-02T03:04:05.25') == \
+        datetime.datetime(2008, 1, 2, 3, 4, 5, 250000)
+    assert decode_value('2008-01-02T03:04Z') == \
+        datetime.datetime(2008, 1, 2, 3, 4, tzinfo=pytz.utc)
+    # Not a real date, so left as text
+    assert decode_value('2008-13-40') == '2008-13-40'
+
+
+def test_decode_sequences_and_sets():
+    assert decode_value('(1, 2.5, "a, b")') == [1, 2.5, 'a, b']
+    assert decode_value('((1, 2), (3))') == [[1, 2], [3]]
+    assert decode_value('{RED, GREEN}') == set(['RED', 'GREEN'])
+    assert decode_value('()') == []
+
+
+def test_decode_units():
+    value = decode_value('5.5 <meters/pixel>')
+    assert isinstance(value, pvl.Units)
+    assert value[0] == 5.5
+    assert value[1] == 'meters/pixel'
+    assert decode_value('"<not units>"') == '<not units>'
+
+
+def test_extract_everything():
+    label = extract(CAMINFO.splitlines())
+    parameters = label['Caminfo']['Parameters']
+    assert parameters['IsisId'] == 'MRO/CTX/0902557580:150'
+    assert parameters['CenterLongitude'][0] == 216.87
+    assert label['Caminfo']['Geometry']['Nested']['PixelResolution'] == 5.5
+    assert 'Ignored' not in label
+
+
+def test_extract_joins_continued_lines():
+    label = extract(CAMINFO.splitlines())
+    assert label['Caminfo']['Polygon']['GisFootprint'] == \
+        'MULTIPOLYGON (((216.8 -4.1, 217.0 -4.1, 217.0 -3.9, 216.8 -4.1)))'
+
+
+def test_extract_joins_multiline_sequences():
+    label = extract(['Names = (A,', '  B,', '  C)', 'End'])
+    assert label['Names'] == ['A', 'B', 'C']
+
+
+def test_extract_selected_groups_and_keywords():
+    label = extract(CAMINFO.splitlines(), groups=['geometry'], keywords=['targetname'])
+    assert label['Caminfo']['Parameters'] == {'TargetName': 'MARS'}
+    assert label['Caminfo']['Polygon'] == {}
+    assert label['Caminfo']['Geometry']['Nested']['PixelResolution'] == 5.5
+
+
+def test_extract_tolerates_what_pvl_rejects():
+    label = extract(['Group = G', '  Note = a;b & c', 'End_Group', 'End'])
+    assert label['G']['Note'] == 'a;b & c'
+
+
+def test_extract_skips_comments():
+    label = extract(['/* header */', 'A = 1 /* one */', 'B = "/* kept */"', 'End'])
+    assert label == {'A': 1, 'B': '/* kept */'}
+
+
+def test_extract_later_duplicates_win():
+    assert extract(['A = 1', 'A = 2'])['A'] == 2
+
+
+def test_extract_unterminated_value():
+    with pytest.raises(ValueError):
+        extract(['A = (1, 2,', 'End'])
+    with pytest.raises(ValueError):
+        extract(['A = "open'])
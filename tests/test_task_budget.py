@@ -0,0 +1,80 @@
+import pytest
+
+from pds_pipelines import config
+from pds_pipelines import TaskBudget as task_budget
+from pds_pipelines.TaskBudget import TaskBudget, chunking
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    """ Sets config values for the test, with the others unset. """
+    for name in ('service_task_budget', 'service_file_cost', 'service_files_per_task'):
+        monkeypatch.delattr(config, name, raising=False)
+
+    def set_config(**values):
+        for name, value in values.items():
+            monkeypatch.setattr(config, name, value, raising=False)
+    return set_config
+
+
+def test_chunking_one_file_per_task_by_default(settings):
+    assert chunking(7) == (7, 1, None)
+
+
+def test_chunking_files_per_task(settings):
+    settings(service_files_per_task=3)
+    assert chunking(7) == (3, 3, task_budget.DEFAULT_TASK_BUDGET)
+    assert chunking(6) == (2, 3, task_budget.DEFAULT_TASK_BUDGET)
+
+
+def test_chunking_from_file_cost(settings):
+    settings(service_task_budget=3600, service_file_cost=600, service_files_per_task=100)
+    assert chunking(13) == (3, 6, 3600.0)
+
+
+def test_chunking_cost_over_budget(settings):
+    settings(service_task_budget=60, service_file_cost=600)
+    assert chunking(5) == (5, 1, None)
+
+
+def test_chunking_never_empty(settings):
+    settings(service_files_per_task=10)
+    assert chunking(0)[0] == 1
+    settings(service_files_per_task=0)
+    assert chunking(4) == (4, 1, None)
+
+
+def test_budget_file_limit():
+    budget = TaskBudget(files=2)
+    for _ in range(2):
+        assert budget.claim()
+        budget.done()
+    assert not budget.claim()
+    assert budget.count == 2
+
+
+def test_budget_unlimited_files():
+    budget = TaskBudget(files=0)
+    for _ in range(50):
+        assert budget.claim()
+        budget.done()
+
+
+def test_budget_leaves_time_for_the_slowest_file(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(task_budget.time, 'time', lambda: now[0])
+    budget = TaskBudget(files=0, seconds=100)
+
+    assert budget.claim()
+    now[0] += 40
+    budget.done()
+    # 40 seconds used, and the next file may take 40 more
+    assert budget.claim()
+    now[0] += 10
+    budget.done()
+    assert budget.slowest == 40
+    # 50 used; 50 + 40 still fits, 61 + 40 doesn't
+    assert budget.claim()
+    now[0] += 11
+    budget.done()
+    assert not budget.claim()
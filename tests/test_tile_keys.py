@@ -0,0 +1,76 @@
+from pds_pipelines.TileKeys import cell_id, cover, footprint_tiles, query_ranges
+
+
+def test_cell_id_interleaves_bits():
+    assert cell_id(0, 0, 0) == 0
+    assert [cell_id(ix, iy, 1) for iy in (0, 1) for ix in (0, 1)] == [0, 1, 2, 3]
+    assert cell_id(2, 0, 2) == 4
+    assert cell_id(0, 2, 2) == 8
+
+
+def test_cell_id_children_are_contiguous():
+    for ix, iy in ((0, 0), (3, 1), (5, 6)):
+        parent = cell_id(ix, iy, 3)
+        children = sorted(cell_id(2 * ix + dx, 2 * iy + dy, 4)
+                          for dx in (0, 1) for dy in (0, 1))
+        assert children == list(range(parent << 2, (parent << 2) + 4))
+
+
+def test_cover():
+    # Level 1 cells are 180 degrees by 90
+    assert cover((10, 10, 20, 20), 1) == set([cell_id(0, 1, 1)])
+    assert cover((170, -10, 190, 10), 1) == set(range(4))
+
+
+def test_cover_across_the_seam():
+    assert cover((-10, -5, 10, 5), 2) == cover((350, -5, 370, 5), 2)
+    columns = set()
+    for cell in cover((-10, -5, 10, 5), 2):
+        columns.add(cell & 1 | (cell >> 1) & 2)
+    assert columns == set([0, 3])
+
+
+def test_cover_at_the_edges():
+    assert cover((0, -90, 360, 90), 1) == set(range(4))
+    # 360 is 0, and latitude 90 is in the top row
+    assert cover((360, 90, 360, 90), 2) == set([cell_id(0, 3, 2)])
+
+
+def test_cover_limit():
+    assert cover((0, -90, 360, 90), 4, 10) is None
+    assert len(cover((0, -90, 360, 90), 1, 4)) == 4
+
+
+def test_query_ranges_whole_world():
+    assert query_ranges((0, -90, 360, 90), (4,)) == [(4, 0, 255)]
+
+
+def test_query_ranges_contain_covered_cells():
+    bbox = (10.5, 20.25, 40.75, 33.5)
+    for level, max_cells in ((4, 256), (8, 256), (12, 16)):
+        ranges = query_ranges(bbox, (level,), max_cells)
+        assert all(r[0] == level for r in ranges)
+        for cell in cover(bbox, level):
+            assert any(first <= cell <= last for _, first, last in ranges)
+
+
+def test_query_ranges_merge_adjacent_cells():
+    ranges = query_ranges((0.5, -89.5, 179.5, -0.5), (2,))
+    assert ranges == [(2, 0, 3)]
+
+
+def test_footprint_tiles_finest_level():
+    level, cells = footprint_tiles('POLYGON ((10 10, 11 10, 11 11, 10 10))', (4, 8, 12))
+    assert level == 8
+    assert cells == sorted(cover((10, 10, 11, 11), 8))
+
+
+def test_footprint_tiles_large_footprint_uses_coarsest_level():
+    level, cells = footprint_tiles('POLYGON ((0 -90, 360 -90, 360 90, 0 90, 0 -90))',
+                                   (4, 8, 12))
+    assert level == 4
+    assert len(cells) == 256
+
+
+def test_footprint_tiles_not_a_polygon():
+    assert footprint_tiles('POINT (1 2)', (4,)) == (None, [])